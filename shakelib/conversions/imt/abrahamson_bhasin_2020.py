@@ -81,22 +81,9 @@ class AbrahamsonBhasin2020(object):
             with the uncertainty propagated through the conversion.
         """
         c = self.coeff
-        m = self.mag
-        if np.any(m < 5):
-            f1 = c["a2"]
-        elif np.any(m <= 7.5):
-            f1 = c["a2"] + (c["a3"] - c["a2"]) * (m - 5.0) / 2.5
-        else:
-            f1 = c["a3"]
+        f1 = self.getF1()
 
-        pgv = (
-            c["a1"]
-            + f1 * psa
-            + c["a4"] * (m - 6.0)
-            + c["a5"] * (8.5 - m) ** 2
-            + c["a6"] * np.log(rrup + 5.0 * np.exp(0.4 * (m - 6.0)))
-            + (c["a7"] + c["a8"] * (m - 5.0)) * np.log(vs30 / 425)
-        )
+        pgv = c["a1"] + f1 * psa + self.getOffset(rrup, vs30)
 
         #
         # ShakeMap will often produce lists of stddevs that are twice
@@ -119,6 +106,56 @@ class AbrahamsonBhasin2020(object):
 
         return pgv, stddevs_out
 
+    def getF1(self):
+        """
+        Returns the (magnitude-dependent) scale factor of the SA amps in
+        the conversion to PGV.
+
+        Args:
+            None.
+
+        Returns:
+            (float): The scale factor.
+        """
+        c = self.coeff
+        m = self.mag
+        if np.any(m < 5):
+            f1 = c["a2"]
+        elif np.any(m <= 7.5):
+            f1 = c["a2"] + (c["a3"] - c["a2"]) * (m - 5.0) / 2.5
+        else:
+            f1 = c["a3"]
+        return f1
+
+    def getOffset(self, rrup, vs30):
+        """
+        Returns the magnitude, distance, and site terms of the conversion
+        to PGV, which do not depend on the SA amps. The terms are saved,
+        and returned again when called with the same rrup and vs30 arrays
+        (i.e., the same objects), so that a single instance can be shared
+        by several GMPEs evaluated at the same points.
+
+        Args:
+            rrup (np.array): Rupture distance to the points.
+            vs30 (np.array): The Vs30 value at the points.
+
+        Returns:
+            (np.array): The sum of the magnitude, distance, and site terms.
+        """
+        saved = getattr(self, "_offset", None)
+        if saved is not None and saved[0] is rrup and saved[1] is vs30:
+            return saved[2]
+        c = self.coeff
+        m = self.mag
+        offset = (
+            c["a4"] * (m - 6.0)
+            + c["a5"] * (8.5 - m) ** 2
+            + c["a6"] * np.log(rrup + 5.0 * np.exp(0.4 * (m - 6.0)))
+            + (c["a7"] + c["a8"] * (m - 5.0)) * np.log(vs30 / 425)
+        )
+        self._offset = (rrup, vs30, offset)
+        return offset
+
 
 class AbrahamsonBhasin2020PGA(AbrahamsonBhasin2020):
     """
@@ -12,6 +12,9 @@ from esi_utils_rupture.distance import get_distance
 from esi_utils_rupture.utils import _distance_sq_to_segment
 from esi_utils_vectors.vector import Vector
 
+# The largest number of (quad, site) pairs evaluated at once
+BLOCK_SIZE = 262144
+
 
 class Bayless2013(object):
     """
@@ -129,45 +132,61 @@ class Bayless2013(object):
         # Put in pseudo-hypocenters for each quad
         self.__setPseudoHypocenters()
 
-        self._fd = 0
-        for i in range(self._nq):
-            self.i = i
-
-            # Compute some genral stuff that is required for all mechanisms
-            dtypes = ["rrup", "rx", "ry0"]
-            dists = get_distance(dtypes, self._lat, self._lon, self._dep, self._rup)
-            self.__Rrup = np.reshape(dists["rrup"], self._lat.shape)
-            self.__Rx = np.reshape(dists["rx"], self._lat.shape)
-            self.__Ry = np.reshape(dists["ry0"], self._lat.shape)
-            # NOTE: use Rx and Ry to compute Az in 'computeAz'. It is probably
-            #       possible to make this a lot faster by avoiding the
-            #       calculation of these distances each time.
-
-            # Az is the NGA definition of source-to-site azimuth for a finite
-            # rupture. See Kaklamanos et al. (2011) Figure 2 for illustration.
-
-            self.__computeAz()  # uses Rx and Ry, which are for the i-th quad.
-
-            # Magnitude taper (does not depend on mechanism)
-            if self._M <= 5.0:
-                self._T_Mw = 0.0
-            elif (self._M > 5.0) and (self._M < 6.5):
-                self._T_Mw = 1.0 - (6.5 - self._M) / 1.5
-            else:
-                self._T_Mw = 1.0
+        # The along-strike and updip vectors of each quad
+        self.__setQuadVectors()
+
+        # Compute some genral stuff that is required for all mechanisms.
+        # The distances are to the whole rupture, so they are the same for
+        # all of the quads.
+        dtypes = ["rrup", "rx", "ry0"]
+        dists = get_distance(dtypes, self._lat, self._lon, self._dep, self._rup)
+        self.__Rrup = np.reshape(dists["rrup"], (-1,))
+        self.__Rx = np.reshape(dists["rx"], (-1,))
+        self.__Ry = np.reshape(dists["ry0"], (-1,))
+
+        # Az is the NGA definition of source-to-site azimuth for a finite
+        # rupture. See Kaklamanos et al. (2011) Figure 2 for illustration.
+
+        self.__computeAz()
+
+        # Magnitude taper (does not depend on mechanism)
+        if self._M <= 5.0:
+            self._T_Mw = 0.0
+        elif (self._M > 5.0) and (self._M < 6.5):
+            self._T_Mw = 1.0 - (6.5 - self._M) / 1.5
+        else:
+            self._T_Mw = 1.0
+
+        # Make a 3x(#number of sites) matrix of site locations
+        # (rows are x, y, z) in ECEF
+        site_ecef_x, site_ecef_y, site_ecef_z = ecef.latlon2ecef(
+            self._lat, self._lon, np.zeros(np.shape(self._lon))
+        )
+        site_mat = np.array(
+            [
+                np.reshape(site_ecef_x, (-1,)),
+                np.reshape(site_ecef_y, (-1,)),
+                np.reshape(site_ecef_z, (-1,)),
+            ]
+        )
 
+        # All of the quads are evaluated at once, for blocks of sites; the
+        # arrays for a block have shape (#quads, #sites in block).
+        nsites = site_mat.shape[1]
+        fd = np.zeros(nsites)
+        step = max(1, BLOCK_SIZE // self._nq)
+        for start in range(0, nsites, step):
+            ix = slice(start, start + step)
             if self.SlipCategory == "SS":
-                self.__computeSS()
-                self._fd = self._fd + self.weights[i] * self._fd_SS
+                fdq = self.__computeSS(site_mat[:, ix], ix)
 
             elif self.SlipCategory == "DS":
-                self.__computeDS()
-                self._fd = self._fd + self.weights[i] * self._fd_DS
+                fdq = self.__computeDS(site_mat[:, ix], ix)
 
             else:
                 # Compute both SS and DS
-                self.__computeSS()
-                self.__computeDS()
+                fd_SS = self.__computeSS(site_mat[:, ix], ix)
+                fd_DS = self.__computeDS(site_mat[:, ix], ix)
 
                 # Normalize rake to reference angle
                 sintheta = np.abs(np.sin(np.radians(self._rake)))
@@ -177,8 +196,10 @@ class Bayless2013(object):
                 # Compute weights:
                 DipWeight = refrake / (np.pi / 2.0)
                 StrikeWeight = 1.0 - DipWeight
-                fdcombined = StrikeWeight * self._fd_SS + DipWeight * self._fd_DS
-                self._fd = self._fd + self.weights[i] * fdcombined
+                fdq = StrikeWeight * fd_SS + DipWeight * fd_DS
+
+            fd[ix] = np.sum(self.weights.reshape((-1, 1)) * fdq, axis=0)
+        self._fd = np.reshape(fd, np.shape(self._lat))
 
     def __setPseudoHypocenters(self):
         """Set a pseudo-hypocenter.
@@ -257,66 +278,127 @@ class Bayless2013(object):
                     mag = e21.mag()
                     self.phyp[i] = p2 + e21norm * (0.5 * mag)
 
-    def __computeDS(self):
+    def __setQuadVectors(self):
+        """
+        Set the unit updip and along-strike vectors of each quad (as 3x(#quads)
+        matrices in ECEF), the updip distance from the pseudo-hypocenter to
+        the top of each quad, the pseudo-epicenters (the pseudo-hypocenters
+        at the surface), and the along-strike limits of each quad relative to
+        its pseudo-epicenter.
+        """
+        udip = [None] * self._nq
+        self._udip_len = np.zeros(self._nq)
+        epi = [None] * self._nq
+        strike = [None] * self._nq
+        self._strike_min = np.zeros(self._nq)
+        self._strike_max = np.zeros(self._nq)
+        for i, (P0, P1, P2, P3) in enumerate(self._rup.getQuadrilaterals()):
+            hyp_ecef = self.phyp[i]  # already in ECEF
+            p0 = Vector.fromPoint(P0)  # convert to ECEF
+            p1 = Vector.fromPoint(P1)
+            p2 = Vector.fromPoint(P2)
+
+            # "updip" vector
+            e21norm = (p1 - p2).norm()
+            hp1 = p1 - hyp_ecef
+            # convert to km (used as max later)
+            self._udip_len[i] = Vector.dot(hp1, e21norm) / 1000.0
+            udip[i] = [e21norm.x, e21norm.y, e21norm.z]
+
+            # Along strike vector
+            tmp = ecef.ecef2latlon(hyp_ecef.x, hyp_ecef.y, hyp_ecef.z)
+            epi_ecef = Vector.fromPoint(geo.point.Point(tmp[1], tmp[0], 0.0))
+            e01norm = (p1 - p0).norm()
+            hp0 = p0 - epi_ecef
+            hp1 = p1 - epi_ecef
+            self._strike_min[i] = Vector.dot(hp0, e01norm) / 1000.0  # km
+            self._strike_max[i] = Vector.dot(hp1, e01norm) / 1000.0  # km
+            epi[i] = [epi_ecef.x, epi_ecef.y, epi_ecef.z]
+            strike[i] = [e01norm.x, e01norm.y, e01norm.z]
+
+        self._phyp_mat = np.array([[p.x, p.y, p.z] for p in self.phyp]).T
+        self._udip_mat = np.array(udip).T
+        self._epi_mat = np.array(epi).T
+        self._strike_mat = np.array(strike).T
+
+    def __computeDS(self, site_mat, ix):
+        """
+        Compute the dip-slip fd of each quad for a block of sites.
+
+        Args:
+            site_mat (ndarray): 3x(#sites) matrix of the site locations in
+                ECEF.
+            ix (slice): The slice of the sites in the block.
+
+        Returns:
+            ndarray: (#quads)x(#sites) array of fd.
+        """
+        W = self._W.reshape((-1, 1))
+        Rrup = self.__Rrup[ix]
+
         # d is the length of dipping rupture rupturing toward site;
         # Note: max[(Y*W),exp(0)] -- just apply a min of 1?
-        self.__computeD(self.i)
+        d = self.__computeD(site_mat)
 
         # Geometric directivity predictor:
-        RxoverW = (self.__Rx / self._W[self.i]).clip(
-            min=-np.pi / 2.0, max=2.0 * np.pi / 3.0
-        )
-        f_geom = np.log(self.d) * np.cos(RxoverW)
+        RxoverW = (self.__Rx[ix] / W).clip(min=-np.pi / 2.0, max=2.0 * np.pi / 3.0)
+        f_geom = np.log(d) * np.cos(RxoverW)
 
         # Distance taper
-        T_CD = np.ones_like(self._lat)
-        ix = tuple(
-            [
-                (self.__Rrup / self._W[self.i] > 1.5)
-                & (self.__Rrup / self._W[self.i] < 2.0)
-            ]
-        )
-        T_CD[ix] = 1.0 - (self.__Rrup[ix] / self._W[self.i] - 1.5) / 0.5
-        T_CD[self.__Rrup / self._W[self.i] >= 2.0] = 0.0
+        T_CD = np.ones_like(f_geom)
+        RrupoverW = Rrup / W
+        tix = (RrupoverW > 1.5) & (RrupoverW < 2.0)
+        T_CD[tix] = 1.0 - (RrupoverW[tix] - 1.5) / 0.5
+        T_CD[RrupoverW >= 2.0] = 0.0
 
         # Azimuth taper
-        T_Az = np.sin(np.abs(self.Az)) ** 2
+        T_Az = np.sin(np.abs(self.Az[ix])) ** 2
 
         # Select Coefficients
-        ix = tuple([self._T == self.__periods])
-        C0 = self.__c0ds[ix]
-        C1 = self.__c1ds[ix]
+        cix = tuple([self._T == self.__periods])
+        C0 = self.__c0ds[cix]
+        C1 = self.__c1ds[cix]
+
+        return (C0 + C1 * f_geom) * T_CD * self._T_Mw * T_Az
+
+    def __computeSS(self, site_mat, ix):
+        """
+        Compute the strike-slip fd of each quad for a block of sites.
+
+        Args:
+            site_mat (ndarray): 3x(#sites) matrix of the site locations in
+                ECEF.
+            ix (slice): The slice of the sites in the block.
 
-        self._fd_DS = (C0 + C1 * f_geom) * T_CD * self._T_Mw * T_Az
+        Returns:
+            ndarray: (#quads)x(#sites) array of fd.
+        """
+        L = self._L.reshape((-1, 1))
+        Rrup = self.__Rrup[ix]
 
-    def __computeSS(self):
         # s is the length of striking fault rupturing toward site;
         # max[(X*L),exp(1)]
         # theta (see Figure 5 in SSGA97)
-        self.__computeThetaAndS(self.i)
+        s, theta = self.__computeThetaAndS(site_mat)
 
         # Geometric directivity predictor:
-        f_geom = np.log(self.s) * (0.5 * np.cos(2 * self.theta) + 0.5)
+        f_geom = np.log(s) * (0.5 * np.cos(2 * theta) + 0.5)
 
         # Distance taper
-        T_CD = np.ones_like(self._lat)
-        ix = tuple(
-            [
-                (self.__Rrup / self._L[self.i] > 0.5)
-                & (self.__Rrup / self._L[self.i] < 1.0)
-            ]
-        )
-        T_CD[ix] = 1 - (self.__Rrup[ix] / self._L[self.i] - 0.5) / 0.5
-        T_CD[self.__Rrup / self._L[self.i] >= 1.0] = 0.0
+        T_CD = np.ones_like(f_geom)
+        RrupoverL = Rrup / L
+        tix = (RrupoverL > 0.5) & (RrupoverL < 1.0)
+        T_CD[tix] = 1 - (RrupoverL[tix] - 0.5) / 0.5
+        T_CD[RrupoverL >= 1.0] = 0.0
 
         # Azimuth taper
         T_Az = 1.0
 
         # Select Coefficients
-        ix = tuple([self._T == self.__periods])
-        C0 = self.__c0ss[ix]
-        C1 = self.__c1ss[ix]
-        self._fd_SS = (C0 + C1 * f_geom) * T_CD * self._T_Mw * T_Az
+        cix = tuple([self._T == self.__periods])
+        C0 = self.__c0ss[cix]
+        C1 = self.__c1ss[cix]
+        return (C0 + C1 * f_geom) * T_CD * self._T_Mw * T_Az
 
     def __computeAz(self):
         Az = np.ones_like(self.__Rx) * np.pi / 2.0
@@ -325,105 +407,43 @@ class Bayless2013(object):
         Az[ix] = np.arctan(self.__Rx[ix] / self.__Ry[ix])
         self.Az = Az
 
-    def __computeD(self, i):
-        """Compute d for the i-th quad/segment.
+    def __computeD(self, site_mat):
+        """Compute d for each quad/segment.
 
         Y = d/W, where d is the portion (in km) of the width of the fault which
         ruptures up-dip from the hypocenter to the top of the fault.
 
         Args:
-            i (int): index of segment for which d is to be computed.
-        """
-        hyp_ecef = self.phyp[i]  # already in ECEF
-        hyp_col = np.array([[hyp_ecef.x], [hyp_ecef.y], [hyp_ecef.z]])
-
-        # First compute "updip" vector
-        P0, P1, P2 = self._rup.getQuadrilaterals()[i][0:3]
-        p1 = Vector.fromPoint(P1)  # convert to ECEF
-        p2 = Vector.fromPoint(P2)
-        e21 = p1 - p2
-        e21norm = e21.norm()
-        hp1 = p1 - hyp_ecef
-        # convert to km (used as max later)
-        udip_len = Vector.dot(hp1, e21norm) / 1000.0
-        udip_col = np.array([[e21norm.x], [e21norm.y], [e21norm.z]])  # ECEF coords
-
-        # Sites
-        slat = self._lat
-        slon = self._lon
-
-        # Convert sites to ECEF:
-        site_ecef_x = np.ones_like(slat)
-        site_ecef_y = np.ones_like(slat)
-        site_ecef_z = np.ones_like(slat)
+            site_mat (ndarray): 3x(#sites) matrix of the site locations in
+                ECEF.
 
-        # Make a 3x(#number of sites) matrix of site locations
-        # (rows are x, y, z) in ECEF
-        site_ecef_x, site_ecef_y, site_ecef_z = ecef.latlon2ecef(
-            slat, slon, np.zeros(slon.shape)
-        )
-        site_mat = np.array(
-            [
-                np.reshape(site_ecef_x, (-1,)),
-                np.reshape(site_ecef_y, (-1,)),
-                np.reshape(site_ecef_z, (-1,)),
-            ]
-        )
-
-        # Hypocenter-to-site matrix
-        h2s_mat = site_mat - hyp_col  # in ECEF
+        Returns:
+            ndarray: (#quads)x(#sites) array of d.
+        """
+        # Hypocenter-to-site matrices (3x(#quads)x(#sites))
+        h2s_mat = site_mat[:, np.newaxis, :] - self._phyp_mat[:, :, np.newaxis]
 
         # Dot hypocenter-to-site with updip vector
-        d_raw = np.abs(np.sum(h2s_mat * udip_col, axis=0)) / 1000.0  # convert to km
-        d_raw = np.reshape(d_raw, self._lat.shape)
-        self.d = d_raw.clip(min=1.0, max=udip_len)
+        # (convert to km)
+        udip_col = self._udip_mat[:, :, np.newaxis]
+        d_raw = np.abs(np.sum(h2s_mat * udip_col, axis=0)) / 1000.0
+        return d_raw.clip(min=1.0, max=self._udip_len.reshape((-1, 1)))
 
-    def __computeThetaAndS(self, i):
+    def __computeThetaAndS(self, site_mat):
         """
+        Compute s and theta for each quad/segment.
+
         Args:
-            i (int): Compute d for the i-th quad/segment.
-        """
-        # self.phyp is in ECEF
-        tmp = ecef.ecef2latlon(self.phyp[i].x, self.phyp[i].y, self.phyp[i].z)
-        epi_ecef = Vector.fromPoint(geo.point.Point(tmp[1], tmp[0], 0.0))
-        epi_col = np.array([[epi_ecef.x], [epi_ecef.y], [epi_ecef.z]])
-
-        # First compute along strike vector
-        P0, P1, P2, P3 = self._rup.getQuadrilaterals()[i]
-        p0 = Vector.fromPoint(P0)  # convert to ECEF
-        p1 = Vector.fromPoint(P1)
-        e01 = p1 - p0
-        e01norm = e01.norm()
-        hp0 = p0 - epi_ecef
-        hp1 = p1 - epi_ecef
-        strike_min = Vector.dot(hp0, e01norm) / 1000.0  # convert to km
-        strike_max = Vector.dot(hp1, e01norm) / 1000.0  # convert to km
-        strike_col = np.array([[e01norm.x], [e01norm.y], [e01norm.z]])  # ECEF coords
-
-        # Sites
-        slat = self._lat
-        slon = self._lon
-
-        # Convert sites to ECEF:
-        site_ecef_x = np.ones_like(slat)
-        site_ecef_y = np.ones_like(slat)
-        site_ecef_z = np.ones_like(slat)
+            site_mat (ndarray): 3x(#sites) matrix of the site locations in
+                ECEF.
 
-        # Make a 3x(#number of sites) matrix of site locations
-        # (rows are x, y, z) in ECEF
-        site_ecef_x, site_ecef_y, site_ecef_z = ecef.latlon2ecef(
-            slat, slon, np.zeros(slon.shape)
-        )
-        site_mat = np.array(
-            [
-                np.reshape(site_ecef_x, (-1,)),
-                np.reshape(site_ecef_y, (-1,)),
-                np.reshape(site_ecef_z, (-1,)),
-            ]
-        )
+        Returns:
+            tuple: (#quads)x(#sites) arrays of s and theta.
+        """
+        strike_col = self._strike_mat[:, :, np.newaxis]
 
-        # Epicenter-to-site matrix
-        e2s_mat = site_mat - epi_col  # in ECEF
+        # Epicenter-to-site matrices (3x(#quads)x(#sites))
+        e2s_mat = site_mat[:, np.newaxis, :] - self._epi_mat[:, :, np.newaxis]
         mag = np.sqrt(np.sum(e2s_mat * e2s_mat, axis=0))
 
         # Avoid division by zero
@@ -432,10 +452,12 @@ class Bayless2013(object):
 
         # Dot epicenter-to-site with along-strike vector
         s_raw = np.sum(e2s_mat * strike_col, axis=0) / 1000.0  # conver to km
-
-        # Put back into a 2d array
-        s_raw = np.reshape(s_raw, self._lat.shape)
-        self.s = np.abs(s_raw.clip(min=strike_min, max=strike_max)).clip(min=np.exp(1))
+        s = np.abs(
+            s_raw.clip(
+                min=self._strike_min.reshape((-1, 1)),
+                max=self._strike_max.reshape((-1, 1)),
+            )
+        ).clip(min=np.exp(1))
 
         # Compute theta
         sdots = np.sum(e2s_norm * strike_col, axis=0)
@@ -446,7 +468,7 @@ class Bayless2013(object):
         sintheta = np.abs(np.sin(theta_raw))
         costheta = np.abs(np.cos(theta_raw))
         theta = np.arctan2(sintheta, costheta)
-        self.theta = np.reshape(theta, self._lat.shape)
+        return s, theta
 
     def getFd(self):
         """
@@ -58,6 +58,247 @@ from esi_utils_vectors.ecef import ecef2latlon, latlon2ecef
 from esi_utils_vectors.vector import Vector
 from openquake.hazardlib.geo.utils import OrthographicProjection
 
+# The largest number of (site, subrupture) pairs for which the dot
+# products of xi' are held in memory at once.
+XI_PRIME_BLOCK_SIZE = 32768
+
+
+class RuptureGeometry(object):
+    """
+    The parts of the Rowshandel (2013) model that depend on the origin and
+    rupture but not on the sites: the subrupture mesh of the rupture with
+    the unit propagation and slip vectors of the subruptures, the top edge
+    of the rupture, Wrup, and the centering term. An instance may be shared
+    by any number of Rowshandel2013 instances for the same origin and
+    rupture (e.g., the output grid and each set of stations), so these are
+    computed only once.
+    """
+
+    def __init__(self, origin, rup, dx):
+        """
+        Constructor for RuptureGeometry.
+
+        Args:
+            origin: Origin instance.
+            rup: Rupture instance.
+            dx (float): Target mesh spacing for subruptures in km. The mesh
+                snaps to the edges of the quadrilaterals so the actual mesh
+                spacing will not equal this exactly; spacing in x and y will
+                not be equal.
+        """
+        self._origin = origin
+        self._rup = rup
+        self._hyp = origin.getHypo()
+        self._rake = origin.rake
+        self._dx = dx
+
+        self.__computeWrup()
+        self.__computeSubruptures()
+        self.__computeTopEdge()
+        self.__getCenteringTerm()
+
+    def getOrigin(self):
+        """
+        Returns:
+            The Origin instance.
+        """
+        return self._origin
+
+    def getRupture(self):
+        """
+        Returns:
+            The Rupture instance.
+        """
+        return self._rup
+
+    def getDx(self):
+        """
+        Returns:
+            float: The target mesh spacing for subruptures in km.
+        """
+        return self._dx
+
+    def getWrup(self):
+        """
+        Returns:
+            float: The portion (in km) of the width of the rupture which
+            ruptures up-dip from the hypocenter to the top of the rupture.
+        """
+        return self._Wrup
+
+    def getCenteringTerm(self):
+        """
+        Returns:
+            float: The centering term (Xic) of xi'.
+        """
+        return self._xi_c
+
+    def getSubruptures(self):
+        """
+        Returns:
+            tuple: The 3x(n subruptures) arrays of the center points of the
+            subruptures of all of the quadrilaterals, and of the unit
+            propagation and slip vectors of the subruptures. The center
+            points are in ECEF coordinates relative to the hypocenter.
+        """
+        return self._cp_mat, self._pmat, self._smat
+
+    def getHypoECEF(self):
+        """
+        Returns:
+            ndarray: The hypocenter in ECEF coordinates as a 3x1 array.
+        """
+        return self._hyp_ecef
+
+    def getTopEdge(self):
+        """
+        Returns:
+            tuple: The latitudes and longitudes of the end points of the top
+            edges of the quadrilaterals.
+        """
+        return self._top_lat, self._top_lon
+
+    def __computeWrup(self):
+        """
+        Compute the the portion (in km) of the width of the rupture which
+        ruptures up-dip from the hypocenter to the top of the rupture.
+
+        Wrup is the portion (in km) of the width of the rupture which
+        ruptures up-dip from the hypocenter to the top of the rupture.
+
+        * This is ambiguous for ruptures with varible top of rupture (not
+          allowed in NGA). For now, lets just compute this for the
+          quad where the hypocenter is located.
+        * Alternative is to compute max Wrup for the different quads.
+
+        """
+        nquad = len(self._rup.getQuadrilaterals())
+
+        # ---------------------------------------------------------------------
+        # First find which quad the hypocenter is on
+        # ---------------------------------------------------------------------
+
+        x, y, z = latlon2ecef(self._hyp.latitude, self._hyp.longitude, self._hyp.depth)
+        hyp_ecef = np.array([[x, y, z]])
+        qdist = np.zeros(nquad)
+        for i in range(0, nquad):
+            qdist[i] = utils._quad_distance(self._rup.getQuadrilaterals()[i], hyp_ecef)
+        ind = int(np.where(qdist == np.min(qdist))[0][0])
+        # *** check that this doesn't break with more than one quad
+        q = self._rup.getQuadrilaterals()[ind]
+
+        # ---------------------------------------------------------------------
+        # Compute Wrup on that quad
+        # ---------------------------------------------------------------------
+
+        pp0 = Vector.fromPoint(
+            geo.point.Point(q[0].longitude, q[0].latitude, q[0].depth)
+        )
+        hyp_ecef = Vector.fromPoint(
+            geo.point.Point(self._hyp.longitude, self._hyp.latitude, self._hyp.depth)
+        )
+        hp0 = hyp_ecef - pp0
+        ddv = utils.get_quad_down_dip_vector(q)
+        self._Wrup = Vector.dot(ddv, hp0) / 1000
+
+    def __computeSubruptures(self):
+        """
+        Computes the center points and the unit propagation and slip vectors
+        of the subruptures of all of the quadrilaterals.
+        """
+        hypo_ecef = Vector.fromPoint(
+            geo.point.Point(self._hyp.longitude, self._hyp.latitude, self._hyp.depth)
+        )
+        hypcol = np.array([[hypo_ecef.x], [hypo_ecef.y], [hypo_ecef.z]])
+
+        cp_list = []
+        pmat_list = []
+        smat_list = []
+        for q in self._rup.getQuadrilaterals():
+            # Quad mesh (ECEF coords)
+            mesh = utils.get_quad_mesh(q, self._dx)
+
+            # Rupture plane normal vector (ECEF coords)
+            rpnv = utils.get_quad_normal(q)
+            rpnvcol = np.array([[rpnv.x], [rpnv.y], [rpnv.z]])
+
+            cp_mat = np.array(
+                [
+                    np.reshape(mesh["cpx"], (-1,)),
+                    np.reshape(mesh["cpy"], (-1,)),
+                    np.reshape(mesh["cpz"], (-1,)),
+                ]
+            )
+
+            # Compute matrix of p vectors
+            pmat = cp_mat - hypcol
+
+            # Project pmat onto quad
+            ndotp = np.sum(pmat * rpnvcol, axis=0)
+            pmat = pmat - ndotp * rpnvcol
+
+            mag = np.sqrt(np.sum(pmat * pmat, axis=0))
+            pmatnorm = pmat / mag  # like r1
+
+            # According to Rowshandel:
+            #   "The choice of the +/- sign in the above equations
+            #    depends on the (along-the-strike and across-the-dip)
+            #    location of the rupturing sub-fault relative to the
+            #    location of the hypocenter."
+            # and:
+            #   "for the along the strike component of the slip unit
+            #    vector, the choice of the sign should result in the
+            #    slip unit vector (s) being exactly the same as  the
+            #    rupture unit vector (p) for a pure strike-slip case"
+
+            # Strike slip and dip slip components of unit slip vector
+            # (ECEF coords)
+            ds_mat, ss_mat = _get_quad_slip_ds_ss(q, self._rake, cp_mat, pmatnorm)
+
+            slpmat = ds_mat + ss_mat
+            mag = np.sqrt(np.sum(slpmat * slpmat, axis=0))
+            slpmatnorm = slpmat / mag
+
+            # The center points are kept relative to the hypocenter so that
+            # the site to subrupture distances can be computed accurately
+            # from dot products (see _get_xi_prime_sums)
+            cp_list.append(cp_mat - hypcol)
+            pmat_list.append(pmatnorm)
+            smat_list.append(slpmatnorm)
+
+        # The sums of xi' are over the subruptures of all of the quads, so
+        # they are kept together
+        self._hyp_ecef = hypcol
+        self._cp_mat = np.hstack(cp_list)
+        self._pmat = np.hstack(pmat_list)
+        self._smat = np.hstack(smat_list)
+
+    def __computeTopEdge(self):
+        """
+        Gets the end points of the top edges of the quadrilaterals.
+        """
+        qds = self._rup.getQuadrilaterals()
+        self._top_lat = np.array(
+            [lat for q in qds for lat in (q[0].latitude, q[1].latitude)]
+        )
+        self._top_lon = np.array(
+            [lon for q in qds for lon in (q[0].longitude, q[1].longitude)]
+        )
+
+    def __getCenteringTerm(self):
+        L = self._rup.getLength()
+        CSSLP = -0.32 + 0.15 * np.log(L)
+        CTRST = -0.20 + 0.09 * np.log(L)
+        CNRML = -0.20 + 0.08 * np.log(L)
+        if self._rake > 0:
+            act = (CSSLP - CTRST) / 2
+            cct = (CSSLP + CTRST) / 2
+            self._xi_c = act * np.cos(2 * np.radians(self._rake)) + cct
+        else:
+            act = (CSSLP - CNRML) / 2
+            cct = (CSSLP + CNRML) / 2
+            self._xi_c = act * np.cos(2 * np.radians(self._rake)) + cct
+
 
 class Rowshandel2013(object):
 
@@ -78,6 +319,8 @@ class Rowshandel2013(object):
         mtype=1,
         simpleDT=False,
         centered=True,
+        geometry=None,
+        taper_cutoff=False,
     ):
         """
         Constructor for rowshandel2013.
@@ -102,6 +345,13 @@ class Rowshandel2013(object):
             simpleDT (bool): Should the simpler DT equation be used? Usually
                 False.
             centered (bool): Should the centered directivity parameter be used?
+            geometry (RuptureGeometry): The precomputed rupture geometry of
+                origin and rup with the mesh spacing dx; if None, it is
+                computed.
+            taper_cutoff (bool): Should xi' and LD only be computed at the
+                sites closer to the rupture than the distance at which DT
+                goes to zero for all of the periods? Fd is zero at the other
+                sites, where xi' and LD are NaN.
         """
         self._origin = origin
         self._rup = rup
@@ -124,12 +374,23 @@ class Rowshandel2013(object):
         self._mtype = mtype
         self._simpleDT = simpleDT
         self._centered = centered
+        if geometry is None:
+            geometry = RuptureGeometry(origin, rup, dx)
+        elif geometry.getRupture() is not rup or geometry.getDx() != dx:
+            raise ValueError("geometry must be computed for rup with spacing dx.")
+        self._geometry = geometry
 
         # Period independent parameters
-        self.__computeWrup()
+        self._Wrup = geometry.getWrup()
+        self._xi_c = geometry.getCenteringTerm()
+        self.__computeRrup()
+        if taper_cutoff:
+            R2 = max(self.__getTaperDistances(period)[1] for period in self._T)
+            self._in_taper = np.reshape(self._Rrup < R2, self._lat.shape)
+        else:
+            self._in_taper = None
         self.__computeLD()
         self.__computeXiPrime()
-        self.__getCenteringTerm()
 
         self.__computeFd()
 
@@ -145,6 +406,8 @@ class Rowshandel2013(object):
         mtype=1,
         simpleDT=False,
         centered=True,
+        geometry=None,
+        taper_cutoff=False,
     ):
         """Construct a rowshandel2013 instance from a sites instance.
 
@@ -171,6 +434,10 @@ class Rowshandel2013(object):
                 False.
             centered: Boolean; should the centered directivity parameter be
                 used
+            geometry: RuptureGeometry instance for origin and rup with the
+                mesh spacing dx, or None.
+            taper_cutoff: Boolean; should xi' and LD only be computed where
+                DT is nonzero for at least one period?
 
         Returns:
             Rowshandel2013 directivity class.
@@ -187,9 +454,29 @@ class Rowshandel2013(object):
         lon, lat = np.meshgrid(lons, lats)
         dep = np.zeros_like(lon)
         return cls(
-            origin, rup, lat, lon, dep, dx, T, a_weight, mtype, simpleDT, centered
+            origin,
+            rup,
+            lat,
+            lon,
+            dep,
+            dx,
+            T,
+            a_weight,
+            mtype,
+            simpleDT,
+            centered,
+            geometry,
+            taper_cutoff,
         )
 
+    def getGeometry(self):
+        """
+        Returns:
+            RuptureGeometry: The rupture geometry, which may be given to
+            other instances for the same origin and rupture.
+        """
+        return self._geometry
+
     def getFd(self):
         """
         :returns:
@@ -260,180 +547,39 @@ class Rowshandel2013(object):
                 self._fd[i] = (
                     (c1sel * self._xi_prime + c2sel) * self._LD * self._DT * self._WP
                 )
-
-    def __computeWrup(self):
-        """
-        Compute the the portion (in km) of the width of the rupture which
-        ruptures up-dip from the hypocenter to the top of the rupture.
-
-        Wrup is the portion (in km) of the width of the rupture which
-        ruptures up-dip from the hypocenter to the top of the rupture.
-
-        * This is ambiguous for ruptures with varible top of rupture (not
-          allowed in NGA). For now, lets just compute this for the
-          quad where the hypocenter is located.
-        * Alternative is to compute max Wrup for the different quads.
-
-        """
-        nquad = len(self._rup.getQuadrilaterals())
-
-        # ---------------------------------------------------------------------
-        # First find which quad the hypocenter is on
-        # ---------------------------------------------------------------------
-
-        x, y, z = latlon2ecef(self._hyp.latitude, self._hyp.longitude, self._hyp.depth)
-        hyp_ecef = np.array([[x, y, z]])
-        qdist = np.zeros(nquad)
-        for i in range(0, nquad):
-            qdist[i] = utils._quad_distance(self._rup.getQuadrilaterals()[i], hyp_ecef)
-        ind = int(np.where(qdist == np.min(qdist))[0][0])
-        # *** check that this doesn't break with more than one quad
-        q = self._rup.getQuadrilaterals()[ind]
-
-        # ---------------------------------------------------------------------
-        # Compute Wrup on that quad
-        # ---------------------------------------------------------------------
-
-        pp0 = Vector.fromPoint(
-            geo.point.Point(q[0].longitude, q[0].latitude, q[0].depth)
-        )
-        hyp_ecef = Vector.fromPoint(
-            geo.point.Point(self._hyp.longitude, self._hyp.latitude, self._hyp.depth)
-        )
-        hp0 = hyp_ecef - pp0
-        ddv = utils.get_quad_down_dip_vector(q)
-        self._Wrup = Vector.dot(ddv, hp0) / 1000
+            if self._in_taper is not None:
+                self._fd[i][~self._in_taper] = 0
 
     def __computeXiPrime(self):
         """
         Computes the xi' value.
         """
-        hypo_ecef = Vector.fromPoint(
-            geo.point.Point(self._hyp.longitude, self._hyp.latitude, self._hyp.depth)
-        )
-
-        slat = self._lat
-        slon = self._lon
-
-        # Convert site to ECEF:
-        site_ecef_x = np.ones_like(slat)
-        site_ecef_y = np.ones_like(slat)
-        site_ecef_z = np.ones_like(slat)
+        slat, slon = self.__getSites()
 
         # Make a 3x(#number of sites) matrix of site locations
-        # (rows are x, y, z) in ECEF
+        # (rows are x, y, z) in ECEF, relative to the hypocenter
         site_ecef_x, site_ecef_y, site_ecef_z = latlon2ecef(
             slat, slon, np.zeros(slon.shape)
         )
-        site_mat = np.array(
-            [
-                np.reshape(site_ecef_x, (-1,)),
-                np.reshape(site_ecef_y, (-1,)),
-                np.reshape(site_ecef_z, (-1,)),
-            ]
-        )
-
-        xi_prime_unscaled = np.zeros_like(slat)
-
-        # Normalize by total number of subruptures. For mtype == 1, the number
-        # of subruptures will vary with site and be different for xi_s and
-        # xi_p, so keep two variables and sum them for each quad.
-        nsubs = np.zeros(np.product(slat.shape))
-        nsubp = np.zeros(np.product(slat.shape))
-
-        xi_prime_s = np.zeros(np.product(slat.shape))
-        xi_prime_p = np.zeros(np.product(slat.shape))
-
-        for k in range(len(self._rup.getQuadrilaterals())):
-            # Select a quad
-            q = self._rup.getQuadrilaterals()[k]
-
-            # Quad mesh (ECEF coords)
-            mesh = utils.get_quad_mesh(q, self._dx)
-
-            # Rupture plane normal vector (ECEF coords)
-            rpnv = utils.get_quad_normal(q)
-            rpnvcol = np.array([[rpnv.x], [rpnv.y], [rpnv.z]])
-
-            cp_mat = np.array(
+        site_mat = (
+            np.array(
                 [
-                    np.reshape(mesh["cpx"], (-1,)),
-                    np.reshape(mesh["cpy"], (-1,)),
-                    np.reshape(mesh["cpz"], (-1,)),
+                    np.reshape(site_ecef_x, (-1,)),
+                    np.reshape(site_ecef_y, (-1,)),
+                    np.reshape(site_ecef_z, (-1,)),
                 ]
             )
+            - self._geometry.getHypoECEF()
+        )
 
-            # Compute matrix of p vectors
-            hypcol = np.array([[hypo_ecef.x], [hypo_ecef.y], [hypo_ecef.z]])
-            pmat = cp_mat - hypcol
-
-            # Project pmat onto quad
-            ndotp = np.sum(pmat * rpnvcol, axis=0)
-            pmat = pmat - ndotp * rpnvcol
-
-            mag = np.sqrt(np.sum(pmat * pmat, axis=0))
-            pmatnorm = pmat / mag  # like r1
-
-            # According to Rowshandel:
-            #   "The choice of the +/- sign in the above equations
-            #    depends on the (along-the-strike and across-the-dip)
-            #    location of the rupturing sub-fault relative to the
-            #    location of the hypocenter."
-            # and:
-            #   "for the along the strike component of the slip unit
-            #    vector, the choice of the sign should result in the
-            #    slip unit vector (s) being exactly the same as  the
-            #    rupture unit vector (p) for a pure strike-slip case"
-
-            # Strike slip and dip slip components of unit slip vector
-            # (ECEF coords)
-            ds_mat, ss_mat = _get_quad_slip_ds_ss(q, self._rake, cp_mat, pmatnorm)
-
-            slpmat = ds_mat + ss_mat
-            mag = np.sqrt(np.sum(slpmat * slpmat, axis=0))
-            slpmatnorm = slpmat / mag
-
-            # Loop over sites
-            for i in range(site_mat.shape[1]):
-                sitecol = np.array(
-                    [[site_mat[0, i]], [site_mat[1, i]], [site_mat[2, i]]]
-                )
-
-                qmat = sitecol - cp_mat  # 3x(ni*nj), like r2
-                mag = np.sqrt(np.sum(qmat * qmat, axis=0))
-                qmatnorm = qmat / mag
-
-                # Propagation dot product
-                pdotqraw = np.sum(pmatnorm * qmatnorm, axis=0)
-
-                # Slip vector dot product
-                sdotqraw = np.sum(slpmatnorm * qmatnorm, axis=0)
-
-                if self._mtype == 1:
-                    # Only sum over (+) directivity effect subruptures
-
-                    # xi_p_prime
-                    pdotq = pdotqraw.clip(min=0)
-                    nsubp[i] = nsubp[i] + np.sum(pdotq > 0)
-
-                    # xi_s_prime
-                    sdotq = sdotqraw.clip(min=0)
-                    nsubs[i] = nsubs[i] + np.sum(sdotq > 0)
-
-                elif self._mtype == 2:
-                    # Sum over contributing subruptures
-
-                    # xi_p_prime
-                    pdotq = pdotqraw
-                    nsubp[i] = nsubp[i] + cp_mat.shape[1]
-
-                    # xi_s_prime
-                    sdotq = sdotqraw
-                    nsubs[i] = nsubs[i] + cp_mat.shape[1]
-
-                # Normalize by n sub ruptures later
-                xi_prime_s[i] = xi_prime_s[i] + np.sum(sdotq)
-                xi_prime_p[i] = xi_prime_p[i] + np.sum(pdotq)
+        # Sum the dot products over the subruptures of all of the quads.
+        # For mtype == 1, the number of subruptures will vary with site and
+        # be different for xi_s and xi_p, so they are normalized by their
+        # own counts.
+        cp_mat, pmat, smat = self._geometry.getSubruptures()
+        xi_prime_p, xi_prime_s, nsubp, nsubs = _get_xi_prime_sums(
+            site_mat, cp_mat, pmat, smat, self._mtype
+        )
 
         # Apply a water level to nsubp and nsubs to avoid division by
         # zero. This should only occur when the numerator is also zero
@@ -441,14 +587,13 @@ class Rowshandel2013(object):
         nsubs = np.maximum(nsubs, 1)
         nsubp = np.maximum(nsubp, 1)
 
-        # We are outside the 'k' loop over nquads.
         # o Normalize xi_prime_s and xi_prime_p
         # o Reshape them
         # o Add them together with the 'a' weights
         xi_prime_tmp = (self._a_weight) * (xi_prime_s / nsubs) + (
             1 - self._a_weight
         ) * (xi_prime_p / nsubp)
-        xi_prime_unscaled = xi_prime_unscaled + np.reshape(xi_prime_tmp, slat.shape)
+        xi_prime_unscaled = self.__toSiteShape(xi_prime_tmp)
 
         # Scale so that xi_prime has range (0, 1)
         if self._mtype == 1:
@@ -473,88 +618,85 @@ class Rowshandel2013(object):
         epi_x, epi_y = proj(self._hyp.longitude, self._hyp.latitude)
 
         # Get the lines for the top edge of the rupture
-        qds = self._rup.getQuadrilaterals()
-        nq = len(qds)
-        top_lat = np.array([[]])
-        top_lon = np.array([[]])
-        top_dep = np.array([[]])
-        for j in range(0, nq):
-            top_lat = np.append(top_lat, qds[j][0].latitude)
-            top_lat = np.append(top_lat, qds[j][1].latitude)
-            top_lon = np.append(top_lon, qds[j][0].longitude)
-            top_lon = np.append(top_lon, qds[j][1].longitude)
-            top_dep = np.append(top_dep, qds[j][0].depth)
-            top_dep = np.append(top_dep, qds[j][1].depth)
+        top_lat, top_lon = self._geometry.getTopEdge()
         top_x, top_y = proj(top_lon, top_lat)
 
+        # ---------------------------------------------------------------------
+        # Compute Ls
+        # ---------------------------------------------------------------------
+        # Convert to local orthographic
+        slat, slon = self.__getSites()
+        site_x, site_y = proj(slon, slat)
+
+        # Shift so center is at epicenter
+        Ls = _get_ls(site_x - epi_x, site_y - epi_y, top_x - epi_x, top_y - epi_y)
+
+        # ---------------------------------------------------------------------
+        # Compute LD
+        # ---------------------------------------------------------------------
         Lrup_max = 400
-        slat = self._lat
-        slon = self._lon
-        LD = np.zeros_like(slat)
-        Ls = np.zeros_like(slat)
-
-        ni, nj = LD.shape
-        for i in range(ni):
-            for j in range(nj):
-                # -------------------------------------------------------------
-                # Compute Ls
-                # -------------------------------------------------------------
-                # Convert to local orthographic
-                site_x, site_y = proj(slon[i, j], slat[i, j])
-
-                # Shift so center is at epicenter
-                site_x2 = site_x - epi_x
-                site_y2 = site_y - epi_y
-                top_x2 = top_x - epi_x
-                top_y2 = top_y - epi_y
-
-                # Angle to rotate to put site on x-axis
-                alpha = np.arctan2(site_y2, site_x2)
-                axis = [0, 0, 1]
-                rmat = _rotation_matrix(axis, -alpha)
-                llr = [None] * len(top_lat)
-
-                # Apply rotation to each point on trace
-                for k in range(len(top_lat)):
-                    llr[k] = np.dot(rmat, [top_x2[k], top_y2[k], 0])
-                    site3 = np.dot(rmat, [site_x2, site_y2, 0])
-                Li = np.min([np.max([a[0] for a in llr]), site3[0]])
-
-                # -------------------------------------------------------------
-                # Compute LD and save results into matrices
-                # -------------------------------------------------------------
-
-                Lrup = np.sqrt(Li * Li + self._Wrup * self._Wrup)
-                LD[i, j] = np.log(Lrup) / np.log(Lrup_max)
-                Ls[i, j] = Li
-        self._LD = LD
-        self._Ls = Ls
+        Lrup = np.sqrt(Ls * Ls + self._Wrup * self._Wrup)
+        LD = np.log(Lrup) / np.log(Lrup_max)
+        self._LD = self.__toSiteShape(LD)
+        self._Ls = self.__toSiteShape(Ls)
 
-    def __computeDT(self, period):
+    def __getSites(self):
         """
-        Computes DT -- the distance taper term.
+        Returns the flattened latitudes and longitudes of the sites at which
+        xi' and LD are computed.
+        """
+        if self._in_taper is None:
+            return np.reshape(self._lat, (-1,)), np.reshape(self._lon, (-1,))
+        return self._lat[self._in_taper], self._lon[self._in_taper]
+
+    def __toSiteShape(self, values):
+        """
+        Returns the values at the sites from __getSites() as an array with
+        the shape of the sites (NaN at the other sites).
+        """
+        if self._in_taper is None:
+            return np.reshape(values, self._lat.shape)
+        result = np.full(self._lat.shape, np.nan)
+        result[self._in_taper] = values
+        return result
+
+    def __computeRrup(self):
+        """
+        Computes Rrup for the distance taper (it does not depend on the
+        period).
         """
         slat = self._lat
         slon = self._lon
         site_z = np.zeros_like(slat)
         ddict = get_distance("rrup", slat, slon, site_z, self._rup)
-        Rrup = np.reshape(ddict["rrup"], (-1,))
+        self._Rrup = np.reshape(ddict["rrup"], (-1,))
+
+    def __getTaperDistances(self, period):
+        """
+        Returns the distances (km) R1 and R2 of the distance taper: DT
+        decreases from one at R1 to zero at R2.
+        """
+        if self._simpleDT:  # eqn 3.10
+            return 35, 70
+        # eqn 3.9
+        if period >= 1:
+            return 20 + 10 * np.log(period), 2 * (20 + 10 * np.log(period))
+        return 20, 40
+
+    def __computeDT(self, period):
+        """
+        Computes DT -- the distance taper term.
+        """
+        Rrup = self._Rrup
         nsite = len(Rrup)
+        R1, R2 = self.__getTaperDistances(period)
 
         if self._simpleDT:  # eqn 3.10
-            R1 = 35
-            R2 = 70
             DT = np.ones(nsite)
             ix = tuple([(Rrup > R1) & (Rrup < R2)])
             DT[ix] = 2 - Rrup[ix] / R1
             DT[Rrup >= R2] = 0
         else:  # eqn 3.9
-            if period >= 1:
-                R1 = 20 + 10 * np.log(period)
-                R2 = 2 * (20 + 10 * np.log(period))
-            else:
-                R1 = 20
-                R2 = 40
             DT = np.ones(nsite)
             # As written in report:
             # DT[(Rrup > R1) & (Rrup < R2)] = \
@@ -564,23 +706,9 @@ class Rowshandel2013(object):
             # Note: it is not clear if the above modification is 'correct'
             #       but it gives results that make more sense
             DT[Rrup >= R2] = 0
-        DT = np.reshape(DT, slat.shape)
+        DT = np.reshape(DT, self._lat.shape)
         self._DT = DT
 
-    def __getCenteringTerm(self):
-        L = self._rup.getLength()
-        CSSLP = -0.32 + 0.15 * np.log(L)
-        CTRST = -0.20 + 0.09 * np.log(L)
-        CNRML = -0.20 + 0.08 * np.log(L)
-        if self._rake > 0:
-            act = (CSSLP - CTRST) / 2
-            cct = (CSSLP + CTRST) / 2
-            self._xi_c = act * np.cos(2 * np.radians(self._rake)) + cct
-        else:
-            act = (CSSLP - CNRML) / 2
-            cct = (CSSLP + CNRML) / 2
-            self._xi_c = act * np.cos(2 * np.radians(self._rake)) + cct
-
     def __computeWP(self, period):
         """
         Computes WP -- the narrow-band multiplier.
@@ -761,24 +889,120 @@ def _get_quad_slip_ds_ss(q, rake, cp, p):
     return d_mat, s_mat
 
 
-def _rotation_matrix(axis, theta):
+def _get_xi_prime_sums(site_mat, cp_mat, pmat, smat, mtype, block_size=None):
     """
-    Return the rotation matrix associated with counterclockwise rotation about
-    the given axis by theta radians.
-    Source: Response by 'unutbu' in this thread:
-    http://stackoverflow.com/questions/6802577/python-rotation-of-3d-vector
+    Sum the propagation (p-dot-q) and slip (s-dot-q) dot products of xi'
+    over the subruptures for each site, where q is the unit vector from
+    the subrupture to the site. The sites are done in blocks of at most
+    block_size (site, subrupture) pairs.
+
+    Args:
+        site_mat (ndarray): A 3x(n sites) array of the site locations.
+        cp_mat (ndarray): A 3x(n subruptures) array of the center points of
+            the subruptures, in the same coordinates as site_mat.
+        pmat (ndarray): A 3x(n subruptures) array of the unit propagation
+            vectors of the subruptures.
+        smat (ndarray): A 3x(n subruptures) array of the unit slip vectors
+            of the subruptures.
+        mtype (int): 1 to sum only the positive dot products, 2 to sum all
+            of them.
+        block_size (int): The number of (site, subrupture) pairs in each
+            block; if None, XI_PRIME_BLOCK_SIZE is used.
+
+    Returns:
+        tuple: The arrays of the sums of the propagation and slip dot
+        products for each site, and of the numbers of subruptures in each
+        of the sums.
     """
-    axis = np.asarray(axis)
-    theta = np.asarray(theta)
-    axis = axis / np.sqrt(np.dot(axis, axis))
-    a = np.cos(theta / 2)
-    b, c, d = -axis * np.sin(theta / 2)
-    aa, bb, cc, dd = a * a, b * b, c * c, d * d
-    bc, ad, ac, ab, bd, cd = b * c, a * d, a * c, a * b, b * d, c * d
-    return np.array(
-        [
-            [aa + bb - cc - dd, 2 * (bc + ad), 2 * (bd - ac)],
-            [2 * (bc - ad), aa + cc - bb - dd, 2 * (cd + ab)],
-            [2 * (bd + ac), 2 * (cd - ab), aa + dd - bb - cc],
-        ]
+    if block_size is None:
+        block_size = XI_PRIME_BLOCK_SIZE
+    nsites = site_mat.shape[1]
+    nsub = cp_mat.shape[1]
+    xi_prime_p = np.zeros(nsites)
+    xi_prime_s = np.zeros(nsites)
+    if mtype == 1:
+        nsubp = np.zeros(nsites)
+        nsubs = np.zeros(nsites)
+    else:
+        nsubp = np.full(nsites, float(nsub))
+        nsubs = np.full(nsites, float(nsub))
+
+    # With q = (site - cp) / |site - cp|, the dot products are
+    # (p.site - p.cp) / |site - cp|, and
+    # |site - cp|^2 = site.site + cp.cp - 2 site.cp, so everything
+    # that involves both the sites and the subruptures is a matrix product
+    # or an elementwise operation on an (n sites)x(n subruptures) block.
+    cp_sq = np.sum(cp_mat * cp_mat, axis=0)
+    p_cp = np.sum(pmat * cp_mat, axis=0)
+    s_cp = np.sum(smat * cp_mat, axis=0)
+    dmat = np.hstack([cp_mat, pmat, smat])
+
+    step = max(1, block_size // max(nsub, 1))
+    for start in range(0, nsites, step):
+        stop = start + step
+        sites = site_mat[:, start:stop].T
+        prods = sites @ dmat
+
+        # The inverse distances from the sites to the subruptures. Round-off
+        # can make the squared distance slightly negative for a site on top
+        # of a subrupture.
+        rdist = prods[:, :nsub]
+        rdist *= -2
+        rdist += cp_sq
+        rdist += np.sum(sites * sites, axis=1).reshape((-1, 1))
+        np.maximum(rdist, 0, out=rdist)
+        np.sqrt(rdist, out=rdist)
+        np.divide(1.0, rdist, out=rdist)
+
+        # The numerators of the propagation and slip vector dot products
+        pdotq = prods[:, nsub : 2 * nsub]
+        pdotq -= p_cp
+        sdotq = prods[:, 2 * nsub :]
+        sdotq -= s_cp
+
+        if mtype == 1:
+            # Only sum over (+) directivity effect subruptures; the sign of
+            # each dot product is the sign of its numerator
+            np.maximum(pdotq, 0, out=pdotq)
+            nsubp[start:stop] = np.count_nonzero(pdotq, axis=1)
+            np.maximum(sdotq, 0, out=sdotq)
+            nsubs[start:stop] = np.count_nonzero(sdotq, axis=1)
+
+        # Normalize by n sub ruptures later
+        xi_prime_p[start:stop] = np.einsum("ij,ij->i", pdotq, rdist)
+        xi_prime_s[start:stop] = np.einsum("ij,ij->i", sdotq, rdist)
+
+    return xi_prime_p, xi_prime_s, nsubp, nsubs
+
+
+def _get_ls(site_x, site_y, top_x, top_y):
+    """
+    Compute Ls, the length of the top edge of the rupture along the
+    direction from the epicenter to each site, limited to the distance
+    from the epicenter to the site.
+
+    Args:
+        site_x (ndarray): The x coordinates of the sites relative to the
+            epicenter (km).
+        site_y (ndarray): The y coordinates of the sites relative to the
+            epicenter (km).
+        top_x (ndarray): The x coordinates of the points of the top edge of
+            the rupture relative to the epicenter (km).
+        top_y (ndarray): The y coordinates of the points of the top edge of
+            the rupture relative to the epicenter (km).
+
+    Returns:
+        ndarray: Ls for each site (km).
+    """
+    # Rotate the coordinates so that each site is on the x-axis; only the
+    # rotated x coordinates are needed
+    alpha = np.arctan2(site_y, site_x)
+    cosa = np.cos(alpha)
+    sina = np.sin(alpha)
+    top_r = np.max(
+        cosa.reshape((-1, 1)) * top_x.reshape((1, -1))
+        + sina.reshape((-1, 1)) * top_y.reshape((1, -1)),
+        axis=1,
     )
+    site_r = site_x * cosa + site_y * sina
+    return np.minimum(top_r, site_r)
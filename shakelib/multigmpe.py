@@ -2,7 +2,10 @@
 
 # stdlib imports
 import copy
+import hashlib
+import json
 import logging
+import time
 from importlib import import_module
 
 # third party imports
@@ -20,11 +23,32 @@ from shakelib.conversions.imc.boore_kishida_2017 import BooreKishida2017
 # local imports
 from shakelib.conversions.imt.abrahamson_bhasin_2020 import AbrahamsonBhasin2020
 from shakelib.gmpe.nga_east import NGAEast  # Special case GMPEs
-from shakelib.multiutils import gmpe_gmas
+from shakelib.multiutils import combine_stddevs, gmpe_correlation, gmpe_gmas
 from shakelib.sites import Sites
 
 
-def set_sites_depth_parameters(sites, gmpe):
+def _get_depth_parameter(sites, name, cache):
+    """
+    Get one of the depth parameters (see Sites.DEPTH_PARAMETERS) of the
+    sites, computed from their vs30, and set it on the sites. If a cache
+    is given, the parameter is shared by the calls made during an
+    evaluation of a MultiGMPE until the vs30 of the sites changes.
+    """
+    if cache is None:
+        value = Sites._computeDepthParameter(name, sites.vs30)
+    else:
+        if cache.get("depth_vs30") is not sites.vs30:
+            cache["depth_vs30"] = sites.vs30
+            cache["depth"] = {}
+        depths = cache["depth"]
+        if name not in depths:
+            depths[name] = Sites._computeDepthParameter(name, sites.vs30)
+        value = depths[name]
+    setattr(sites, name, value)
+    return value
+
+
+def set_sites_depth_parameters(sites, gmpe, cache=None):
     """
     Need to select the appropriate z1pt0 value for different GMPEs.
     Note that these are required site parameters, so even though
@@ -36,43 +60,46 @@ def set_sites_depth_parameters(sites, gmpe):
     Args:
         sites:1 An OQ sites context.
         gmpe: An OQ GMPE instance.
+        cache (dict): An optional dictionary shared by the calls made
+            during an evaluation of a MultiGMPE. If given, the depth
+            parameters are only recomputed when the vs30 of the sites
+            has changed since they were last computed.
 
     Returns:
         An OQ sites context with the depth parameters set for the
-        requested GMPE.
+        requested GMPE. Only the depth parameters that the GMPE uses
+        are computed.
     """
     if gmpe == "[MultiGMPE]":
         return sites
 
-    Sites._addDepthParameters(sites)
-
     if (
         gmpe == "[AbrahamsonEtAl2014]"
         or gmpe == "[AbrahamsonEtAl2014]\nregion = 'TWN'"
         or gmpe == "[AbrahamsonEtAl2014]\nregion = 'CHN'"
     ):
-        sites.z1pt0 = sites.z1pt0_ask14_cal
+        sites.z1pt0 = _get_depth_parameter(sites, "z1pt0_ask14_cal", cache)
     if gmpe == "[AbrahamsonEtAl2014]\nregion = 'JPN'":
-        sites.z1pt0 = sites.z1pt0_ask14_jpn
+        sites.z1pt0 = _get_depth_parameter(sites, "z1pt0_ask14_jpn", cache)
     if gmpe == "[ChiouYoungs2014]" or isinstance(gmpe, BooreEtAl2014):
-        sites.z1pt0 = sites.z1pt0_cy14_cal
+        sites.z1pt0 = _get_depth_parameter(sites, "z1pt0_cy14_cal", cache)
     if isinstance(gmpe, CampbellBozorgnia2014):
         if (
             gmpe == "[CampbellBozorgnia2014JapanSite]"
             or gmpe == "[CampbellBozorgnia2014HighQJapanSite]"
             or gmpe == "[CampbellBozorgnia2014LowQJapanSite]"
         ):
-            sites.z2pt5 = sites.z2pt5_cb14_jpn
+            sites.z2pt5 = _get_depth_parameter(sites, "z2pt5_cb14_jpn", cache)
         else:
-            sites.z2pt5 = sites.z2pt5_cb14_cal
+            sites.z2pt5 = _get_depth_parameter(sites, "z2pt5_cb14_cal", cache)
     if (
         gmpe == "[ChiouYoungs2008]"
         or gmpe == "[Bradley2013]"
         or gmpe == "[Bradley2013Volc]"
     ):
-        sites.z1pt0 = sites.z1pt0_cy08
+        sites.z1pt0 = _get_depth_parameter(sites, "z1pt0_cy08", cache)
     if gmpe == "[CampbellBozorgnia2008]":
-        sites.z2pt5 = sites.z2pt5_cb07
+        sites.z2pt5 = _get_depth_parameter(sites, "z2pt5_cb07", cache)
     if gmpe == "[AbrahamsonSilva2008]":
         sites.z1pt0 = gmpe._compute_median_z1pt0(sites.vs30)
 
@@ -108,6 +135,55 @@ def stuff_context(sites, rup, dists):
     return ctx
 
 
+def _stuff_context_cached(sites, rup, dists, cache):
+    """
+    Return stuff_context(sites, rup, dists), reusing the context made by
+    an earlier call with the same elements (i.e., the same array objects)
+    during an evaluation of a MultiGMPE.
+    """
+    elements = list(vars(sites).items()) + list(vars(dists).items())
+    key = (id(rup),) + tuple((name, id(value)) for name, value in elements)
+    contexts = cache.setdefault("ctx", {})
+    if key not in contexts:
+        # Hold on to the elements so that their ids remain valid
+        contexts[key] = (elements, stuff_context(sites, rup, dists))
+    return contexts[key][1]
+
+
+def _flatten_contexts(sites, dists):
+    """
+    Make shallow copies of the sites and distance contexts whose
+    elements are 1-D views of the elements of the originals, so that the
+    evaluation of a MultiGMPE does not modify the contexts it is given:
+    replacing an element (e.g., clipping vs30 to the GMPE limits, or
+    setting the depth parameters) only affects the copy. The views are
+    flagged read-only so that an attempt to modify the caller's arrays
+    in place fails rather than corrupting them.
+
+    Returns:
+        tuple: The copies of the sites and distance contexts, and the
+        original shape of the elements.
+    """
+    # Need to turn all 2D arrays into 1D arrays because of
+    # inconsistencies in how arrays are handled in OpenQuake.
+    shapes = []
+    flat_sites = copy.copy(sites)
+    flat_dists = copy.copy(dists)
+    for ctx in (flat_sites, flat_dists):
+        for k, v in ctx.__dict__.items():
+            if k == "_slots_" or k == "lons" or k == "lats" or v is None:
+                continue
+            shapes.append(v.shape)
+            flat = np.reshape(v, (-1,))
+            if np.shares_memory(flat, v):
+                flat.flags.writeable = False
+            ctx.__dict__[k] = flat
+    shapeset = set(shapes)
+    if len(shapeset) != 1:
+        raise Exception("All dists and sites elements must have same shape.")
+    return flat_sites, flat_dists, list(shapeset)[0]
+
+
 def get_gmpe_from_name(name, conf):
 
     # Only import the NullGMPE when we're testing
@@ -118,6 +194,104 @@ def get_gmpe_from_name(name, conf):
     return gsim(name)
 
 
+# The MultiGMPEs made by MultiGMPE.__from_config__(), keyed by the hash
+# of the parts of the config used to make them and the filter IMT, and
+# the counts of the cache hits and misses and the total time spent
+# constructing MultiGMPEs
+_MGMPE_CACHE = {}
+_MGMPE_CACHE_STATS = {"hits": 0, "misses": 0, "construction_time": 0.0}
+
+
+def _multigmpe_cache_key(conf, filter_imt):
+    """
+    Make the key for a MultiGMPE in the cache from the config sections
+    that __from_config__() uses and the filter IMT.
+    """
+    subtree = {
+        "component": conf["interp"]["component"],
+        "gmpe": conf["modeling"]["gmpe"],
+        "gmpe_sets": conf["gmpe_sets"],
+        "gmpe_modules": conf["gmpe_modules"],
+        "gmpe_limits": conf["gmpe_limits"],
+    }
+    digest = hashlib.sha1(
+        json.dumps(subtree, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return digest, None if filter_imt is None else filter_imt.string
+
+
+def get_multigmpe_cache_stats():
+    """
+    Return the statistics of the cache of MultiGMPEs made from configs.
+
+    Returns:
+        dict: The number of cache hits and misses, the hit rate, and the
+        total time (in seconds) spent constructing MultiGMPEs.
+    """
+    stats = dict(_MGMPE_CACHE_STATS)
+    ncalls = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / ncalls if ncalls else 0.0
+    return stats
+
+
+def clear_multigmpe_cache():
+    """
+    Empty the cache of MultiGMPEs made from configs and reset its
+    statistics.
+    """
+    _MGMPE_CACHE.clear()
+    _MGMPE_CACHE_STATS.update(hits=0, misses=0, construction_time=0.0)
+
+
+# The site amplification factors computed by
+# MultiGMPE.__get_site_factors__(), when the cache is enabled (see
+# set_site_factor_cache()); None when it is disabled
+_SITE_FACTOR_CACHE = None
+
+
+def set_site_factor_cache(enabled=True):
+    """
+    Enable (or disable) the cache of the site amplification factors
+    computed by MultiGMPE.__get_site_factors__(). The factors are cached
+    by the MultiGMPE, the IMT, and the identities of the vs30 and
+    distance arrays and of the rupture, so the cache is only valid as
+    long as those arrays are not modified in place: it is meant to be
+    enabled for a single run (e.g., of the model module) in which the
+    same sites are evaluated for many IMTs. Either way, the cache is
+    emptied.
+
+    Args:
+        enabled (bool): Whether to enable the cache.
+    """
+    global _SITE_FACTOR_CACHE
+    _SITE_FACTOR_CACHE = {} if enabled else None
+
+
+def _array_identity(arr):
+    """
+    Return a key that identifies the data of an array, so that the views
+    of the same data with the same layout have the same key, and the
+    array that owns the data, which must be kept alive as long as the key
+    is in use.
+    """
+    owner = arr
+    while isinstance(owner.base, np.ndarray):
+        owner = owner.base
+    key = (id(owner), arr.__array_interface__["data"][0], arr.shape, arr.strides)
+    return key, owner
+
+
+def _combine_gmpes(lnmu_list, lnsd_list, wts, cc):
+    """
+    Combine the means and stddevs of the GMPEs with a set of weights
+    (see combine_stddevs()).
+    """
+    lnmu = np.zeros_like(lnmu_list[0])
+    for wt, lmean in zip(wts, lnmu_list):
+        lnmu = lnmu + wt * lmean
+    return lnmu, combine_stddevs(lnmu_list, lnsd_list, wts, cc=cc)
+
+
 class MultiGMPE(GMPE):
     """
     Implements a GMPE that is the combination of multiple GMPEs.
@@ -132,7 +306,7 @@ class MultiGMPE(GMPE):
     REQUIRES_RUPTURE_PARAMETERS = None
     REQUIRES_DISTANCES = None
 
-    def get_mean_and_stddevs(self, sites, rup, dists, imt, stddev_types):
+    def get_mean_and_stddevs(self, sites, rup, dists, imt, stddev_types, segments=None):
         """
         See superclass `method <http://docs.openquake.org/oq-hazardlib/master/gsim/index.html#openquake.hazardlib.gsim.base.GroundShakingIntensityModel.get_mean_and_stddevs>`__.
 
@@ -151,63 +325,28 @@ class MultiGMPE(GMPE):
         the returned stddev list will contain six arrays: the first three
         will include the point-source inflation, and the second three will
         not.
+
+        The contexts may be the combination of the contexts of several sets
+        of sites (see shakelib.multiutils.merge_contexts()); if segments (a
+        list of the slices of the flattened sites that belong to each set,
+        see shakelib.multiutils.get_segments()) is given, the GMPEs are
+        combined separately for each set, so that the results are the same
+        as if each set were evaluated on its own.
         """  # noqa
 
         # ---------------------------------------------------------------------
         # Sort out shapes of the sites and dists elements
-        # Need to turn all 2D arrays into 1D arrays because of
-        # inconsistencies in how arrays are handled in OpenQuake.
         # ---------------------------------------------------------------------
-        shapes = []
-        for k, v in sites.__dict__.items():
-            if k == "_slots_":
-                continue
-            if (k != "lons") and (k != "lats"):
-                shapes.append(v.shape)
-                sites.__dict__[k] = np.reshape(sites.__dict__[k], (-1,))
-        for k, v in dists.__dict__.items():
-            if k == "_slots_":
-                continue
-            if (k != "lons") and (k != "lats") and v is not None:
-                shapes.append(v.shape)
-                dists.__dict__[k] = np.reshape(dists.__dict__[k], (-1,))
-        shapeset = set(shapes)
-        if len(shapeset) != 1:
-            raise Exception("All dists and sites elements must have same shape.")
-        else:
-            orig_shape = list(shapeset)[0]
+        sites, dists, orig_shape = _flatten_contexts(sites, dists)
 
         sd_avail = self.DEFINED_FOR_STANDARD_DEVIATION_TYPES
         if not sd_avail.issuperset(set(stddev_types)):
             raise Exception("Requested an unavailable stddev_type.")
 
         # Evaluate MultiGMPE:
-        lnmu, lnsd = self.__get_mean_and_stddevs__(sites, rup, dists, imt, stddev_types)
-
-        # Check for large-distance cutoff/weights
-        if hasattr(self, "CUTOFF_DISTANCE"):
-            lnmu_large, lnsd_large = self.__get_mean_and_stddevs__(
-                sites, rup, dists, imt, stddev_types, large_dist=True
-            )
-            # Stomp on lnmu and lnsd at large distances
-            dist_cutoff = self.CUTOFF_DISTANCE
-            lnmu[dists.rjb > dist_cutoff] = lnmu_large[dists.rjb > dist_cutoff]
-            for i in range(len(lnsd)):
-                lnsd[i][dists.rjb > dist_cutoff] = lnsd_large[i][
-                    dists.rjb > dist_cutoff
-                ]
-
-        # Undo reshapes of inputs
-        for k, v in dists.__dict__.items():
-            if k == "_slots_":
-                continue
-            if (k != "lons") and (k != "lats") and v is not None:
-                dists.__dict__[k] = np.reshape(dists.__dict__[k], orig_shape)
-        for k, v in sites.__dict__.items():
-            if k == "_slots_":
-                continue
-            if (k != "lons") and (k != "lats"):
-                sites.__dict__[k] = np.reshape(sites.__dict__[k], orig_shape)
+        lnmu, lnsd = self.__evaluate__(
+            sites, rup, dists, imt, stddev_types, {}, segments
+        )
 
         # Reshape output
         lnmu = np.reshape(lnmu, orig_shape)
@@ -216,22 +355,151 @@ class MultiGMPE(GMPE):
 
         return lnmu, lnsd
 
-    def __get_mean_and_stddevs__(
-        self, sites, rup, dists, imt, stddev_types, large_dist=False
+    def __get_mean_and_stddevs_multi__(
+        self, sites, rup, dists, imts, stddev_types, gmpes=None, segments=None
     ):
+        """
+        Evaluate the MultiGMPE for a list of IMTs in one call. The work
+        that does not depend on the IMT (reshaping the contexts, computing
+        the site depth parameters, and filling the contexts passed to the
+        component GMPEs) is only done once.
 
-        # ---------------------------------------------------------------------
-        # Sort out which set of weights to use
-        # ---------------------------------------------------------------------
-        if large_dist is False:
-            wts = self.WEIGHTS
-        else:
-            wts = self.WEIGHTS_LARGE_DISTANCE
+        Because the GMPEs are filtered and reweighted according to the
+        IMT when a MultiGMPE is made from a config (see
+        __from_config__()), a dictionary of the MultiGMPE to use for each
+        IMT may be given; the IMTs that are not in the dictionary use
+        this MultiGMPE.
 
-        # ---------------------------------------------------------------------
-        # This is the array to hold the weighted combination of the GMPEs
-        # ---------------------------------------------------------------------
-        lnmu = np.zeros_like(sites.vs30)
+        As for get_mean_and_stddevs(), the segments of combined contexts
+        may be given, so that the GMPEs are combined separately for each
+        of them.
+
+        Args:
+            sites (SitesContext): Instance of SitesContext.
+            rup (RuptureContext): Instance of RuptureContext.
+            dists (DistancesContext): Instance of DistancesContext.
+            imts (list): A list of OpenQuake IMTs.
+            stddev_types (list): The requested stddev types.
+            gmpes (dict): An optional dictionary, keyed by IMT string, of
+                the MultiGMPEs to use for the IMTs.
+            segments (list): An optional list of the slices of the
+                (flattened) sites that are combined separately (see
+                shakelib.multiutils.get_segments()).
+
+        Returns:
+            dict: A dictionary, keyed by IMT string, of the (mean, stddevs)
+            tuples that get_mean_and_stddevs() would return for each IMT.
+        """
+        if gmpes is None:
+            gmpes = {}
+        sites, dists, orig_shape = _flatten_contexts(sites, dists)
+
+        sd_avail = self.DEFINED_FOR_STANDARD_DEVIATION_TYPES
+        if not sd_avail.issuperset(set(stddev_types)):
+            raise Exception("Requested an unavailable stddev_type.")
+
+        # The depth parameters (and the other work in the cache) are
+        # shared by all of the IMTs
+        cache = {}
+        results = {}
+        for imt in imts:
+            mgmpe = gmpes.get(imt.string, self)
+            # Each IMT gets its own copy of the sites, so that the changes
+            # the GMPEs make to them (e.g., their depth parameters or
+            # limits on vs30) do not carry over to the next IMT
+            lnmu, lnsd = mgmpe.__evaluate__(
+                copy.copy(sites), rup, dists, imt, stddev_types, cache, segments
+            )
+            lnmu = np.reshape(lnmu, orig_shape)
+            for i in range(len(lnsd)):
+                lnsd[i] = np.reshape(lnsd[i], orig_shape)
+            results[imt.string] = (lnmu, lnsd)
+
+        return results
+
+    def __evaluate__(self, sites, rup, dists, imt, stddev_types, cache, segments=None):
+        """
+        Evaluate the MultiGMPE on (flattened) contexts, including the
+        large-distance weights (if any). The cache is a dictionary that
+        holds the work that can be shared by the calls made during one
+        evaluation (see set_sites_depth_parameters()). If segments (a list
+        of slices of the sites) is given, the GMPEs are combined
+        separately for each segment.
+        """
+        lnmu_list, lnsd_list = self.__get_mean_and_stddevs__(
+            sites, rup, dists, imt, stddev_types, cache=cache, segments=segments
+        )
+        if segments is None:
+            return self.__combine__(lnmu_list, lnsd_list, dists, slice(None))
+
+        lnmu = np.empty_like(lnmu_list[0])
+        lnsd = [np.empty_like(lnmu) for _ in range(len(lnsd_list) // len(lnmu_list))]
+        for seg in segments:
+            lnmu[seg], lnsd_seg = self.__combine__(
+                [lmean[seg] for lmean in lnmu_list],
+                [lsd[seg] for lsd in lnsd_list],
+                dists,
+                seg,
+            )
+            for i in range(len(lnsd)):
+                lnsd[i][seg] = lnsd_seg[i]
+        return lnmu, lnsd
+
+    def __combine__(self, lnmu_list, lnsd_list, dists, seg):
+        """
+        Combine the means and stddevs of the GMPEs for a set of sites (the
+        slice seg of the sites of dists).
+        """
+        # -----------------------------------------------------------------
+        # The mean is a weighted sum of random variables, so the stddev
+        # is the weighted sum of of their covariances (effectively). See:
+        # https://en.wikipedia.org/wiki/Variance#Weighted_sum_of_variables
+        # for an explanation. Also see:
+        # http://usgs.github.io/shakemap/manual4_0/tg_processing.html#ground-motion-prediction
+        # for a discussion on the way this is implemented here.
+        # -------------------------------------------------------------- # noqa
+        cc = gmpe_correlation(lnmu_list)
+
+        # Check for large-distance cutoff/weights
+        if not hasattr(self, "CUTOFF_DISTANCE"):
+            return _combine_gmpes(lnmu_list, lnsd_list, self.WEIGHTS, cc)
+
+        # The same GMPE outputs are combined with the normal weights
+        # within the cutoff distance and with the large-distance weights
+        # beyond it
+        far = dists.rjb[seg] > self.CUTOFF_DISTANCE
+        lnmu = np.empty_like(lnmu_list[0])
+        lnsd = [np.empty_like(lnmu) for _ in range(len(lnsd_list) // len(lnmu_list))]
+        for wts, idx in ((self.WEIGHTS, ~far), (self.WEIGHTS_LARGE_DISTANCE, far)):
+            if not np.any(idx):
+                continue
+            lnmu_part, lnsd_part = _combine_gmpes(
+                [lmean[idx] for lmean in lnmu_list],
+                [lsd[idx] for lsd in lnsd_list],
+                wts,
+                cc,
+            )
+            lnmu[idx] = lnmu_part
+            for i in range(len(lnsd)):
+                lnsd[i][idx] = lnsd_part[i]
+
+        return lnmu, lnsd
+
+    def __get_mean_and_stddevs__(
+        self, sites, rup, dists, imt, stddev_types, cache=None, segments=None
+    ):
+        """
+        Evaluate each of the GMPEs (including the site and component
+        adjustments) on flattened contexts. The segments (if any) are
+        passed on to the nested MultiGMPEs (see __evaluate__()).
+
+        Returns:
+            tuple: The list of the means of the GMPEs, and the list of
+            their stddevs (2 * len(stddev_types) arrays for each GMPE, see
+            below).
+        """
+        if cache is None:
+            cache = {}
         # ---------------------------------------------------------------------
         # Hold on to the individual means and stddevs so we can compute the
         # combined stddev
@@ -244,7 +512,7 @@ class MultiGMPE(GMPE):
             # Loop over GMPE list
             # -----------------------------------------------------------------
 
-            set_sites_depth_parameters(sites, gmpe)
+            set_sites_depth_parameters(sites, gmpe, cache)
 
             # -----------------------------------------------------------------
             # Select the IMT
@@ -259,7 +527,12 @@ class MultiGMPE(GMPE):
                 and (imt.string == "PGV")
                 and ("PGV" not in gmpe_imts)
             ):
-                ab2020 = AbrahamsonBhasin2020(rup.mag)
+                # The conversion (including its terms that depend only on
+                # the sites and distances) is shared by all of the GMPEs
+                # that need it
+                if "ab2020" not in cache:
+                    cache["ab2020"] = AbrahamsonBhasin2020(rup.mag)
+                ab2020 = cache["ab2020"]
                 timt = SA(ab2020.getTref())
             else:
                 timt = imt
@@ -286,17 +559,16 @@ class MultiGMPE(GMPE):
                             vs30min = float(v[0])
                             vs30max = float(v[1])
                             sites.vs30 = np.clip(sites.vs30, vs30min, vs30max)
-                            Sites._addDepthParameters(sites)
 
             # -----------------------------------------------------------------
             # Evaluate
             # -----------------------------------------------------------------
             if not isinstance(gmpe, MultiGMPE):
-                ctx = stuff_context(sites, rup, dists)
+                ctx = _stuff_context_cached(sites, rup, dists, cache)
                 lmean, lsd = gmpe_gmas(gmpe, ctx, timt, stddev_types)
             else:
-                lmean, lsd = gmpe.get_mean_and_stddevs(
-                    sites, rup, dists, timt, stddev_types
+                lmean, lsd = gmpe.__evaluate__(
+                    sites, rup, dists, timt, stddev_types, cache, segments
                 )
 
             if not isinstance(gmpe, MultiGMPE):
@@ -357,60 +629,25 @@ class MultiGMPE(GMPE):
             #
 
             # -----------------------------------------------------------------
-            # Compute weighted mean and collect the elements to compute sd
+            # Collect the elements to compute the weighted mean and sd
             # -----------------------------------------------------------------
 
-            lnmu = lnmu + wts[i] * lmean
             lnmu_list.append(lmean)
             lnsd_list = lnsd_list + lsd
 
-        # -----------------------------------------------------------------
-        # The mean is a weighted sum of random variables, so the stddev
-        # is the weighted sum of of their covariances (effectively). See:
-        # https://en.wikipedia.org/wiki/Variance#Weighted_sum_of_variables
-        # for an explanation. Also see:
-        # http://usgs.github.io/shakemap/manual4_0/tg_processing.html#ground-motion-prediction
-        # for a discussion on the way this is implemented here.
-        # -------------------------------------------------------------- # noqa
-
-        nwts = len(wts)
-        npwts = np.array(wts).reshape((1, -1))
-        nsites = len(lnmu)
-        # Find the correlation coefficients among the gmpes; if there are
-        # fewer than 10 points, just use an approximation (noting that the
-        # correlation among GMPEs tends to be quite high).
-        if nsites < 10:
-            cc = np.full((nwts, nwts), 0.95)
-            np.fill_diagonal(cc, 1.0)
-        else:
-            np.seterr(divide="ignore", invalid="ignore")
-            cc = np.reshape(np.corrcoef(lnmu_list), (nwts, nwts))
-            np.seterr(divide="warn", invalid="warn")
-            cc[np.isnan(cc)] = 1.0
-
-        # Multiply the correlation coefficients by the weights matrix
-        # (this is cheaper than multiplying all of elements of each
-        # stddev array by their weights since we have to multiply
-        # everything by the correlation coefficient matrix anyway))
-        cc = ((npwts * npwts.T) * cc).reshape((nwts, nwts, 1))
-        nstds = len(stddev_types)
-        lnsd_new = []
-        for i in range(nstds * 2):
-            sdlist = []
-            for j in range(nwts):
-                sdlist.append(lnsd_list[j * nstds * 2 + i].reshape((1, 1, -1)))
-            sdstack = np.hstack(sdlist)
-            wcov = (sdstack * np.transpose(sdstack, axes=(1, 0, 2))) * cc
-            # This sums the weighted covariance as each point in the output
-            lnsd_new.append(np.sqrt(wcov.sum((0, 1))))
-
-        return lnmu, lnsd_new
+        return lnmu_list, lnsd_list
 
     @classmethod
     def __from_config__(cls, conf, filter_imt=None):
         """
         Construct a MultiGMPE from a config file.
 
+        The MultiGMPEs are cached by the contents of the parts of the
+        config that are used to make them and the filter IMT, so a
+        repeated call returns the MultiGMPE that was already made. The
+        returned objects are shared, and must not be modified. See
+        get_multigmpe_cache_stats() and clear_multigmpe_cache().
+
         Args:
             conf (dict): Dictionary of config options.
             filter_imt (IMT): An optional IMT to filter/reweight the GMPE list.
@@ -418,6 +655,24 @@ class MultiGMPE(GMPE):
         Returns:
             MultiGMPE object.
 
+        """
+        key = _multigmpe_cache_key(conf, filter_imt)
+        out = _MGMPE_CACHE.get(key)
+        if out is not None:
+            _MGMPE_CACHE_STATS["hits"] += 1
+            return out
+        t1 = time.time()
+        out = cls.__make_from_config__(conf, filter_imt=filter_imt)
+        _MGMPE_CACHE_STATS["construction_time"] += time.time() - t1
+        _MGMPE_CACHE_STATS["misses"] += 1
+        _MGMPE_CACHE[key] = out
+        return out
+
+    @classmethod
+    def __make_from_config__(cls, conf, filter_imt=None):
+        """
+        Construct a MultiGMPE from a config file without the cache (see
+        __from_config__()).
         """
         IMC = getattr(const.IMC, conf["interp"]["component"])
         selected_gmpe = conf["modeling"]["gmpe"]
@@ -867,12 +1122,46 @@ class MultiGMPE(GMPE):
         Returns:
             Site amplifications in natural log units.
         """
+        cache = _SITE_FACTOR_CACHE
+        if cache is None:
+            return self.__compute_site_factors__(sites, rup, dists, imt, default)
+
+        # ---------------------------------------------------------------------
+        # The factors depend on the vs30 of the sites, the distances, and
+        # the rupture; the arrays are identified by their data, and the
+        # rupture by its identity and its scalar parameters
+        # ---------------------------------------------------------------------
+        keys = []
+        owners = [self, rup]
+        for name, value in [("vs30", sites.vs30)] + sorted(vars(dists).items()):
+            if isinstance(value, np.ndarray):
+                akey, owner = _array_identity(value)
+                keys.append((name, akey))
+                owners.append(owner)
+        rup_pars = tuple(
+            (name, value.item() if isinstance(value, np.ndarray) else value)
+            for name, value in sorted(vars(rup).items())
+            if np.ndim(value) == 0
+        )
+        key = (id(self), imt.string, default, id(rup), rup_pars, tuple(keys))
+        if key not in cache:
+            lamps = self.__compute_site_factors__(sites, rup, dists, imt, default)
+            lamps.flags.writeable = False
+            # Hold on to the objects in the key so that their ids remain
+            # valid
+            cache[key] = (owners, lamps)
+        return cache[key][1]
+
+    def __compute_site_factors__(self, sites, rup, dists, imt, default):
+        """
+        Compute the site amplification factors (see __get_site_factors__()).
+        """
 
         # ---------------------------------------------------------------------
         # Make reference sites context
         # ---------------------------------------------------------------------
 
-        ref_sites = copy.deepcopy(sites)
+        ref_sites = copy.copy(sites)
         ref_sites.vs30 = np.full_like(sites.vs30, self.REFERENCE_VS30)
         # TODO: Should we reset the Sites depth parameters here? Probably.
 
@@ -981,17 +1270,15 @@ class MultiGMPE(GMPE):
             if dvar is None:
                 continue
             # Add a small amound to the rupture distance (rrup or rjb)
-            # and re-evaluate the GMPE
-            rup_dist = getattr(dists, dtype)
-            rup_dist += delta_distance
-            ctx = stuff_context(sites, rup, dists)
+            # (in a copy of the distance context) and re-evaluate the GMPE
+            tdists = copy.copy(dists)
+            setattr(tdists, dtype, getattr(dists, dtype) + delta_distance)
+            ctx = stuff_context(sites, rup, tdists)
             tmean, tsd = gmpe_gmas(gmpe, ctx, imt, stddev_types)
             # Find the derivative w.r.t. the rupture distance
             dm_dr = (lmean - tmean) / delta_distance
             # The additional variance is (dm/dr)^2 * dvar
             delta_var[i] = dm_dr**2 * dvar
-            # Put the rupture distance back to what it was
-            rup_dist -= delta_distance
         for i, stdtype in enumerate(stddev_types):
             if stdtype == const.StdDev.INTER_EVENT:
                 new_sd.append(lsd[i].copy())
@@ -3,6 +3,10 @@ import numpy as np
 from openquake.hazardlib import const
 from openquake.hazardlib.contexts import ContextMaker
 
+# The number of sites in each of the blocks in which combine_stddevs()
+# reduces the GMPE stddevs
+COMBINE_BLOCK_SIZE = 65536
+
 
 def gmpe_gmas(gmpe, ctx, imt, stddev_types):
     """ """
@@ -43,3 +47,221 @@ def gmpe_gmas(gmpe, ctx, imt, stddev_types):
             elif stddev_type == const.StdDev.INTRA_EVENT:
                 stddevs.append(phi[0])
         return mean[0], stddevs
+
+
+def merge_contexts(contexts):
+    """
+    Combine a list of sites and distance contexts into a single pair of
+    contexts whose elements are the concatenations of the (flattened)
+    elements of the inputs, so that a GMPE can be evaluated for all of
+    them in one call. See split_results() for the inverse operation.
+
+    The longitudes and latitudes of a sites context for a full grid are
+    the coordinates of its columns and rows; they are expanded to the
+    coordinates of each site in the combined context.
+
+    A MultiGMPE evaluated on the combined contexts must be given the
+    segments of the inputs (see get_segments()).
+
+    Args:
+        contexts (list): A list of (SitesContext, DistancesContext)
+            tuples.
+
+    Returns:
+        tuple: A (SitesContext, DistancesContext) tuple, or None if the
+        contexts cannot be combined because they do not all have the same
+        elements.
+    """
+
+    def _names(ctx):
+        return {name for name in vars(ctx) if not name.startswith("_")}
+
+    sx0, dx0 = contexts[0]
+    sx_names = _names(sx0)
+    dx_names = _names(dx0)
+    dx_none = {name for name in dx_names if getattr(dx0, name) is None}
+    for sx, dx in contexts[1:]:
+        if _names(sx) != sx_names or _names(dx) != dx_names:
+            return None
+        if {name for name in dx_names if getattr(dx, name) is None} != dx_none:
+            return None
+
+    sx_out = type(sx0)()
+    dx_out = type(dx0)()
+    for name in sx_names:
+        if name in ("lons", "lats"):
+            continue
+        setattr(
+            sx_out,
+            name,
+            np.concatenate([np.ravel(getattr(sx, name)) for sx, _ in contexts]),
+        )
+    if "lons" in sx_names and "lats" in sx_names:
+        lons = []
+        lats = []
+        for sx, _ in contexts:
+            slons, slats = sx.lons, sx.lats
+            if np.shape(slons) != np.shape(sx.vs30):
+                slons, slats = np.meshgrid(slons, slats)
+            lons.append(np.ravel(slons))
+            lats.append(np.ravel(slats))
+        sx_out.lons = np.concatenate(lons)
+        sx_out.lats = np.concatenate(lats)
+    sx_out.sids = np.arange(np.size(sx_out.vs30))
+    for name in dx_names:
+        if name in dx_none:
+            setattr(dx_out, name, None)
+        else:
+            setattr(
+                dx_out,
+                name,
+                np.concatenate([np.ravel(getattr(dx, name)) for _, dx in contexts]),
+            )
+    return sx_out, dx_out
+
+
+def get_segments(contexts):
+    """
+    Find the parts of the combined contexts made by merge_contexts() that
+    come from each of the input contexts. The stddevs of a MultiGMPE
+    depend on the correlation among its GMPEs over the sites it is given,
+    so a MultiGMPE evaluated on the combined contexts must be given these
+    segments (see MultiGMPE.get_mean_and_stddevs()) to produce the same
+    results as it would for each of the input contexts.
+
+    Args:
+        contexts (list): The list of (SitesContext, DistancesContext)
+            tuples that was given to merge_contexts().
+
+    Returns:
+        list: A slice of the combined arrays for each of the input
+        contexts.
+    """
+    segments = []
+    start = 0
+    for sx, _ in contexts:
+        end = start + int(np.size(sx.vs30))
+        segments.append(slice(start, end))
+        start = end
+    return segments
+
+
+def split_results(contexts, mean, stddevs):
+    """
+    Split the results of a GMPE evaluated for the combined contexts made
+    by merge_contexts() into the results for each of the input contexts.
+
+    Args:
+        contexts (list): The list of (SitesContext, DistancesContext)
+            tuples that was given to merge_contexts().
+        mean (ndarray): The means for the combined contexts.
+        stddevs (list): The list of stddev arrays for the combined
+            contexts.
+
+    Returns:
+        list: A list of (mean, stddevs) tuples, one for each of the
+        input contexts, with the arrays in the shape of the sites.
+    """
+    results = []
+    for (sx, _), seg in zip(contexts, get_segments(contexts)):
+        shape = np.shape(sx.vs30)
+        results.append(
+            (
+                np.reshape(mean[seg], shape),
+                [np.reshape(sd[seg], shape) for sd in stddevs],
+            )
+        )
+    return results
+
+
+def gmpe_correlation(lnmu_list, block_size=COMBINE_BLOCK_SIZE):
+    """
+    Find the correlation coefficients among the means of a set of GMPEs
+    (see combine_stddevs()).
+
+    Args:
+        lnmu_list (list): The mean (an array of length nsites) of each
+            of the nwts GMPEs.
+        block_size (int): The number of sites in each block.
+
+    Returns:
+        ndarray: The nwts x nwts matrix of correlation coefficients.
+    """
+    nwts = len(lnmu_list)
+    nsites = np.size(lnmu_list[0])
+    # If there are fewer than 10 points, just use an approximation
+    # (noting that the correlation among GMPEs tends to be quite high).
+    if nsites < 10:
+        cc = np.full((nwts, nwts), 0.95)
+        np.fill_diagonal(cc, 1.0)
+        return cc
+    # This is np.corrcoef(lnmu_list), but accumulated over the blocks
+    means = np.array([np.mean(mu) for mu in lnmu_list])
+    cov = np.zeros((nwts, nwts))
+    for start in range(0, nsites, block_size):
+        block = np.array([np.ravel(mu)[start : start + block_size] for mu in lnmu_list])
+        block -= means.reshape((-1, 1))
+        cov += block @ block.T
+    sd = np.sqrt(np.diag(cov))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cc = cov / np.outer(sd, sd)
+    cc[np.isnan(cc)] = 1.0
+    np.clip(cc, -1.0, 1.0, out=cc)
+    return cc
+
+
+def combine_stddevs(lnmu_list, lnsd_list, wts, block_size=COMBINE_BLOCK_SIZE, cc=None):
+    """
+    Combine the stddevs of a weighted set of GMPEs into the stddevs of
+    their weighted mean. The mean is a weighted sum of correlated random
+    variables, so its variance at each site is the sum over all of the
+    pairs of GMPEs (i, j) of w_i * w_j * cc_ij * sd_i * sd_j, where cc is
+    the matrix of the correlation coefficients among the GMPE means.
+
+    The sites are processed in blocks, and all of the stddev types are
+    reduced together in each block, so the memory used is proportional
+    to the block size rather than to nwts * nwts * nsites.
+
+    Args:
+        lnmu_list (list): The mean (an array of length nsites) of each
+            of the nwts GMPEs.
+        lnsd_list (list): The stddev arrays of the GMPEs: all of the
+            stddev types for the first GMPE, followed by those for the
+            second GMPE, etc.
+        wts (list): The weights of the GMPEs.
+        block_size (int): The number of sites in each block.
+        cc (ndarray): The correlation coefficients among the GMPEs; if
+            None, they are computed from lnmu_list with
+            gmpe_correlation().
+
+    Returns:
+        list: The combined stddev array for each stddev type.
+    """
+    nwts = len(wts)
+    nsd = len(lnsd_list) // nwts
+    nsites = np.size(lnmu_list[0])
+    npwts = np.asarray(wts, dtype=np.float64)
+    if cc is None:
+        cc = gmpe_correlation(lnmu_list, block_size)
+
+    # Multiply the correlation coefficients by the weights matrix
+    # (this is cheaper than multiplying all of elements of each
+    # stddev array by their weights since we have to multiply
+    # everything by the correlation coefficient matrix anyway)
+    wcc = np.outer(npwts, npwts) * cc
+    lnsd_new = np.empty((nsd, nsites))
+    for start in range(0, nsites, block_size):
+        stop = min(start + block_size, nsites)
+        # The stddevs for the block as an (nwts, nsd, nblock) array
+        sdblock = np.array(
+            [
+                [np.ravel(lnsd_list[j * nsd + i])[start:stop] for i in range(nsd)]
+                for j in range(nwts)
+            ]
+        )
+        # This sums the weighted covariance at each point in the output
+        lnsd_new[:, start:stop] = np.einsum(
+            "itn,ij,jtn->tn", sdblock, wcc, sdblock, optimize=True
+        )
+    np.sqrt(lnsd_new, out=lnsd_new)
+    return list(lnsd_new)
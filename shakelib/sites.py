@@ -1,6 +1,10 @@
 #!/usr/bin/env python
 
 # stdlib imports
+import hashlib
+import json
+import os
+import tempfile
 
 # third party imports
 from mapio.reader import read, get_file_geodict
@@ -19,8 +23,34 @@ class Sites(object):
     `SitesContext <https://github.com/gem/oq-hazardlib/blob/master/openquake/hazardlib/gsim/base.py>`__.
     """  # noqa
 
+    # The depth parameters of the sites contexts, and the methods that
+    # compute them (z2pt5_cb07 is computed from z1pt0_cy08)
+    DEPTH_PARAMETERS = {
+        "z1pt0_cy14_cal": "_z1pt0_from_vs30_cy14_cal",
+        "z1pt0_cy14_jpn": "_z1pt0_from_vs30_cy14_jpn",
+        "z1pt0_ask14_cal": "_z1pt0_from_vs30_ask14_cal",
+        "z1pt0_ask14_jpn": "_z1pt0_from_vs30_ask14_jpn",
+        "z2pt5_cb14_cal": "_z2pt5_from_vs30_cb14_cal",
+        "z2pt5_cb14_jpn": "_z2pt5_from_vs30_cb14_jpn",
+        "z1pt0_cy08": "_z1pt0_from_vs30_cy08",
+        "z2pt5_cb07": "_z2pt5_from_z1pt0_cb07",
+    }
+
+    # The depth parameters of a (float64) Vs30 array with at least this
+    # many elements, all of which are whole numbers, are computed for each
+    # value in a lookup table rather than for each element (see
+    # _getVs30LookupIndex()); 0 disables the lookup tables
+    DEPTH_LOOKUP_MIN_SITES = 100000
+    # The largest Vs30 value (and so the size) of a lookup table
+    DEPTH_LOOKUP_MAX_VS30 = 10000
+
     def __init__(
-        self, vs30grid, vs30measured_grid=None, backarc=None, defaultVs30=686.0
+        self,
+        vs30grid,
+        vs30measured_grid=None,
+        backarc=None,
+        defaultVs30=686.0,
+        vs30tiles=None,
     ):
         """
         Construct a Sites object.
@@ -33,8 +63,12 @@ class Sites(object):
                 `backarc <http://earthquake.usgs.gov/learn/glossary/?term=backarc>`__.
             defaultVs30: Default Vs30 value to use in locations where Vs30Grid
                 is not specified.
+            vs30tiles: A TiledVs30 object from which vs30grid was read, or
+                None. If given, the Vs30 of locations outside of vs30grid
+                are looked up in it rather than set to defaultVs30.
         """  # noqa
         self._Vs30 = vs30grid
+        self._vs30tiles = vs30tiles
         if backarc is None:
             self._backarc = np.zeros_like(vs30grid.getData(), dtype=bool)
         else:
@@ -57,9 +91,16 @@ class Sites(object):
         )
 
     @classmethod
-    def _create(cls, geodict, defaultVs30, vs30File, padding, resample):
+    def _create(
+        cls, geodict, defaultVs30, vs30File, padding, resample, vs30_cache=None
+    ):
+        vs30tiles = None
         if vs30File is not None:
-            fgeodict = get_file_geodict(vs30File)
+            if TiledVs30.isTiled(vs30File):
+                vs30tiles = TiledVs30(vs30File)
+                fgeodict = vs30tiles.getGeoDict()
+            else:
+                fgeodict = get_file_geodict(vs30File)
             if not resample:
                 if not padding:
                     # we want something that is within and aligned
@@ -68,15 +109,29 @@ class Sites(object):
                     # we want something that is just aligned, since we're
                     # padding edges
                     geodict = fgeodict.getAligned(geodict)
-            vs30grid = read(
-                vs30File,
-                samplegeodict=geodict,
-                resample=resample,
-                method="linear",
-                doPadding=padding,
-                padValue=defaultVs30,
-            )
-        return vs30grid
+            if vs30_cache is not None:
+                key = vs30_cache.getKey(
+                    vs30File, geodict, resample, "linear", padding, defaultVs30
+                )
+                vs30grid = vs30_cache.get(key)
+                if vs30grid is not None:
+                    return vs30grid, vs30tiles
+            if vs30tiles is not None:
+                vs30grid = vs30tiles.read(
+                    geodict, resample=resample, method="linear", padValue=defaultVs30
+                )
+            else:
+                vs30grid = read(
+                    vs30File,
+                    samplegeodict=geodict,
+                    resample=resample,
+                    method="linear",
+                    doPadding=padding,
+                    padValue=defaultVs30,
+                )
+            if vs30_cache is not None:
+                vs30_cache.put(key, vs30grid)
+        return vs30grid, vs30tiles
 
     @classmethod
     def fromBounds(
@@ -93,6 +148,7 @@ class Sites(object):
         backarc=None,
         padding=False,
         resample=False,
+        vs30_cache=None,
     ):
         """
         Create a Sites object by defining a center point, resolution, extent,
@@ -107,7 +163,7 @@ class Sites(object):
             dy: Resolution of desired grid in Y direction.
             defaultVs30: Default Vs30 value to use if vs30File not specified.
             vs30File: Name of GMT or GDAL format grid file containing Vs30
-                values.
+                values, or of a tiled Vs30 file (see TiledVs30).
             vs30measured_grid: Boolean grid indicating whether Vs30 values were
                 measured or derived (i.e., from slope).
             backarc: Boolean array indicating whether site is in the subduction
@@ -117,18 +173,24 @@ class Sites(object):
                 clipped to the extent of the input file.
             resample: Boolean indicating whether or not the grid should be
                 resampled.
+            vs30_cache: A Vs30Cache object in which to look up (and store)
+                the grid sampled from vs30File, or None.
         """  # noqa
         geodict = GeoDict.createDictFromBox(xmin, xmax, ymin, ymax, dx, dy)
         if vs30File is not None:
-            vs30grid = cls._create(geodict, defaultVs30, vs30File, padding, resample)
+            vs30grid, vs30tiles = cls._create(
+                geodict, defaultVs30, vs30File, padding, resample, vs30_cache
+            )
         else:
             griddata = np.ones((geodict.ny, geodict.nx), dtype=np.float64) * defaultVs30
             vs30grid = Grid2D(griddata, geodict)
+            vs30tiles = None
         return cls(
             vs30grid,
             vs30measured_grid=vs30measured_grid,
             backarc=backarc,
             defaultVs30=defaultVs30,
+            vs30tiles=vs30tiles,
         )
 
     @classmethod
@@ -146,6 +208,7 @@ class Sites(object):
         backarc=None,
         padding=False,
         resample=False,
+        vs30_cache=None,
     ):
         """
         Create a Sites object by defining a center point, resolution, extent,
@@ -160,7 +223,7 @@ class Sites(object):
             dy: Resolution of desired grid in Y direction.
             defaultVs30: Default Vs30 value to use if vs30File not specified.
             vs30File: Name of GMT or GDAL format grid file containing Vs30
-                values.
+                values, or of a tiled Vs30 file (see TiledVs30).
             vs30measured_grid: Boolean grid indicating whether Vs30 values were
                 measured or derived (i.e., from slope).
             backarc: Boolean array indicating whether site is in the subduction
@@ -170,18 +233,24 @@ class Sites(object):
                 clipped to the extent of the input file.
             resample: Boolean indicating whether or not the grid should be
                 resampled.
+            vs30_cache: A Vs30Cache object in which to look up (and store)
+                the grid sampled from vs30File, or None.
         """  # noqa
         geodict = GeoDict.createDictFromCenter(cx, cy, dx, dy, xspan, yspan)
         if vs30File is not None:
-            vs30grid = cls._create(geodict, defaultVs30, vs30File, padding, resample)
+            vs30grid, vs30tiles = cls._create(
+                geodict, defaultVs30, vs30File, padding, resample, vs30_cache
+            )
         else:
             griddata = np.ones((geodict.ny, geodict.nx), dtype=np.float64) * defaultVs30
             vs30grid = Grid2D(griddata, geodict)
+            vs30tiles = None
         return cls(
             vs30grid,
             vs30measured_grid=vs30measured_grid,
             backarc=backarc,
             defaultVs30=defaultVs30,
+            vs30tiles=vs30tiles,
         )
 
     def getSitesContext(self, lldict=None, rock_vs30=None):
@@ -214,7 +283,7 @@ class Sites(object):
                 dimensionality.
 
         """  # noqa
-        sctx = SitesContext()
+        sctx = LazySitesContext()
 
         if lldict is not None:
             lats = lldict["lats"]
@@ -228,6 +297,12 @@ class Sites(object):
             if rock_vs30 is not None:
                 tmp = self._Vs30.getValue(lats, lons, default=self._defaultVs30)
                 sctx.vs30 = np.ones_like(tmp) * rock_vs30
+            elif self._vs30tiles is not None:
+                sctx.vs30 = self._Vs30.getValue(lats, lons, default=np.nan)
+                outside = np.isnan(sctx.vs30)
+                sctx.vs30[outside] = self._vs30tiles.getValue(
+                    lats[outside], lons[outside], default=self._defaultVs30
+                )
             else:
                 sctx.vs30 = self._Vs30.getValue(lats, lons, default=self._defaultVs30)
             sctx.lats = lats
@@ -313,21 +388,88 @@ class Sites(object):
     def _addDepthParameters(sctx):
         """
         Add the different depth parameters to a sites context from
-        Vs30 values.
+        Vs30 values. The depth parameters of a LazySitesContext are
+        computed when they are first accessed, so for those any values
+        computed from a previous Vs30 are discarded instead.
 
         Args:
             sctx: A sites context.
 
         Returns: A sites context with the depth parameters set.
         """
-        sctx.z1pt0_cy14_cal = Sites._z1pt0_from_vs30_cy14_cal(sctx.vs30)
-        sctx.z1pt0_cy14_jpn = Sites._z1pt0_from_vs30_cy14_jpn(sctx.vs30)
-        sctx.z1pt0_ask14_cal = Sites._z1pt0_from_vs30_ask14_cal(sctx.vs30)
-        sctx.z1pt0_ask14_jpn = Sites._z1pt0_from_vs30_ask14_jpn(sctx.vs30)
-        sctx.z2pt5_cb14_cal = Sites._z2pt5_from_vs30_cb14_cal(sctx.vs30)
-        sctx.z2pt5_cb14_jpn = Sites._z2pt5_from_vs30_cb14_jpn(sctx.vs30)
-        sctx.z1pt0_cy08 = Sites._z1pt0_from_vs30_cy08(sctx.vs30)
-        sctx.z2pt5_cb07 = Sites._z2pt5_from_z1pt0_cb07(sctx.z1pt0_cy08)
+        for name in Sites.DEPTH_PARAMETERS:
+            if isinstance(sctx, LazySitesContext):
+                sctx.__dict__.pop(name, None)
+            else:
+                setattr(sctx, name, Sites._computeDepthParameter(name, sctx.vs30))
+
+    @staticmethod
+    def _computeDepthParameter(name, vs30):
+        """
+        Compute one of the depth parameters from Vs30 values.
+
+        Args:
+            name: The name of the depth parameter (a key of
+                Sites.DEPTH_PARAMETERS).
+            vs30: Numpy array of Vs30 values in m/s.
+
+        Returns: Numpy array of the depth parameter.
+        """
+        lookup = Sites._getVs30LookupIndex(vs30)
+        if lookup is not None:
+            # Compute the parameter for each whole Vs30 value in the range
+            # of the array, and index the table with the Vs30 values
+            index, vmin, vmax = lookup
+            table = np.full(vmax + 1, np.nan)
+            table[vmin:] = Sites._evaluateDepthRelation(
+                name, np.arange(vmin, vmax + 1, dtype=np.float64)
+            )
+            return table[index]
+        return Sites._evaluateDepthRelation(name, vs30)
+
+    @staticmethod
+    def _evaluateDepthRelation(name, vs30):
+        if name == "z2pt5_cb07":
+            return Sites._z2pt5_from_z1pt0_cb07(Sites._z1pt0_from_vs30_cy08(vs30))
+        return getattr(Sites, Sites.DEPTH_PARAMETERS[name])(vs30)
+
+    @staticmethod
+    def _getVs30LookupIndex(vs30):
+        """
+        Check if the depth parameters of a Vs30 array should be computed
+        with a lookup table: the array must be float64, with at least
+        DEPTH_LOOKUP_MIN_SITES elements, all of which are whole numbers
+        between 0 and DEPTH_LOOKUP_MAX_VS30. (Finding the distinct values
+        of an arbitrary array, e.g., with np.unique(), is slower than
+        evaluating the relations for every element, and for float32
+        arrays the lookup is no faster than the evaluation.)
+
+        Args:
+            vs30: Numpy array of Vs30 values in m/s.
+
+        Returns: None if a lookup table should not be used, otherwise a
+            tuple of the Vs30 values as an integer array, and their
+            minimum and maximum.
+        """
+        if (
+            Sites.DEPTH_LOOKUP_MIN_SITES <= 0
+            or np.size(vs30) < Sites.DEPTH_LOOKUP_MIN_SITES
+            or np.asarray(vs30).dtype != np.float64
+        ):
+            return None
+        # Check a sample before converting the whole array
+        sample = np.ravel(vs30)[:: max(1, np.size(vs30) // 1000)]
+        if not np.all(sample == np.rint(sample)):
+            return None
+        with np.errstate(invalid="ignore"):
+            index = vs30.astype(np.int32)
+        if not np.array_equal(index, vs30):
+            return None
+        vmin = int(np.min(index))
+        vmax = int(np.max(index))
+        if vmin < 0 or vmax > Sites.DEPTH_LOOKUP_MAX_VS30:
+            return None
+        return index, vmin, vmax
 
     @staticmethod
     def _z1pt0_from_vs30_cy14_cal(vs30):
@@ -450,3 +592,439 @@ class Sites(object):
         """
         z2pt5 = 519.0 + z1pt0 * 3.595
         return z2pt5
+
+
+class LazySitesContext(SitesContext):
+    """
+    A SitesContext whose depth parameters (see Sites.DEPTH_PARAMETERS)
+    are computed from its Vs30 when they are first accessed, rather than
+    when it is made; most GMPEs need at most one or two of them.
+    """
+
+    def __getattr__(self, name):
+        # This is only called for attributes that have not been set
+        if name not in Sites.DEPTH_PARAMETERS or "vs30" not in self.__dict__:
+            raise AttributeError(name)
+        if name == "z2pt5_cb07":
+            value = Sites._z2pt5_from_z1pt0_cb07(self.z1pt0_cy08)
+        else:
+            value = Sites._computeDepthParameter(name, self.vs30)
+        setattr(self, name, value)
+        return value
+
+
+class Vs30Cache(object):
+    """
+    An on-disk cache of the Vs30 grids read (and resampled) from a Vs30
+    file by Sites.fromBounds() and Sites.fromCenter(). Each grid is
+    stored as a .npy file (with its GeoDict in a companion .json file)
+    that is memory-mapped when it is retrieved, so a repeated run over
+    the same region skips reading and resampling the Vs30 file.
+
+    Entries are keyed by a checksum of the contents of the Vs30 file
+    and the sampling parameters (bounds, resolution, resampling method,
+    and padding). The least recently used entries are removed when the
+    total size of the cache exceeds max_size.
+    """
+
+    # The name of the file holding the checksums of the Vs30 files
+    CHECKSUM_FILE = "checksums.json"
+
+    def __init__(self, directory, max_size=2000.0):
+        """
+        Construct a Vs30Cache object.
+
+        Args:
+            directory (str): The (existing) directory that holds the
+                cached grids.
+            max_size (float): The maximum size (in megabytes) of the
+                cache.
+        """
+        self._directory = directory
+        self._max_bytes = int(max_size * 1024 * 1024)
+
+    def getKey(self, vs30File, geodict, resample, method, padding, padValue):
+        """
+        Get the key of the grid sampled from a Vs30 file.
+
+        Args:
+            vs30File (str): The Vs30 file.
+            geodict (GeoDict): The sampling GeoDict.
+            resample (bool): Whether or not the grid is resampled.
+            method (str): The resampling method.
+            padding (bool): Whether or not the grid is padded.
+            padValue (float): The value used for padding.
+
+        Returns:
+            str: The key.
+        """
+        params = [
+            self._getChecksum(vs30File),
+            float(geodict.xmin),
+            float(geodict.xmax),
+            float(geodict.ymin),
+            float(geodict.ymax),
+            float(geodict.dx),
+            float(geodict.dy),
+            bool(resample),
+            method,
+            bool(padding),
+            float(padValue),
+        ]
+        return hashlib.sha1(json.dumps(params).encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Get a grid from the cache.
+
+        Args:
+            key (str): The key of the grid (from getKey()).
+
+        Returns:
+            Grid2D: The grid, with its data memory-mapped (read-only), or
+            None if the grid is not in the cache.
+        """
+        npyfile, jsonfile = self._getPaths(key)
+        if not os.path.isfile(npyfile):
+            return None
+        try:
+            with open(jsonfile, "r") as f:
+                geodict = GeoDict(json.load(f))
+            data = np.load(npyfile, mmap_mode="r")
+        except Exception:
+            # A partial or corrupted entry; treat it as a miss
+            self._remove(key)
+            return None
+        # Touch the entry to mark it as recently used
+        os.utime(npyfile)
+        return Grid2D(data, geodict)
+
+    def put(self, key, grid):
+        """
+        Add a grid to the cache, and remove the least recently used
+        entries if the cache is over its size limit. Grids that are
+        larger than the limit are not cached.
+
+        Args:
+            key (str): The key of the grid (from getKey()).
+            grid (Grid2D): The grid.
+
+        Returns:
+            nothing
+        """
+        data = np.ascontiguousarray(grid.getData())
+        if data.nbytes > self._max_bytes:
+            return
+        npyfile, jsonfile = self._getPaths(key)
+        # Write to temporary files and move them into place so that
+        # other processes never see a partial entry; the .npy file is
+        # moved last because it marks the entry as complete.
+        gd = grid.getGeoDict()
+        gdjson = json.dumps(
+            {
+                "xmin": float(gd.xmin),
+                "xmax": float(gd.xmax),
+                "ymin": float(gd.ymin),
+                "ymax": float(gd.ymax),
+                "dx": float(gd.dx),
+                "dy": float(gd.dy),
+                "nx": int(gd.nx),
+                "ny": int(gd.ny),
+            }
+        )
+        self._writeAtomic(jsonfile, lambda f: f.write(gdjson.encode()))
+        self._writeAtomic(npyfile, lambda f: np.save(f, data))
+        self._evict(keep=key)
+
+    def _getPaths(self, key):
+        base = os.path.join(self._directory, key)
+        return base + ".npy", base + ".json"
+
+    def _writeAtomic(self, filename, writer):
+        fd, tmpfile = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                writer(f)
+            os.replace(tmpfile, filename)
+        except Exception:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            raise
+
+    def _remove(self, key):
+        for filename in self._getPaths(key):
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def _evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache is
+        within its size limit. The entry 'keep' is never removed.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self._directory):
+            if not entry.name.endswith(".npy"):
+                continue
+            key = entry.name[:-4]
+            try:
+                stat = entry.stat()
+                size = stat.st_size + os.path.getsize(self._getPaths(key)[1])
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, key, size))
+            total += size
+        for _, key, size in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            if key == keep:
+                continue
+            self._remove(key)
+            total -= size
+
+    def _getChecksum(self, vs30File):
+        """
+        Get the SHA-1 checksum of the contents of a Vs30 file. Because
+        Vs30 files can be large, checksums are kept in the cache
+        directory (by path, size, and modification time) and are only
+        recomputed when a file changes.
+        """
+        path = os.path.realpath(vs30File)
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        checkfile = os.path.join(self._directory, self.CHECKSUM_FILE)
+        try:
+            with open(checkfile, "r") as f:
+                checksums = json.load(f)
+        except Exception:
+            checksums = {}
+        if path in checksums and checksums[path][0] == stamp:
+            return checksums[path][1]
+        sha = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 24), b""):
+                sha.update(chunk)
+        checksums[path] = [stamp, sha.hexdigest()]
+        self._writeAtomic(checkfile, lambda f: f.write(json.dumps(checksums).encode()))
+        return checksums[path][1]
+
+
+class TiledVs30(object):
+    """
+    A Vs30 grid stored as square tiles in a memory-mapped .npy file (with
+    its GeoDict and tile size in a companion .json file). Sampling the
+    grid for a region or a set of points only reads the tiles that are
+    touched, so a continental or global Vs30 grid can be used without
+    reading the whole file at the start of every run. Use
+    TiledVs30.write() (or utils/vs30_tiles.py) to convert a GMT or GDAL
+    format Vs30 file.
+    """
+
+    def __init__(self, filename):
+        """
+        Open a tiled Vs30 file.
+
+        Args:
+            filename (str): The .npy file written by TiledVs30.write().
+        """
+        self._tiles = np.load(filename, mmap_mode="r")
+        with open(self._getJsonName(filename), "r") as f:
+            meta = json.load(f)
+        self._tile_size = meta.pop("tile_size")
+        self._geodict = GeoDict(meta)
+        self._is_global = np.isclose(self._geodict.nx * self._geodict.dx, 360.0)
+
+    @staticmethod
+    def _getJsonName(filename):
+        return os.path.splitext(filename)[0] + ".json"
+
+    @staticmethod
+    def isTiled(filename):
+        """
+        Check if a file is a tiled Vs30 file.
+
+        Args:
+            filename (str): The file name.
+
+        Returns:
+            bool: True if the file is a tiled Vs30 file, False otherwise.
+        """
+        return filename.endswith(".npy") and os.path.isfile(
+            TiledVs30._getJsonName(filename)
+        )
+
+    @staticmethod
+    def write(vs30File, filename, tile_size=256):
+        """
+        Convert a GMT or GDAL format Vs30 file to a tiled Vs30 file. The
+        input file is read one row of tiles at a time.
+
+        Args:
+            vs30File (str): The Vs30 file to convert.
+            filename (str): The name of the tiled (.npy) file to write.
+            tile_size (int): The width and height (in cells) of the tiles.
+
+        Returns:
+            nothing
+        """
+        fgd = get_file_geodict(vs30File)
+        nty = -(-fgd.ny // tile_size)
+        ntx = -(-fgd.nx // tile_size)
+        tiles = None
+        for ty in range(nty):
+            row0 = ty * tile_size
+            row1 = min(row0 + tile_size, fgd.ny) - 1
+            stripgd = GeoDict(
+                {
+                    "xmin": fgd.xmin,
+                    "xmax": fgd.xmax,
+                    "ymin": fgd.ymax - row1 * fgd.dy,
+                    "ymax": fgd.ymax - row0 * fgd.dy,
+                    "dx": fgd.dx,
+                    "dy": fgd.dy,
+                    "nx": fgd.nx,
+                    "ny": row1 - row0 + 1,
+                }
+            )
+            strip = read(vs30File, samplegeodict=stripgd, resample=False).getData()
+            if tiles is None:
+                dtype = np.result_type(strip.dtype, np.float32)
+                tiles = np.lib.format.open_memmap(
+                    filename,
+                    mode="w+",
+                    dtype=dtype,
+                    shape=(nty, ntx, tile_size, tile_size),
+                )
+            padded = np.full((tile_size, ntx * tile_size), np.nan, dtype=tiles.dtype)
+            padded[: strip.shape[0], : strip.shape[1]] = strip
+            tiles[ty] = padded.reshape(tile_size, ntx, tile_size).swapaxes(0, 1)
+        tiles.flush()
+        del tiles
+        meta = {
+            "xmin": float(fgd.xmin),
+            "xmax": float(fgd.xmax),
+            "ymin": float(fgd.ymin),
+            "ymax": float(fgd.ymax),
+            "dx": float(fgd.dx),
+            "dy": float(fgd.dy),
+            "nx": int(fgd.nx),
+            "ny": int(fgd.ny),
+            "tile_size": int(tile_size),
+        }
+        with open(TiledVs30._getJsonName(filename), "w") as f:
+            json.dump(meta, f)
+
+    def getGeoDict(self):
+        """
+        Returns: The GeoDict of the (untiled) Vs30 grid.
+        """
+        return self._geodict
+
+    def _getLonOffsets(self, lons):
+        offsets = lons - self._geodict.xmin
+        if self._is_global:
+            offsets = offsets % 360.0
+        return offsets
+
+    def _getValidIndices(self, rows, cols):
+        valid = (rows >= 0) & (rows < self._geodict.ny)
+        if self._is_global:
+            cols = cols % self._geodict.nx
+        else:
+            valid &= (cols >= 0) & (cols < self._geodict.nx)
+        return valid, cols
+
+    def getValue(self, lats, lons, default=np.nan):
+        """
+        Get the Vs30 of the grid cells nearest to a set of points.
+
+        Args:
+            lats (ndarray): The latitudes of the points.
+            lons (ndarray): The longitudes of the points.
+            default (float): The value for points outside of the grid.
+
+        Returns:
+            ndarray: The Vs30 values, in the shape of lats.
+        """
+        lats = np.asarray(lats)
+        lons = np.asarray(lons)
+        gd = self._geodict
+        rows = np.round((gd.ymax - lats) / gd.dy).astype(int)
+        cols = np.round(self._getLonOffsets(lons) / gd.dx).astype(int)
+        valid, cols = self._getValidIndices(rows, cols)
+        values = np.full(lats.shape, default, dtype=self._tiles.dtype)
+        rows = rows[valid]
+        cols = cols[valid]
+        ts = self._tile_size
+        values[valid] = self._tiles[rows // ts, cols // ts, rows % ts, cols % ts]
+        return values
+
+    def read(self, samplegeodict, resample=False, method="linear", padValue=np.nan):
+        """
+        Read the part of the grid that covers a GeoDict.
+
+        Args:
+            samplegeodict (GeoDict): The region to read. If resample is
+                False, it must be aligned with the grid.
+            resample (bool): Whether or not to resample the grid to
+                samplegeodict.
+            method (str): The resampling method ("nearest", "linear", or
+                "cubic").
+            padValue (float): The value of cells outside of the grid.
+
+        Returns:
+            Grid2D: The grid.
+        """
+        gd = self._geodict
+        xoff = self._getLonOffsets(samplegeodict.xmin)
+        yoff = gd.ymax - samplegeodict.ymax
+        if resample:
+            # Read a margin of one cell around the region for interpolation
+            xend = xoff + (samplegeodict.nx - 1) * samplegeodict.dx
+            yend = yoff + (samplegeodict.ny - 1) * samplegeodict.dy
+            col0 = int(np.floor(xoff / gd.dx)) - 1
+            row0 = int(np.floor(yoff / gd.dy)) - 1
+            ncols = int(np.ceil(xend / gd.dx)) + 2 - col0
+            nrows = int(np.ceil(yend / gd.dy)) + 2 - row0
+        else:
+            col0 = int(np.round(xoff / gd.dx))
+            row0 = int(np.round(yoff / gd.dy))
+            ncols = samplegeodict.nx
+            nrows = samplegeodict.ny
+        rows = np.arange(row0, row0 + nrows)
+        cols = np.arange(col0, col0 + ncols)
+        vrows, _ = self._getValidIndices(rows, np.zeros_like(rows))
+        vcols, cols = self._getValidIndices(np.zeros_like(cols), cols)
+        rows = rows[vrows]
+        cols = cols[vcols]
+        ts = self._tile_size
+        data = np.full((nrows, ncols), padValue, dtype=self._tiles.dtype)
+        data[np.ix_(vrows, vcols)] = self._tiles[
+            (rows // ts)[:, None],
+            (cols // ts)[None, :],
+            (rows % ts)[:, None],
+            (cols % ts)[None, :],
+        ]
+        xmin = samplegeodict.xmin - xoff + col0 * gd.dx
+        xmax = xmin + (ncols - 1) * gd.dx
+        if xmax > 180.0:
+            xmax -= 360.0
+        ymax = gd.ymax - row0 * gd.dy
+        wgd = GeoDict(
+            {
+                "xmin": xmin,
+                "xmax": xmax,
+                "ymin": ymax - (nrows - 1) * gd.dy,
+                "ymax": ymax,
+                "dx": gd.dx,
+                "dy": gd.dy,
+                "nx": ncols,
+                "ny": nrows,
+            }
+        )
+        grid = Grid2D(data, wgd)
+        if resample:
+            grid = grid.interpolateToGrid(samplegeodict, method=method)
+        return grid
@@ -1,6 +1,7 @@
 #cython: language_level=3
 import numpy as np
 cimport cython
+from cython cimport floating
 from cython.parallel import prange
 from libc.math cimport (sqrt,
                         cos,
@@ -130,18 +131,71 @@ def eval_lb_correlation(double[:, ::1]b1, double[:, ::1]b2, double[:, ::1]b3,
     return h
 
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def make_lb_sigma_matrix(double[::1]lons1, double[::1]lats1,
+                         double[::1]c1, double[::1]c2, double[::1]c3,
+                         double[::1]sdsta,
+                         double[::1]lons2, double[::1]lats2,
+                         double[::1]sdarr, floating[:, ::1]result):
+    # The fused equivalent of geodetic_distance_fast(), eval_lb_correlation()
+    # and make_sigma_matrix() for the points 1 (the stations) and the
+    # points 2 (the output points), where all of the points 2 are at a
+    # single period. c1, c2, and c3 are the Loth-Baker coefficients for
+    # each of the points 1 at that period. Each row of the result is
+    # finished in one pass, without the intermediate distance and
+    # correlation matrices or the period index arrays. The result may be
+    # single or double precision; the computations are done in double
+    # precision in either case.
+    cdef double EARTH_RADIUS = 6371.
+    cdef Py_ssize_t nx = lons1.shape[0]
+    cdef Py_ssize_t ny = lons2.shape[0]
+
+    cdef double lon2, lat2, sdval, hval, rho, tmp, u, u2, cos2, sin2
+    cdef floating *res
+    cdef Py_ssize_t x, y
+    # exp(-3h/20) = u**7 and exp(-3h/70) = u**2, where u = exp(-3h/140),
+    # so only one exponential is needed per element
+    cdef double ufact = -3.0 / 140.0
+    # cos(0.5 * (lat1 + lat2)) is expanded so that the trig functions
+    # are only evaluated once per point
+    cdef double[::1] cos1 = np.cos(0.5 * np.asarray(lats1))
+    cdef double[::1] sin1 = np.sin(0.5 * np.asarray(lats1))
+
+    for y in prange(ny, nogil=True, schedule=dynamic):
+        res = &result[y, 0]
+        lon2 = lons2[y]
+        lat2 = lats2[y]
+        cos2 = cos(0.5 * lat2)
+        sin2 = sin(0.5 * lat2)
+        sdval = sdarr[y]
+        for x in range(nx):
+            hval = (EARTH_RADIUS *
+                    sqrt(((lons1[x] - lon2) *
+                        (cos1[x] * cos2 - sin1[x] * sin2))**2 +
+                        (lats1[x] - lat2)**2))
+            u = exp(hval * ufact)
+            u2 = u * u
+            rho = c1[x] * (u2 * u2 * u2 * u) + c2[x] * u2
+            if hval == 0:
+                rho = rho + c3[x]
+            tmp = sdsta[x] * sdval
+            res[x] = rho * tmp
+    return
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 def make_sd_array(double[:, ::1]sdgrid, double[:, ::1]pout_sd2, long iy,
-                  double[:, ::1]rcmatrix, double[:, ::1]sigma12):
+                  floating[:, ::1]rcmatrix, floating[:, ::1]sigma12):
     cdef Py_ssize_t nx = rcmatrix.shape[1]
     cdef Py_ssize_t ny = rcmatrix.shape[0]
 
     cdef double tmp
     cdef double *sdg = &sdgrid[iy, 0]
     cdef double *pop = &pout_sd2[iy, 0]
-    cdef double *rcp
-    cdef double *sgp
+    cdef floating *rcp
+    cdef floating *sgp
     cdef Py_ssize_t x, y
 
     for y in prange(ny, nogil=True):
@@ -149,7 +203,7 @@ def make_sd_array(double[:, ::1]sdgrid, double[:, ::1]pout_sd2, long iy,
         sgp = &sigma12[y, 0]
         tmp = 0
         for x in range(nx):
-            tmp = tmp + rcp[x] * sgp[x]
+            tmp = tmp + <double>rcp[x] * sgp[x]
         sdg[y] = pop[y] - tmp
         if sdg[y] < 0:
             sdg[y] = 0
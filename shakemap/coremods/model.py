@@ -6,8 +6,10 @@ shake_data.hdf, and produce output in shake_result.hdf.
 import argparse
 import concurrent.futures as cf
 import copy
+import hashlib
 import inspect
 import json
+import math
 import os
 import os.path
 import shutil
@@ -30,18 +32,43 @@ from mapio.grid2d import Grid2D
 from openquake.hazardlib import imt
 
 # local imports
-from shakelib.directivity.rowshandel2013 import Rowshandel2013
-from shakelib.multigmpe import MultiGMPE
-from shakelib.sites import Sites
+from shakelib.directivity.rowshandel2013 import Rowshandel2013, RuptureGeometry
+from shakelib.multigmpe import (
+    MultiGMPE,
+    get_multigmpe_cache_stats,
+    set_site_factor_cache,
+)
+from shakelib.multiutils import get_segments, merge_contexts, split_results
+from shakelib.sites import Sites, Vs30Cache
 from shakelib.utils.containers import ShakeMapInputContainer
 from shakelib.utils.imt_string import oq_to_file
 from shakelib.utils.utils import get_extent, thirty_sec_max, thirty_sec_min
 from shakelib.virtualipe import VirtualIPE
 from shakemap._version import get_versions
-from shakemap.c.clib import geodetic_distance_fast, make_sd_array, make_sigma_matrix
+from shakemap.c.clib import make_sigma_matrix
 from shakemap.coremods.base import Contents, CoreModule
 from shakemap.utils.config import get_config_paths
-from shakemap.utils.generic_amp import get_generic_amp_factors
+from shakemap.utils.generic_amp import (
+    get_generic_amp_factors,
+    get_generic_amp_factors_cached,
+)
+from shakemap.utils.mvn import (
+    MVN_TIMERS,
+    MVNJob,
+    MVNStationData,
+    SparseStationCovariance,
+    StationCorrelation,
+    apply_inverse,
+    check_precision,
+    get_blocks,
+    get_local_tile_shape,
+    get_tile_shape,
+    invert_covariance,
+    iter_tiles,
+    make_output_array,
+    mvn_block,
+    run_mvn_block,
+)
 from shakemap.utils.utils import get_object_from_config
 from shapely.geometry import shape
 
@@ -105,6 +132,7 @@ class ModelModule(CoreModule):
         # in the _fillDataArrays method
         #
         self.sta_per_ix = {}
+        self.sta_ix = {}  # indices of the stations in all_sta_lons_rad, etc.
         self.sta_lons_rad = {}
         self.sta_lats_rad = {}
         self.sta_resids = {}
@@ -130,6 +158,15 @@ class ModelModule(CoreModule):
         self.len_types = {}
         self.imt_Y_ind = {}
         #
+        # The merged sites and distance contexts (see _mergeContexts())
+        #
+        self._merged_contexts = {}
+        #
+        # The generic amplification factors at the output points, by
+        # IMT (see _setOutputGAFs())
+        #
+        self.gaf_out = {}
+        #
         # These hold the main outputs of the MVN
         #
         self.outgrid = {}  # Holds the interpolated output arrays keyed by IMT
@@ -202,6 +239,23 @@ class ModelModule(CoreModule):
             NotADirectoryError: When the event data directory does not exist.
             FileNotFoundError: When the the shake_data HDF file does not exist.
         """
+        # ---------------------------------------------------------------------
+        # The site factors of the GMPEs without site terms are cached
+        # until the MVN is done (see _run()); the cache is also disabled
+        # if the run fails, so that it is not left enabled for the rest
+        # of the process
+        # ---------------------------------------------------------------------
+        set_site_factor_cache(True)
+        try:
+            self._run()
+        finally:
+            set_site_factor_cache(False)
+            self._merged_contexts = {}
+
+    def _run(self):
+        """
+        Do the work of execute().
+        """
         self.logger.debug("Starting model...")
         # ---------------------------------------------------------------------
         # Make the input container and extract the config
@@ -316,6 +370,13 @@ class ModelModule(CoreModule):
         self.logger.debug("Setting output params...")
         self._setOutputParams()
 
+        # ---------------------------------------------------------------------
+        # The generic amplification factors at the output points
+        # ---------------------------------------------------------------------
+        if self.apply_gafs:
+            self.logger.debug("Setting output generic amplification factors...")
+            self._setOutputGAFs()
+
         landmask = self._getLandMask()
         # We used to do this, but we've decided not to. Leaving the code
         # in place in case we change our minds.
@@ -350,20 +411,30 @@ class ModelModule(CoreModule):
 
         if dir_conf and rup_check:
             self.do_directivity = True
-            # The following attribute will be used to store a list of tuples,
-            # where each tuple will contain the 1) result of the directivity
-            # model (for the periods defined by Rowshandel2013) and 2) the
-            # associated distance context. The distance context is needed
-            # within the _gmas function for figuring out which of the results
-            # should be used when combining it with the GMPE result. We store
+            # The following attribute will be used to store a dictionary of
+            # tuples, where each tuple will contain the 1) result (fd) of the
+            # directivity model (for the periods defined by Rowshandel2013)
+            # and 2) the associated distance context. It is keyed by the id
+            # of the distance context, which _adjustPrediction uses to find
+            # the result to combine with the GMPE result (the context is
+            # kept so that its id stays valid; see _addDirectivity). We store
             # the pre-defined period first and interpolate later because there
             # is some optimization to doing it this way (some of the
             # calculation is period independent).
-            self.dir_results = []
+            self.dir_results = {}
+            # The fd interpolated to each IMT, keyed by (distance context
+            # id, IMT string); these are made on first use (see
+            # _getDirectivity).
+            self.dir_fd = {}
             # But if we want to save the results that were actually used for
             # each IMT, so we use a dictionary. This uses keys that are
             # the same as self.outgrid.
             self.dir_output = {}
+            # The site-independent parts of the directivity model are
+            # computed once and shared by all of the directivity results.
+            self.dir_geometry = RuptureGeometry(
+                self.rupture_obj._origin, self.rupture_obj, dx=1.0
+            )
         else:
             self.do_directivity = False
 
@@ -438,14 +509,23 @@ class ModelModule(CoreModule):
         # Now do the MVN with the intra-event residuals
         # ---------------------------------------------------------------------
         self.logger.debug("Doing MVN...")
+        self._setMVNScratchDir()
         if self.max_workers > 0:
-            with cf.ThreadPoolExecutor(max_workers=self.max_workers) as ex:
-                results = ex.map(self._computeMVN, self.imt_out_set)
-                list(results)  # Check threads for possible exceptions, etc.
+            self._computeMVNParallel()
         else:
             for imt_str in self.imt_out_set:
                 self._computeMVN(imt_str)
 
+        set_site_factor_cache(False)
+        self._merged_contexts = {}
+
+        stats = get_multigmpe_cache_stats()
+        self.logger.debug(
+            f"MultiGMPE cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"(hit rate {stats['hit_rate']:.2f}), construction time "
+            f"{stats['construction_time']:f}"
+        )
+
         self._applyCustomMask()
 
         # ---------------------------------------------------------------------
@@ -502,6 +582,9 @@ class ModelModule(CoreModule):
         oc.close()
         self.ic.close()
 
+        if self.mvn_scratch_dir is not None:
+            shutil.rmtree(self.mvn_scratch_dir, ignore_errors=True)
+
         self.contents.addFile(
             "shakemapHDF",
             "Comprehensive ShakeMap HDF Data File",
@@ -511,7 +594,7 @@ class ModelModule(CoreModule):
         )
 
     # -------------------------------------------------------------------------
-    # End execute()
+    # End _run()
     # -------------------------------------------------------------------------
 
     def _setInputContainer(self):
@@ -577,6 +660,14 @@ class ModelModule(CoreModule):
         self.bias_max_mag = self.config["modeling"]["bias"]["max_mag"]
         self.bias_max_dsigma = self.config["modeling"]["bias"]["max_delta_sigma"]
 
+        # ---------------------------------------------------------------------
+        # MVN parameters
+        # ---------------------------------------------------------------------
+        self.mvn_max_memory = self.config["modeling"]["mvn"]["max_memory"]
+        self.mvn_cutoff_distance = self.config["modeling"]["mvn"]["cutoff_distance"]
+        self.mvn_nearest_k = self.config["modeling"]["mvn"]["nearest_k"]
+        self.mvn_precision = self.config["modeling"]["mvn"]["precision"]
+
         # ---------------------------------------------------------------------
         # Outlier parameters
         # ---------------------------------------------------------------------
@@ -604,10 +695,53 @@ class ModelModule(CoreModule):
         self.vs30_file = self.config["data"]["vs30file"]
         if not self.vs30_file:
             self.vs30_file = None
+        vs30_cache_dir = self.config["data"]["vs30_cache"]["directory"]
+        if self.vs30_file is not None and vs30_cache_dir:
+            self.vs30_cache = Vs30Cache(
+                vs30_cache_dir, self.config["data"]["vs30_cache"]["max_size"]
+            )
+        else:
+            self.vs30_cache = None
         self.mask_file = self.config["data"]["maskfile"]
         if not self.mask_file:
             self.mask_file = None
 
+    def _setMVNScratchDir(self):
+        """
+        If the MVN has been given a memory budget, or is to be run in
+        parallel, make the directory that will hold the disk-backed output
+        arrays. The directory is inside the products directory so that it
+        will be cleaned up by _clearProducts() if a run fails before it is
+        removed.
+
+        Returns:
+            nothing
+        """
+        if self.mvn_max_memory <= 0 and self.max_workers <= 0:
+            self.mvn_scratch_dir = None
+            return
+        self.mvn_scratch_dir = os.path.join(self.datadir, "products", "mvn_scratch")
+        os.makedirs(self.mvn_scratch_dir, exist_ok=True)
+
+    def _setOutputGAFs(self):
+        """
+        Compute the generic amplification factors at the output points
+        for each of the output IMTs, so that the predictions for the
+        output points only need to add them. The factors are saved in
+        the event's 'gaf_cache' directory, from which they are loaded by
+        later runs of the event with the same output points (and
+        amplification files).
+
+        Returns:
+            nothing
+        """
+        cache_dir = os.path.join(self.datadir, "gaf_cache")
+        os.makedirs(cache_dir, exist_ok=True)
+        for imtstr in self.imt_out_set:
+            gafs = get_generic_amp_factors_cached(self.sx_out, imtstr, cache_dir)
+            if gafs is not None:
+                self.gaf_out[imtstr] = gafs
+
     def _setOutputParams(self):
         """
         Set variables dealing with the output grid or points
@@ -640,6 +774,7 @@ class ModelModule(CoreModule):
                 vs30File=self.vs30_file,
                 padding=True,
                 resample=True,
+                vs30_cache=self.vs30_cache,
             )
             self.smnx, self.smny = self.sites_obj_out.getNxNy()
             self.sx_out = self.sites_obj_out.getSitesContext()
@@ -702,6 +837,7 @@ class ModelModule(CoreModule):
                 vs30File=self.vs30_file,
                 padding=True,
                 resample=True,
+                vs30_cache=self.vs30_cache,
             )
 
             self.sx_out = self.sites_obj_out.getSitesContext(
@@ -741,6 +877,7 @@ class ModelModule(CoreModule):
                 vs30File=self.vs30_file,
                 padding=True,
                 resample=True,
+                vs30_cache=self.vs30_cache,
             )
             self.smnx, self.smny = self.sites_obj_out.getNxNy()
             self.sx_out = self.sites_obj_out.getSitesContext()
@@ -886,8 +1023,10 @@ class ModelModule(CoreModule):
                     T=Rowshandel2013.getPeriods(),
                     a_weight=0.5,
                     mtype=1,
+                    geometry=self.dir_geometry,
+                    taper_cutoff=True,
                 )
-                self.dir_results.append((dir_df, dfn.dx))
+                self._addDirectivity(dir_df, dfn.dx)
                 directivity_time = time.time() - time1
                 self.logger.debug(
                     f"Directivity {dfid} evaluation time: {directivity_time:f} sec"
@@ -897,18 +1036,16 @@ class ModelModule(CoreModule):
             # Do the predictions and other bookkeeping for each IMT
             # -----------------------------------------------------------------
             imt_set = self.imt_out_set | set(dfn.imts)
+            contexts = [
+                (dfn.sx, dfn.dx),
+                (dfn.sx_rock, dfn.dx),
+                (dfn.sx_soil, dfn.dx),
+            ]
+            gmpes = self._getIMTGMPEs([imt.from_string(x) for x in imt_set])
+            predictions = self._gmasMulti(gmpes, contexts, self.apply_gafs)
             for imtstr in imt_set:
                 oqimt = imt.from_string(imtstr)
-                gmpe = None
-                not_supported = False
-                if imtstr != "MMI":
-                    try:
-                        gmpe = MultiGMPE.__from_config__(self.config, filter_imt=oqimt)
-                    except KeyError:
-                        self.logger.warn(
-                            f"Input IMT {imtstr} not supported by GMPE: ignoring"
-                        )
-                        not_supported = True
+                not_supported = imtstr != "MMI" and imtstr not in gmpes
                 if not_supported:
                     pmean = np.full_like(df[imtstr], np.nan)
                     pmean_rock = np.full_like(df[imtstr], np.nan)
@@ -921,16 +1058,18 @@ class ModelModule(CoreModule):
                     pstddev_soil = [None] * 1
                     pstddev_rock[0] = np.full_like(df[imtstr], np.nan)
                     pstddev_soil[0] = np.full_like(df[imtstr], np.nan)
+                elif imtstr == "MMI":
+                    (
+                        (pmean, pstddev),
+                        (pmean_rock, pstddev_rock),
+                        (pmean_soil, pstddev_soil),
+                    ) = self._gmasBatch(None, contexts, oqimt, self.apply_gafs)
                 else:
-                    pmean, pstddev = self._gmas(
-                        gmpe, dfn.sx, dfn.dx, oqimt, self.apply_gafs
-                    )
-                    pmean_rock, pstddev_rock = self._gmas(
-                        gmpe, dfn.sx_rock, dfn.dx, oqimt, self.apply_gafs
-                    )
-                    pmean_soil, pstddev_soil = self._gmas(
-                        gmpe, dfn.sx_soil, dfn.dx, oqimt, self.apply_gafs
-                    )
+                    (
+                        (pmean, pstddev),
+                        (pmean_rock, pstddev_rock),
+                        (pmean_soil, pstddev_soil),
+                    ) = predictions[imtstr]
                 df[imtstr + "_pred"] = pmean
                 df[imtstr + "_pred_sigma"] = pstddev[0]
                 df[imtstr + "_pred_rock"] = pmean_rock
@@ -1038,6 +1177,7 @@ class ModelModule(CoreModule):
             return
 
         df2 = self.df2.df
+        oqimts = []
         for gmice_imt in self.gmice.DEFINED_FOR_INTENSITY_MEASURE_TYPES:
             if imt.SA == gmice_imt:
                 iterlist = self.gmice.DEFINED_FOR_SA_PERIODS
@@ -1045,73 +1185,70 @@ class ModelModule(CoreModule):
                 iterlist = [None]
             for period in iterlist:
                 if period:
-                    oqimt = gmice_imt(period)
+                    oqimts.append(gmice_imt(period))
                 else:
-                    oqimt = gmice_imt()
-                imtstr = str(oqimt)
+                    oqimts.append(gmice_imt())
+        #
+        # Get the predictions and stddevs for all of the IMTs
+        #
+        gmpes = self._getIMTGMPEs(oqimts)
+        predictions = self._gmasMulti(
+            gmpes,
+            [
+                (self.df2.sx, self.df2.dx),
+                (self.df2.sx_rock, self.df2.dx),
+                (self.df2.sx_soil, self.df2.dx),
+            ],
+            self.apply_gafs,
+        )
+        for oqimt in oqimts:
+            imtstr = str(oqimt)
 
-                np.seterr(invalid="ignore")
-                df2[imtstr], _ = self.gmice.getGMfromMI(
-                    df2["MMI"], oqimt, dists=df2["rrup"], mag=self.rx.mag
-                )
-                df2[imtstr][
-                    df2["MMI"] < self.config["data"]["min_mmi_convert"]
-                ] = np.nan
-                np.seterr(invalid="warn")
-                df2[imtstr + "_sd"] = np.full_like(
-                    df2["MMI"], self.gmice.getMI2GMsd()[oqimt]
+            np.seterr(invalid="ignore")
+            df2[imtstr], _ = self.gmice.getGMfromMI(
+                df2["MMI"], oqimt, dists=df2["rrup"], mag=self.rx.mag
+            )
+            df2[imtstr][df2["MMI"] < self.config["data"]["min_mmi_convert"]] = np.nan
+            np.seterr(invalid="warn")
+            df2[imtstr + "_sd"] = np.full_like(
+                df2["MMI"], self.gmice.getMI2GMsd()[oqimt]
+            )
+            self.df2.imts.add(imtstr)
+            if imtstr not in gmpes:
+                pmean = np.full_like(df2["MMI"], np.nan)
+                pstddev = [None] * 3
+                pstddev[0] = np.full_like(df2["MMI"], np.nan)
+                pstddev[1] = np.full_like(df2["MMI"], np.nan)
+                pstddev[2] = np.full_like(df2["MMI"], np.nan)
+            else:
+                (
+                    (pmean, pstddev),
+                    (pmean_rock, pstddev_rock),
+                    (pmean_soil, pstddev_soil),
+                ) = predictions[imtstr]
+            df2[imtstr + "_pred"] = pmean
+            df2[imtstr + "_pred_sigma"] = pstddev[0]
+            df2[imtstr + "_pred_rock"] = pmean_rock
+            df2[imtstr + "_pred_sigma_rock"] = pstddev_rock[0]
+            df2[imtstr + "_pred_soil"] = pmean_soil
+            df2[imtstr + "_pred_sigma_soil"] = pstddev_soil[0]
+            if imtstr != "MMI":
+                total_only = self.gmpe_total_sd_only
+                tau_guess = SM_CONSTS["default_stddev_inter"]
+            else:
+                total_only = self.ipe_total_sd_only
+                tau_guess = SM_CONSTS["default_stddev_inter_mmi"]
+            if total_only:
+                df2[imtstr + "_pred_tau"] = tau_guess * pstddev[0]
+                df2[imtstr + "_pred_phi"] = np.sqrt(
+                    pstddev[0] ** 2 - df2[imtstr + "_pred_tau"] ** 2
                 )
-                self.df2.imts.add(imtstr)
-                #
-                # Get the predictions and stddevs
-                #
-                not_supported = False
-                try:
-                    gmpe = MultiGMPE.__from_config__(self.config, filter_imt=oqimt)
-                except KeyError:
-                    self.logger.warn(
-                        f"Input IMT {imtstr} not supported by GMPE: ignoring"
-                    )
-                    not_supported = True
-                if not_supported:
-                    pmean = np.full_like(df2["MMI"], np.nan)
-                    pstddev = [None] * 3
-                    pstddev[0] = np.full_like(df2["MMI"], np.nan)
-                    pstddev[1] = np.full_like(df2["MMI"], np.nan)
-                    pstddev[2] = np.full_like(df2["MMI"], np.nan)
-                else:
-                    pmean, pstddev = self._gmas(
-                        gmpe, self.df2.sx, self.df2.dx, oqimt, self.apply_gafs
-                    )
-                    pmean_rock, pstddev_rock = self._gmas(
-                        gmpe, self.df2.sx_rock, self.df2.dx, oqimt, self.apply_gafs
-                    )
-                    pmean_soil, pstddev_soil = self._gmas(
-                        gmpe, self.df2.sx_soil, self.df2.dx, oqimt, self.apply_gafs
-                    )
-                df2[imtstr + "_pred"] = pmean
-                df2[imtstr + "_pred_sigma"] = pstddev[0]
-                df2[imtstr + "_pred_rock"] = pmean_rock
-                df2[imtstr + "_pred_sigma_rock"] = pstddev_rock[0]
-                df2[imtstr + "_pred_soil"] = pmean_soil
-                df2[imtstr + "_pred_sigma_soil"] = pstddev_soil[0]
-                if imtstr != "MMI":
-                    total_only = self.gmpe_total_sd_only
-                    tau_guess = SM_CONSTS["default_stddev_inter"]
-                else:
-                    total_only = self.ipe_total_sd_only
-                    tau_guess = SM_CONSTS["default_stddev_inter_mmi"]
-                if total_only:
-                    df2[imtstr + "_pred_tau"] = tau_guess * pstddev[0]
-                    df2[imtstr + "_pred_phi"] = np.sqrt(
-                        pstddev[0] ** 2 - df2[imtstr + "_pred_tau"] ** 2
-                    )
-                else:
-                    df2[imtstr + "_pred_tau"] = pstddev[1]
-                    df2[imtstr + "_pred_phi"] = pstddev[2]
-                df2[imtstr + "_residual"] = df2[imtstr] - pmean
-                df2[imtstr + "_outliers"] = np.isnan(df2[imtstr + "_residual"])
-                df2[imtstr + "_outliers"] |= df2["MMI_outliers"]
+            else:
+                df2[imtstr + "_pred_tau"] = pstddev[1]
+                df2[imtstr + "_pred_phi"] = pstddev[2]
+            df2[imtstr + "_residual"] = df2[imtstr] - pmean
+            df2[imtstr + "_outliers"] = np.isnan(df2[imtstr + "_residual"])
+            df2[imtstr + "_outliers"] |= df2["MMI_outliers"]
 
     def _deriveMMIFromIMTs(self):
         """
@@ -1171,14 +1308,19 @@ class ModelModule(CoreModule):
         # Get the prediction and stddevs
         #
         gmpe = None
-        pmean, pstddev = self._gmas(
-            gmpe, self.df1.sx, self.df1.dx, imt.from_string("MMI"), self.apply_gafs
-        )
-        pmean_rock, pstddev_rock = self._gmas(
-            gmpe, self.df1.sx_rock, self.df1.dx, imt.from_string("MMI"), self.apply_gafs
-        )
-        pmean_soil, pstddev_soil = self._gmas(
-            gmpe, self.df1.sx_soil, self.df1.dx, imt.from_string("MMI"), self.apply_gafs
+        (
+            (pmean, pstddev),
+            (pmean_rock, pstddev_rock),
+            (pmean_soil, pstddev_soil),
+        ) = self._gmasBatch(
+            gmpe,
+            [
+                (self.df1.sx, self.df1.dx),
+                (self.df1.sx_rock, self.df1.dx),
+                (self.df1.sx_soil, self.df1.dx),
+            ],
+            imt.from_string("MMI"),
+            self.apply_gafs,
         )
         df1["MMI" + "_pred"] = pmean
         df1["MMI" + "_pred_sigma"] = pstddev[0]
@@ -1212,6 +1354,25 @@ class ModelModule(CoreModule):
             if df is None:
                 continue
             imtsets[ndf], sasets[ndf] = _get_imt_lists(df)
+        #
+        # The coordinates of all of the stations, in the order of df1
+        # then df2, so that computations involving only the station
+        # locations may be shared by the IMTs
+        #
+        all_lons_rad = []
+        all_lats_rad = []
+        for ndf in ("df1", "df2"):
+            tdf = getattr(self, ndf, None)
+            if tdf is None:
+                continue
+            all_lons_rad.append(np.asarray(tdf.df["lon_rad"], dtype=np.float64))
+            all_lats_rad.append(np.asarray(tdf.df["lat_rad"], dtype=np.float64))
+        if all_lons_rad:
+            self.all_sta_lons_rad = np.concatenate(all_lons_rad)
+            self.all_sta_lats_rad = np.concatenate(all_lats_rad)
+        else:
+            self.all_sta_lons_rad = np.array([], dtype=np.float64)
+            self.all_sta_lats_rad = np.array([], dtype=np.float64)
 
         for imtstr in self.imt_out_set:
             #
@@ -1228,6 +1389,8 @@ class ModelModule(CoreModule):
             sig_extra = []  # Additional stddev of the input IMT
             rrups = []  # The rupture distance of the input station
             per_ix = []
+            sta_ix = []  # The index of the station in all_sta_lons_rad, etc.
+            offset = 0
             for ndf in ("df1", "df2"):
                 tdf = getattr(self, ndf, None)
                 if tdf is None:
@@ -1241,6 +1404,7 @@ class ModelModule(CoreModule):
                         imtstr, imtsets[ndf][i], sasets[ndf][i]
                     ):
                         per_ix.append(self.imt_per_ix[imtin])
+                        sta_ix.append(offset + i)
                         lons_rad.append(sdf["lon_rad"][i])
                         lats_rad.append(sdf["lat_rad"][i])
                         resids.append(sdf[imtin + "_residual"][i])
@@ -1248,8 +1412,10 @@ class ModelModule(CoreModule):
                         phi.append(sdf[imtin + "_pred_phi"][i])
                         sig_extra.append(sdf[imtin + "_sd"][i])
                         rrups.append(sdf["rrup"][i])
+                offset += np.size(sdf["lon"])
 
             self.sta_per_ix[imtstr] = np.array(per_ix)
+            self.sta_ix[imtstr] = np.array(sta_ix, dtype=np.int_)
             self.sta_lons_rad[imtstr] = np.array(lons_rad)
             self.sta_lats_rad[imtstr] = np.array(lats_rad)
             if self.flip_lons:
@@ -1264,6 +1430,23 @@ class ModelModule(CoreModule):
         """
         Compute a bias for all of the IMTs in the outputs
         """
+        #
+        # Output IMTs that are conditioned on the same set of observations
+        # have the same station covariance matrix, so we only invert it
+        # once
+        #
+        cov_WD_WD_inv_cache = {}
+        #
+        # The station distances and correlations are computed once for
+        # all of the output IMTs
+        #
+        sta_corr = StationCorrelation(
+            self.ccf,
+            self.all_sta_lons_rad,
+            self.all_sta_lats_rad,
+            self.sta_ix,
+            self.sta_per_ix,
+        )
         for imtstr in self.imt_out_set:
             time1 = time.time()
             #
@@ -1361,18 +1544,59 @@ class ModelModule(CoreModule):
             #
             # Make cov_WD_WD_inv (Sigma_22_inv)
             #
-            matrix22 = np.empty((nsta, nsta), dtype=np.double)
-            geodetic_distance_fast(
-                sta_lons_rad, sta_lats_rad, sta_lons_rad, sta_lats_rad, matrix22
+            cov_key = _get_array_key(
+                sta_lons_rad, sta_lats_rad, sta_per_ix, sta_phi, sta_sig_extra
             )
-            ones = np.ones(nsta, dtype=np.int_).reshape((-1, 1))
-            t1_22 = sta_per_ix.reshape((1, -1)) * ones
-            t2_22 = sta_per_ix.reshape((-1, 1)) * ones.T
-            self.ccf.getCorrelation(t1_22, t2_22, matrix22)
-            sta_phi_flat = sta_phi.flatten()
-            make_sigma_matrix(matrix22, sta_phi_flat, sta_phi_flat)
-            np.fill_diagonal(matrix22, np.diag(matrix22) + sta_sig_extra ** 2)
-            cov_WD_WD_inv = np.linalg.pinv(matrix22)
+            if cov_key in cov_WD_WD_inv_cache:
+                cov_WD_WD_inv = cov_WD_WD_inv_cache[cov_key]
+                sta_corr.release(imtstr)
+                self.logger.debug(
+                    f"{imtstr}: reusing station covariance inverse ({nsta} stations)"
+                )
+            elif self.mvn_cutoff_distance > 0:
+                #
+                # Use a sparse covariance matrix in place of the inverse
+                #
+                sta_corr.release(imtstr)
+                time2 = time.time()
+                cov_WD_WD_inv = SparseStationCovariance(
+                    self.ccf,
+                    self.mvn_cutoff_distance,
+                    sta_lons_rad,
+                    sta_lats_rad,
+                    sta_per_ix,
+                    sta_phi,
+                    sta_sig_extra,
+                )
+                self.logger.debug(
+                    "%s: sparse station covariance with %d nonzeros (%d stations, "
+                    "time=%f sec)"
+                    % (imtstr, cov_WD_WD_inv.nnz, nsta, time.time() - time2)
+                )
+                cov_WD_WD_inv_cache[cov_key] = cov_WD_WD_inv
+            else:
+                time2 = time.time()
+                matrix22 = sta_corr.getCorrelation(imtstr)
+                self.logger.debug(
+                    f"{imtstr}: station correlation time={time.time() - time2:f} sec"
+                )
+                sta_phi_flat = sta_phi.flatten()
+                make_sigma_matrix(matrix22, sta_phi_flat, sta_phi_flat)
+                np.fill_diagonal(matrix22, np.diag(matrix22) + sta_sig_extra ** 2)
+                cov_WD_WD_inv, inv_info = invert_covariance(matrix22)
+                self.logger.debug(
+                    "%s: inverted station covariance with %s (cond=%g, jitter=%g, "
+                    "%d stations, time=%f sec)"
+                    % (
+                        imtstr,
+                        inv_info["method"],
+                        inv_info["cond"],
+                        inv_info["jitter"],
+                        nsta,
+                        inv_info["time"],
+                    )
+                )
+                cov_WD_WD_inv_cache[cov_key] = cov_WD_WD_inv
             #
             # Hold on to some things we'll need later
             #
@@ -1381,12 +1605,12 @@ class ModelModule(CoreModule):
             #
             # Compute the bias mu_H_yD and cov_HH_yD pieces
             #
-            cov_HH_yD = np.linalg.pinv(
-                np.linalg.multi_dot([T_D.T, cov_WD_WD_inv, T_D])
+            cov_HH_yD, _ = invert_covariance(
+                np.dot(T_D.T, apply_inverse(cov_WD_WD_inv, T_D))
                 + np.linalg.pinv(corr_HH_D)
             )
             mu_H_yD = np.linalg.multi_dot(
-                [cov_HH_yD, T_D.T, cov_WD_WD_inv, sta_resids_dl]
+                [cov_HH_yD, T_D.T, apply_inverse(cov_WD_WD_inv, sta_resids_dl)]
             )
             if self.do_bias and (
                 not isinstance(self.rupture_obj, PointRupture)
@@ -1439,8 +1663,10 @@ class ModelModule(CoreModule):
                 T=Rowshandel2013.getPeriods(),
                 a_weight=0.5,
                 mtype=1,
+                geometry=self.dir_geometry,
+                taper_cutoff=True,
             )
-            self.dir_results.append((dir_out, self.dx_out))
+            self._addDirectivity(dir_out, self.dx_out)
             # Precompute directivity for the attenuation curves
             dir_out = Rowshandel2013(
                 self.rupture_obj._origin,
@@ -1452,8 +1678,10 @@ class ModelModule(CoreModule):
                 T=Rowshandel2013.getPeriods(),
                 a_weight=0.5,
                 mtype=1,
+                geometry=self.dir_geometry,
+                taper_cutoff=True,
             )
-            self.dir_results.append((dir_out, self.atten_dx))
+            self._addDirectivity(dir_out, self.atten_dx)
             directivity_time = time.time() - time1
             self.logger.debug(
                 f"Directivity prediction evaluation time: {directivity_time:f} sec"
@@ -1463,7 +1691,69 @@ class ModelModule(CoreModule):
 
     def _computeMVN(self, imtstr):
         """
-        Do the MVN computations
+        Do the MVN computations for one output IMT in this process.
+        """
+        job = self._prepareMVN(imtstr)
+        if job is None:
+            return
+        tiles = iter_tiles(self.smnx, self.smny, *job.tile_shape)
+        timers = mvn_block(job, tiles)
+        self._finishMVN(job, timers)
+
+    def _computeMVNParallel(self):
+        """
+        Do the MVN computations for all of the output IMTs in parallel.
+        The predictions for the IMTs are made in a thread pool, then the
+        MVN for each IMT is divided into blocks of rows of the output grid
+        and the blocks of all of the IMTs are run as independent tasks in
+        a process pool. The large inputs are placed in shared memory, and
+        the workers write their results directly into the (memory-mapped)
+        output arrays, so nothing but the job descriptions is copied
+        between processes.
+        """
+        with cf.ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            jobs = [job for job in ex.map(self._prepareMVN, self.imt_out_set) if job]
+        if not jobs:
+            return
+        nblocks = math.ceil(4 * self.max_workers / len(jobs))
+        timers = {job.imtstr: dict.fromkeys(MVN_TIMERS, 0.0) for job in jobs}
+        shared = []
+        try:
+            for job in jobs:
+                shared.extend(job.share())
+            with cf.ProcessPoolExecutor(max_workers=self.max_workers) as ex:
+                futures = [
+                    ex.submit(run_mvn_block, job, tiles)
+                    for job in jobs
+                    for tiles in get_blocks(
+                        self.smnx, self.smny, *job.tile_shape, nblocks
+                    )
+                ]
+                self.logger.debug(
+                    f"computeMVN: running {len(futures)} tasks on "
+                    f"{self.max_workers} processes"
+                )
+                for future in cf.as_completed(futures):
+                    imtstr, block_timers = future.result()
+                    for key, val in block_timers.items():
+                        timers[imtstr][key] += val
+        finally:
+            for sarray in shared:
+                sarray.release()
+        for job in jobs:
+            for output in job.outputs.values():
+                output.flush()
+            self._finishMVN(job, timers[job.imtstr])
+
+    def _prepareMVN(self, imtstr):
+        """
+        Make the predictions for an output IMT and set up the MVN
+        computations.
+
+        Returns:
+            MVNJob: The MVN job for the IMT, or None if there are no
+            data for the IMT (in which case the outputs are the
+            unconditioned predictions, and have already been set).
         """
         self.logger.debug(f"computeMVN: doing IMT {imtstr}")
         time1 = time.time()
@@ -1472,7 +1762,8 @@ class ModelModule(CoreModule):
         #
         outperiod_ix = self.imt_per_ix[imtstr]
         #
-        # Get the predictions at the output points
+        # Get the predictions at the output points and, while we have
+        # the gmpe for this IMT, make the attenuation curves
         #
         oqimt = imt.from_string(imtstr)
         if imtstr != "MMI":
@@ -1480,9 +1771,24 @@ class ModelModule(CoreModule):
         else:
             gmpe = self.ipe
 
-        pout_mean, pout_sd = self._gmas(
-            gmpe, self.sx_out, self.dx_out, oqimt, self.apply_gafs
+        (
+            (pout_mean, pout_sd),
+            (rock_mean, rock_sd),
+            (soil_mean, soil_sd),
+        ) = self._gmasBatch(
+            gmpe,
+            [
+                (self.sx_out, self.dx_out),
+                (self.atten_sx_rock, self.atten_dx),
+                (self.atten_sx_soil, self.atten_dx),
+            ],
+            oqimt,
+            self.apply_gafs,
         )
+        self.atten_rock_mean[imtstr] = rock_mean
+        self.atten_rock_sd[imtstr] = rock_sd[0]
+        self.atten_soil_mean[imtstr] = soil_mean
+        self.atten_soil_sd[imtstr] = soil_sd[0]
         if not self.do_grid:
             self.pred_out[imtstr] = pout_mean
             self.pred_out_sd[imtstr] = pout_sd[0]
@@ -1495,20 +1801,6 @@ class ModelModule(CoreModule):
             else:
                 pout_mean = self.sim_df[imtstr]
         #
-        # While we have the gmpe for this IMT, we should make
-        # the attenuation curves
-        #
-        x_mean, x_sd = self._gmas(
-            gmpe, self.atten_sx_rock, self.atten_dx, oqimt, self.apply_gafs
-        )
-        self.atten_rock_mean[imtstr] = x_mean
-        self.atten_rock_sd[imtstr] = x_sd[0]
-        x_mean, x_sd = self._gmas(
-            gmpe, self.atten_sx_soil, self.atten_dx, oqimt, self.apply_gafs
-        )
-        self.atten_soil_mean[imtstr] = x_mean
-        self.atten_soil_sd[imtstr] = x_sd[0]
-        #
         # Get an array of the within-event standard deviations for the
         # output IMT at the output points
         #
@@ -1543,52 +1835,60 @@ class ModelModule(CoreModule):
                 self.MMI_Sigma_HH_YD = np.array([])
                 self.MMI_C = np.array([])
                 self.MMI_sta_per_ix = np.array([])
-            return
-
-        pout_sd2_phi = np.power(self.psd[imtstr], 2.0)
+            return None
 
         sta_per_ix = self.sta_per_ix[imtstr]
-        sta_phi = self.sta_phi[imtstr]
-        sta_lons_rad = self.sta_lons_rad[imtstr]
-        sta_lats_rad = self.sta_lats_rad[imtstr]
-
-        len_output = np.size(self.tsd[imtstr])
         if self.no_native_flag[imtstr] is False:
-            T_Y0 = np.zeros((len_output, self.len_types[imtstr]))
-            T_Y0[:, np.where(outperiod_ix == self.imt_types[imtstr])[0][0]] = self.tsd[
-                imtstr
-            ].ravel()
+            y_ix = np.where(outperiod_ix == self.imt_types[imtstr])[0][0]
         else:
-            T_Y0 = np.zeros((len_output, self.len_types[imtstr] + 1))
-            T_Y0[:, self.imt_Y_ind[imtstr]] = self.tsd[imtstr].ravel()
-
-        T_D = self.T_D[imtstr]
-        cov_WD_WD_inv = self.cov_WD_WD_inv[imtstr]
-        #
-        # Now do the MVN itself...
-        #
-        dtime = mtime = ddtime = ctime = stime = atime = 0
-
-        C = np.empty_like(T_Y0[0 : self.smnx, :])
-        C_tmp1 = np.empty_like(C)
-        C_tmp2 = np.empty_like(C)
-        s_tmp1 = np.empty((self.smnx), dtype=np.float64).reshape((-1, 1))
-        s_tmp2 = np.empty((self.smnx), dtype=np.float64).reshape((-1, 1))
-        s_tmp3 = np.empty((self.smnx), dtype=np.float64)
-        ampgrid = np.zeros_like(pout_mean)
-        cov_WY_WY_WD = np.zeros_like(pout_mean)
-        sdgrid_tau = np.zeros_like(pout_mean)
-        # Stuff that doesn't change within the loop:
-        lons_out_rad = self.lons_out_rad
-        lats_out_rad = self.lats_out_rad
-        d12_cols = self.smnx
-        ones = np.ones(d12_cols, dtype=np.int_).reshape((-1, 1))
-        t1_12 = sta_per_ix.reshape((1, -1)) * ones
-        t2_12 = np.full((d12_cols, nsta), outperiod_ix, dtype=np.int_)
-        # sdsta is the standard deviation of the stations
-        sdsta_phi = sta_phi.flatten()
-        matrix12_phi = np.empty(t2_12.shape, dtype=np.double)
-        rcmatrix_phi = np.empty(t2_12.shape, dtype=np.double)
+            y_ix = self.imt_Y_ind[imtstr]
+        stadata = MVNStationData(
+            self.ccf,
+            outperiod_ix,
+            y_ix,
+            self.sta_lons_rad[imtstr],
+            self.sta_lats_rad[imtstr],
+            sta_per_ix,
+            self.sta_phi[imtstr],
+            self.sta_resids[imtstr],
+            self.T_D[imtstr],
+            self.cov_WD_WD_inv[imtstr],
+            self.mu_H_yD[imtstr],
+            self.cov_HH_yD[imtstr],
+            nearest_k=self.mvn_nearest_k,
+            sta_sig_extra=self.sta_sig_extra[imtstr],
+            precision=self.mvn_precision,
+        )
+        #
+        # Set up the MVN itself. The output points are processed in
+        # rectangular tiles; by default a tile is one row of the grid, but
+        # if a memory budget is configured the tiles are sized to fit
+        # within it and the results go to disk-backed arrays.
+        #
+        grid_shape = (self.smny, self.smnx)
+        if stadata.nearest_k > 0:
+            #
+            # In the nearest-K mode, each tile is conditioned on its own
+            # set of nearby stations, so the tiles are small squares
+            #
+            tile_ny, tile_nx = get_local_tile_shape(
+                self.smnx,
+                self.smny,
+                stadata.nearest_k,
+                stadata.ncols,
+                self.mvn_max_memory,
+            )
+        else:
+            tile_ny, tile_nx = get_tile_shape(
+                self.smnx, self.smny, nsta, stadata.ncols, self.mvn_max_memory
+            )
+        self.logger.debug(
+            f"computeMVN: {imtstr} tile size is {tile_ny} x {tile_nx} points"
+        )
+        outputs = {
+            name: make_output_array(grid_shape, self._mvnScratchFile(imtstr, name))
+            for name in ("mean", "std", "tau")
+        }
         # Allocate the full C matrix only for the desired IMT (MMI). This
         # is for generating realizations. Someday we will want to make this
         # apply to other IMTs and become an optional flag for this module
@@ -1596,128 +1896,77 @@ class ModelModule(CoreModule):
         # Note: We would have to set up C_complete = {} at the top of the
         # module, and then here, it would be C_complete[imtstr] = ...
         if imtstr == "MMI":
-            C_complete = np.empty_like(T_Y0)
-        for iy in range(self.smny):
-            ss = iy * self.smnx
-            se = (iy + 1) * self.smnx
-            time4 = time.time()
-            geodetic_distance_fast(
-                sta_lons_rad,
-                sta_lats_rad,
-                lons_out_rad[ss:se],
-                lats_out_rad[ss:se],
-                matrix12_phi,
+            outputs["C"] = make_output_array(
+                (self.smny, self.smnx, stadata.ncols),
+                self._mvnScratchFile(imtstr, "C"),
             )
-            ddtime += time.time() - time4
-            time4 = time.time()
-            self.ccf.getCorrelation(t1_12, t2_12, matrix12_phi)
-            ctime += time.time() - time4
-            time4 = time.time()
-            # sdarr_phi is the standard deviation of the within-event
-            # residuals at the output sites
-            sdarr_phi = self.psd[imtstr][iy, :]
-            make_sigma_matrix(matrix12_phi, sdsta_phi, sdarr_phi)
-            stime += time.time() - time4
-            time4 = time.time()
-            #
-            # Sigma12 * Sigma22^-1 is known as the 'regression
-            # coefficient' matrix (rcmatrix)
-            #
-            np.dot(matrix12_phi, cov_WD_WD_inv, out=rcmatrix_phi)
-            dtime += time.time() - time4
-            time4 = time.time()
-            #
-            # We only want the diagonal elements of the conditional
-            # covariance matrix, so there is no point in doing the
-            # full solution with the dot product, e.g.:
-            # sdgrid[ss:se] = pout_sd2[ss:se] -
-            #       np.diag(rcmatrix.dot(sigma21))
-            #
-            # make_sd_array is a Cython function that is optimized to find
-            # the diagonal of the covariance matrix.
-            #
-            make_sd_array(cov_WY_WY_WD, pout_sd2_phi, iy, rcmatrix_phi, matrix12_phi)
-            #
-            # Equation B32 of Engler et al. (2021)
-            #
-            np.subtract(T_Y0[ss:se, :], np.dot(rcmatrix_phi, T_D, out=C_tmp1), out=C)
-            #
-            # This is the MVN solution for the conditional mean
-            # It is an implementation of the equation just below
-            # equation B25 in Engler et al. (2021):
-            #
-            # mu_Y_yD = mu_Y + C mu_H_yD + cov_WY_WD cov_WD_WD^-1 zeta
-            #
-            # but we break it up for efficiency.
-            #
-            s_tmp1r = np.dot(C, self.mu_H_yD[imtstr], out=s_tmp1).reshape((-1,))
-            s_tmp2r = np.dot(rcmatrix_phi, self.sta_resids[imtstr], out=s_tmp2).reshape(
-                (-1,)
-            )
-            ampgrid[iy, :] = np.add(
-                np.add(pout_mean[iy, :], s_tmp1r, out=s_tmp1r), s_tmp2r, out=s_tmp2r
-            )
-            atime += time.time() - time4
-            time4 = time.time()
-            #
-            # We're doing this:
-            #
-            # sdgrid_tau[iy, :] = np.diag(
-            #     C.dot(self.cov_HH_yD[imtstr].dot(C.T)))
-            #
-            # to find the between-event part of the diagonal of the conditional
-            # covariance.  This is the second term of equation B27 of Engler
-            # et al. (2021). The code below is faster and uses less memory than
-            # actually implementing the above equation.
-            #
-            np.dot(C, self.cov_HH_yD[imtstr], C_tmp1)
-            sdgrid_tau[iy, :] = np.sum(
-                np.multiply(C_tmp1, C, out=C_tmp2), out=s_tmp3, axis=1
-            )
-            # This is where we would have a flag if we were saving the priors
-            # as an option
-            if imtstr == "MMI":
-                # Save C to complete full size C
-                C_complete[ss:se, :] = C
-
-            mtime += time.time() - time4
+        job = MVNJob(
+            imtstr,
+            stadata,
+            self.lons_out_rad.reshape(grid_shape),
+            self.lats_out_rad.reshape(grid_shape),
+            pout_mean.reshape(grid_shape),
+            self.psd[imtstr].reshape(grid_shape),
+            self.tsd[imtstr].reshape(grid_shape),
+            outputs,
+        )
+        job.tile_shape = (tile_ny, tile_nx)
+        job.start_time = time1
         #
         # This processing can result in MMI values that go beyond
         # the 1 to 10 bounds of MMI, so we apply that constraint again
-        # here
+        # to the results
         #
         if imtstr == "MMI":
-            ampgrid = np.clip(ampgrid, 1.0, 10.0)
+            job.clip = (1.0, 10.0)
+        return job
+
+    def _finishMVN(self, job, timers):
+        """
+        Store the results of an MVN job.
+        """
+        imtstr = job.imtstr
         #
         # The conditional mean
         #
-        self.outgrid[imtstr] = ampgrid
-        #
-        # The outputs are the conditional total stddev, the conditional
-        # between-event stddev (tau), and the prior within-event stddev (phi)
-        #
-        self.outsd[imtstr] = np.sqrt(
-            np.add(cov_WY_WY_WD, sdgrid_tau, out=cov_WY_WY_WD), out=cov_WY_WY_WD
-        )
-        # self.outphi[imtstr] = np.sqrt(cov_WY_WY_WD)
+        self.outgrid[imtstr] = job.outputs["mean"]
+        self.outsd[imtstr] = job.outputs["std"]
+        # The prior within-event stddev (phi)
         self.outphi[imtstr] = self.psd[imtstr]
-        self.outtau[imtstr] = np.sqrt(sdgrid_tau, out=sdgrid_tau)
+        self.outtau[imtstr] = job.outputs["tau"]
 
         # Special stuff for the MMI priors. When we make this apply to other
         # IMTs we'll need to mess around with this block
         if imtstr == "MMI":
             self.MMI_add_uncertainty = self.sta_sig_extra[imtstr]
             self.MMI_Sigma_HH_YD = self.cov_HH_yD[imtstr]
-            self.MMI_C = C_complete
-            self.MMI_sta_per_ix = sta_per_ix
+            self.MMI_C = job.outputs["C"].reshape((-1, job.stadata.ncols))
+            self.MMI_sta_per_ix = self.sta_per_ix[imtstr]
 
-        self.logger.debug(f"\ttime for {imtstr} distance={ddtime:f}")
-        self.logger.debug(f"\ttime for {imtstr} correlation={ctime:f}")
-        self.logger.debug(f"\ttime for {imtstr} sigma={stime:f}")
-        self.logger.debug(f"\ttime for {imtstr} rcmatrix={dtime:f}")
-        self.logger.debug(f"\ttime for {imtstr} amp calc={atime:f}")
-        self.logger.debug(f"\ttime for {imtstr} sd calc={mtime:f}")
-        self.logger.debug(f"total time for {imtstr}={time.time() - time1:f}")
+        if job.stadata.dtype == np.float32:
+            mean_err, std_err = check_precision(job)
+            self.logger.info(
+                f"MVN for {imtstr} in single precision: max difference from "
+                f"double precision in sampled rows: mean={mean_err:.3g}, "
+                f"stddev={std_err:.3g}"
+            )
+        self.logger.debug(f"\ttime for {imtstr} distance={timers['distance']:f}")
+        self.logger.debug(f"\ttime for {imtstr} correlation={timers['correlation']:f}")
+        self.logger.debug(f"\ttime for {imtstr} sigma={timers['sigma']:f}")
+        self.logger.debug(f"\ttime for {imtstr} fused sigma={timers['fused']:f}")
+        self.logger.debug(f"\ttime for {imtstr} rcmatrix={timers['rcmatrix']:f}")
+        self.logger.debug(f"\ttime for {imtstr} amp calc={timers['amp']:f}")
+        self.logger.debug(f"\ttime for {imtstr} sd calc={timers['sd']:f}")
+        self.logger.debug(f"total time for {imtstr}={time.time() - job.start_time:f}")
+
+    def _mvnScratchFile(self, imtstr, name):
+        """
+        Return the path to the file that will back one of the MVN output
+        arrays, or None if the outputs are to be held in memory.
+        """
+        if self.mvn_scratch_dir is None:
+            return None
+        return os.path.join(self.mvn_scratch_dir, f"{oq_to_file(imtstr)}_{name}.npy")
 
     def _applyCustomMask(self):
         """Apply custom masks to IMT grid outputs."""
@@ -2510,6 +2759,162 @@ class ModelModule(CoreModule):
                 - List of numpy array of standard deviations corresponding to
                   therequested stddev_types.
 
+        """
+        pe, sd_types = self._getPredictor(gmpe, oqimt)
+
+        mean, stddevs = pe.get_mean_and_stddevs(sx, self.rx, dx, oqimt, sd_types)
+        mean = self._adjustPrediction(mean, sx, dx, oqimt, apply_gafs)
+
+        return mean, stddevs
+
+    def _gmasBatch(self, gmpe, contexts, oqimt, apply_gafs):
+        """
+        Like _gmas(), but for a list of sites and distance contexts, for
+        which the GMPE is evaluated in a single call on the concatenation
+        of the contexts. This saves the per-call overhead of the GMPE
+        (and, for a MultiGMPE, of its component GMPEs, IMC conversions,
+        and site factors). The GMPEs of a MultiGMPE are combined
+        separately for each of the contexts (see get_segments()), since
+        their stddevs depend on the sites. Other predictors (e.g., a
+        VirtualIPE, which uses a MultiGMPE internally), and contexts that
+        cannot be combined, are evaluated one context at a time.
+
+        Args:
+            gmpe:
+                A GMPE instance.
+            contexts (list):
+                A list of (sites context, distance context) tuples.
+            oqimt:
+                List of OpenQuake IMTs.
+            apply_gafs (boolean):
+                Whether or not to apply the generic
+                amplification factors to the GMPE output.
+
+        Returns:
+            list: A list of the (mean, stddevs) tuples returned by _gmas()
+            for each of the contexts.
+        """
+        pe, sd_types = self._getPredictor(gmpe, oqimt)
+        merged = None
+        if isinstance(pe, MultiGMPE):
+            merged = self._mergeContexts(contexts)
+        if merged is None:
+            return [self._gmas(gmpe, sx, dx, oqimt, apply_gafs) for sx, dx in contexts]
+        sx_all, dx_all = merged
+        mean, stddevs = pe.get_mean_and_stddevs(
+            sx_all,
+            self.rx,
+            dx_all,
+            oqimt,
+            sd_types,
+            segments=get_segments(contexts),
+        )
+        results = []
+        for (sx, dx), (cmean, cstddevs) in zip(
+            contexts, split_results(contexts, mean, stddevs)
+        ):
+            cmean = self._adjustPrediction(cmean, sx, dx, oqimt, apply_gafs)
+            results.append((cmean, cstddevs))
+        return results
+
+    def _mergeContexts(self, contexts):
+        """
+        Return merge_contexts(contexts), reusing the merged contexts made
+        by an earlier call with the same contexts. This saves the
+        concatenations, and lets the IMTs share the work that is cached by
+        the identity of the arrays of the contexts (e.g., the site
+        factors of the GMPEs without site terms).
+        """
+        key = tuple((id(sx), id(dx)) for sx, dx in contexts)
+        if key not in self._merged_contexts:
+            # Hold on to the contexts so that their ids remain valid
+            self._merged_contexts[key] = (list(contexts), merge_contexts(contexts))
+        return self._merged_contexts[key][1]
+
+    def _getIMTGMPEs(self, oqimts):
+        """
+        Make the MultiGMPE for each of a list of (non-MMI) IMTs. The IMTs
+        not supported by the GMPE are logged and left out.
+
+        Args:
+            oqimts (list):
+                List of OpenQuake IMTs.
+
+        Returns:
+            dict: The MultiGMPEs keyed by IMT string.
+        """
+        gmpes = {}
+        for oqimt in oqimts:
+            imtstr = str(oqimt)
+            if imtstr == "MMI":
+                continue
+            try:
+                gmpes[imtstr] = MultiGMPE.__from_config__(self.config, filter_imt=oqimt)
+            except KeyError:
+                self.logger.warn(f"Input IMT {imtstr} not supported by GMPE: ignoring")
+        return gmpes
+
+    def _gmasMulti(self, gmpes, contexts, apply_gafs):
+        """
+        Like _gmasBatch(), but for several IMTs, which are evaluated in a
+        single call to MultiGMPE.__get_mean_and_stddevs_multi__() so that
+        the context preparation is shared among them.
+
+        Args:
+            gmpes (dict):
+                The MultiGMPEs keyed by IMT string (see _getIMTGMPEs());
+                MMI is not included.
+            contexts (list):
+                A list of (sites context, distance context) tuples.
+            apply_gafs (boolean):
+                Whether or not to apply the generic
+                amplification factors to the GMPE output.
+
+        Returns:
+            dict: The lists returned by _gmasBatch(), keyed by IMT string.
+        """
+        if not gmpes:
+            return {}
+        merged = self._mergeContexts(contexts)
+        if merged is None:
+            return {
+                imtstr: self._gmasBatch(
+                    gmpe, contexts, imt.from_string(imtstr), apply_gafs
+                )
+                for imtstr, gmpe in gmpes.items()
+            }
+        sx_all, dx_all = merged
+        oqimts = [imt.from_string(imtstr) for imtstr in gmpes]
+        # Record the description of the GMPE for each IMT
+        for oqimt in oqimts:
+            self._getPredictor(gmpes[str(oqimt)], oqimt)
+        # Each IMT is evaluated with its own MultiGMPE from gmpes
+        mgmpe = gmpes[oqimts[0].string]
+        all_results = mgmpe.__get_mean_and_stddevs_multi__(
+            sx_all,
+            self.rx,
+            dx_all,
+            oqimts,
+            self.gmpe_stddev_types,
+            gmpes=gmpes,
+            segments=get_segments(contexts),
+        )
+        results = {}
+        for oqimt in oqimts:
+            mean, stddevs = all_results[oqimt.string]
+            results[str(oqimt)] = [
+                (self._adjustPrediction(cmean, sx, dx, oqimt, apply_gafs), cstddevs)
+                for (sx, dx), (cmean, cstddevs) in zip(
+                    contexts, split_results(contexts, mean, stddevs)
+                )
+            ]
+        return results
+
+    def _getPredictor(self, gmpe, oqimt):
+        """
+        Return the object that makes the predictions for an IMT (the GMPE,
+        or the IPE for MMI) and the stddev types to request from it, and
+        record the description of the GMPE.
         """
         if "MMI" in oqimt:
             pe = self.ipe
@@ -2534,75 +2939,94 @@ class ModelModule(CoreModule):
             else:
                 self._info = {}
 
-        mean, stddevs = pe.get_mean_and_stddevs(
-            copy.deepcopy(sx), self.rx, copy.deepcopy(dx), oqimt, sd_types
-        )
+        return pe, sd_types
 
+    def _adjustPrediction(self, mean, sx, dx, oqimt, apply_gafs):
+        """
+        Apply the generic amplification factors (if requested) and the
+        directivity (if it was computed and applies to the IMT) to the
+        mean predicted for a sites and distance context.
+        """
         # Include generic amp factors?
         if apply_gafs:
-            gafs = get_generic_amp_factors(sx, str(oqimt))
+            if sx is self.sx_out and str(oqimt) in self.gaf_out:
+                gafs = self.gaf_out[str(oqimt)]
+            else:
+                gafs = get_generic_amp_factors(sx, str(oqimt))
             if gafs is not None:
                 mean += gafs
 
+        # Include directivity?
+        if self.do_directivity is True:
+            fd = self._getDirectivity(dx, oqimt)
+            if fd is not None:
+                # Reshape to match the mean
+                fd = fd.reshape(mean.shape)
+                # Store the grid used for the output points
+                if dx is self.dx_out:
+                    self.dir_output[str(oqimt)] = fd
+                if oqimt.string == "MMI":
+                    mean *= np.exp(fd)
+                else:
+                    mean += fd
+
+        return mean
+
+    def _addDirectivity(self, dir_obj, dx):
+        """
+        Save the result of the directivity model (a Rowshandel2013 instance)
+        for the sites of a distance context.
+        """
+        self.dir_results[id(dx)] = (dir_obj.getFd(), dx)
+
+    def _getDirectivity(self, dx, oqimt):
+        """
+        Return the directivity factor (fd) for the sites of a distance
+        context and an IMT, or None if directivity does not apply to the
+        IMT. The factor is interpolated from the periods of the directivity
+        model the first time it is needed, and cached.
+        """
         # Does directivity apply to this imt?
         row_pers = Rowshandel2013.getPeriods()
 
         if oqimt.string == "PGA":
-            imt_ok = False
+            return None
         elif oqimt.string == "PGV" or oqimt.string == "MMI":
             tper = 1.0
-            imt_ok = True
         elif "SA" in oqimt.string:
             tper = oqimt.period
-            min_per = np.min(row_pers)
-            max_per = np.max(row_pers)
-            if (tper >= min_per) and (tper <= max_per):
-                imt_ok = True
-            else:
-                imt_ok = False
+            if (tper < np.min(row_pers)) or (tper > np.max(row_pers)):
+                return None
         else:
-            imt_ok = False
-
-        # Did we calculate directivity?
-        calc_dir = self.do_directivity
-
-        if calc_dir and imt_ok:
-            # Use distance context to figure out which directivity result
-            # we need to use.
-            all_fd = None
-            for dirdf, tmpdx in self.dir_results:
-                if dx == tmpdx:
-                    all_fd = dirdf.getFd()
-                    break
-            if all_fd is None:
-                raise RuntimeError(
-                    "Failed to detect dataframe for directivity calculation."
-                )
+            return None
 
-            # Does oqimt match any of those periods?
-            if tper in row_pers:
-                fd = all_fd[row_pers.index(tper)]
-            else:
-                # Log(period) interpolation.
-                apers = np.array(row_pers)
-                per_below = np.max(apers[apers < tper])
-                per_above = np.min(apers[apers > tper])
-                fd_below = all_fd[row_pers.index(per_below)]
-                fd_above = all_fd[row_pers.index(per_above)]
-                x1 = np.log(per_below)
-                x2 = np.log(per_above)
-                fd = fd_below + (np.log(tper) - x1) * (fd_above - fd_below) / (x2 - x1)
-            # Reshape to match the mean
-            fd = fd.reshape(mean.shape)
-            # Store the interpolated grid
-            imtstr = str(oqimt)
-            self.dir_output[imtstr] = fd
-            if oqimt.string == "MMI":
-                mean *= np.exp(fd)
-            else:
-                mean += fd
+        key = (id(dx), str(oqimt))
+        if key in self.dir_fd:
+            return self.dir_fd[key]
 
-        return mean, stddevs
+        # Use distance context to figure out which directivity result
+        # we need to use.
+        if id(dx) not in self.dir_results:
+            raise RuntimeError(
+                "Failed to detect dataframe for directivity calculation."
+            )
+        all_fd = self.dir_results[id(dx)][0]
+
+        # Does oqimt match any of those periods?
+        if tper in row_pers:
+            fd = all_fd[row_pers.index(tper)]
+        else:
+            # Log(period) interpolation.
+            apers = np.array(row_pers)
+            per_below = np.max(apers[apers < tper])
+            per_above = np.min(apers[apers > tper])
+            fd_below = all_fd[row_pers.index(per_below)]
+            fd_above = all_fd[row_pers.index(per_above)]
+            x1 = np.log(per_below)
+            x2 = np.log(per_above)
+            fd = fd_below + (np.log(tper) - x1) * (fd_above - fd_below) / (x2 - x1)
+        self.dir_fd[key] = fd
+        return fd
 
     def _adjustResolution(self):
         """
@@ -2671,6 +3095,24 @@ def _string_round(val, digits):
     return str(_round_float(val, digits))
 
 
+def _get_array_key(*args):
+    """
+    Make a key (for a dictionary) from the contents of a set of arrays.
+
+    Args:
+        args (ndarrays): The arrays.
+
+    Returns:
+        str: A digest of the shapes, types, and values of the arrays.
+    """
+    digest = hashlib.sha1()
+    for arg in args:
+        arg = np.ascontiguousarray(arg)
+        digest.update(f"{arg.dtype.str}{arg.shape}".encode())
+        digest.update(arg.tobytes())
+    return digest.hexdigest()
+
+
 def _get_period_arrays(*args):
     """
     Return 1) a sorted array of the periods represented by the IMT list(s)
@@ -1,18 +1,41 @@
 import os.path
 import glob
+import hashlib
+import json
 import logging
+import tempfile
 
+import h5py
 import numpy as np
 
+from shakelib.utils.imt_string import oq_to_file
 from shakemap.utils.config import get_config_paths
 from mapio.gridcontainer import GridHDFContainer
 from mapio.grid2d import Grid2D
 
+# The amplification grids read from the files in the GenericAmpFactors
+# directory, keyed by file name. For each file the entry holds the
+# (modification time, size) of the file when it was read, the bounds of
+# its grids (once one has been read), and the grid (or None) for each
+# IMT that has been requested.
+_GAF_CACHE = {}
+
 
 def get_period_from_imt(imtstr):
     return float(imtstr.replace("SA(", "").replace(")", ""))
 
 
+def clear_generic_amp_cache():
+    """
+    Clear the cache of the amplification grids read by
+    get_generic_amp_factors().
+
+    Returns:
+        nothing
+    """
+    _GAF_CACHE.clear()
+
+
 def get_generic_amp_factors(sx, myimt):
     """
     Returns an array of generic amplification factors the same shape
@@ -48,6 +71,12 @@ def get_generic_amp_factors(sx, myimt):
         - Coordinates that fall outside the grid bounds of any
           given file are assigned an amplification factor of zero.
 
+    The grid for each file and IMT (including the interpolated grids) is
+    cached for the life of the process, and is reread only if the file
+    changes. Once a grid has been read from a file, the file is skipped
+    for coordinates that do not overlap its bounds (the grids in a file
+    are assumed to share the same bounds).
+
     Args:
         sx (Sites Context): An OpenQuake sites context specifying the
             coordinates of interest.
@@ -58,51 +87,39 @@ def get_generic_amp_factors(sx, myimt):
         to the coordinates specified by sx.
     """
 
-    # Read the GenericAmpFactors directory in the install directory
-    indir, _ = get_config_paths()
-    gaf_dir = os.path.join(indir, "data", "GenericAmpFactors")
-    if not os.path.isdir(gaf_dir):
-        logging.warning("No GenericAmpFactors directory found.")
-        return None
-    gaf_files = glob.glob(os.path.join(gaf_dir, "*.hdf"))
-    if len(gaf_files) == 0:
-        logging.warning("No generic amplification files found.")
+    gaf_files = _get_gaf_files()
+    if gaf_files is None:
         return None
 
     gaf = np.zeros_like(sx.lats)
+    if np.size(gaf) == 0:
+        return gaf
+    extent = (np.min(sx.lons), np.max(sx.lons), np.min(sx.lats), np.max(sx.lats))
 
     for gfile in gaf_files:
-        thisimt = myimt
-        # Get a list of IMTs
-        gc = GridHDFContainer.load(gfile)
-        contents = gc.getGrids()
-        if thisimt == "PGV" and "PGV" not in contents:
-            logging.warning(
-                "Generic Amp Factors: PGV not found in file %s, "
-                "attempting to use SA(1.0)" % (gfile)
-            )
-            thisimt = "SA(1.0)"
-        if thisimt == "PGA" and "PGA" not in contents:
-            logging.warning(
-                "Generic Amp Factors: PGA not found in file %s, "
-                "attempting to use SA(0.01)" % (gfile)
-            )
-            thisimt = "SA(0.01)"
-
-        if thisimt in contents:
-            # If imt in IMT list, get the grid
-            mygrid, _ = gc.getGrid(thisimt)
-        elif not thisimt.startswith("SA("):
-            logging.warning(
-                f"Generic Amp Factors: IMT {myimt} not found in file {gfile}"
-            )
-            mygrid = None
-        else:
-            # Get the weighted average grid based on the
-            # periods bracketing the input IMT
-            mygrid, metadata = _get_average_grid(gc, contents, thisimt)
-
-        gc.close()
+        entry = _get_cache_entry(gfile)
+        if entry["bounds"] is not None and not _overlaps(entry["bounds"], extent):
+            continue
+        if myimt not in entry["grids"]:
+            # The file is opened read-only: GridHDFContainer.load() opens
+            # it for writing, which changes its mtime when it is closed
+            gc = GridHDFContainer(h5py.File(gfile, "r"))
+            try:
+                entry["grids"][myimt] = _read_grid(gc, gfile, myimt)
+            finally:
+                gc.close()
+            mygrid = entry["grids"][myimt]
+            if mygrid is not None and entry["bounds"] is None:
+                gd = mygrid.getGeoDict()
+                # Nearest-neighbor sampling reaches half a cell beyond
+                # the grid's cell centers
+                entry["bounds"] = (
+                    gd.xmin - gd.dx / 2,
+                    gd.xmax + gd.dx / 2,
+                    gd.ymin - gd.dy / 2,
+                    gd.ymax + gd.dy / 2,
+                )
+        mygrid = entry["grids"][myimt]
         if mygrid is None:
             continue
 
@@ -112,6 +129,144 @@ def get_generic_amp_factors(sx, myimt):
     return gaf
 
 
+def get_generic_amp_factors_cached(sx, myimt, cache_dir):
+    """
+    Like get_generic_amp_factors(), but the factors are saved in a file
+    in cache_dir, from which they are loaded (memory-mapped) by later
+    calls for the same IMT and coordinates, as long as the amplification
+    files have not changed. This lets the factors at the output points of
+    an event be computed once, rather than on every run of the event.
+    Files in cache_dir for the IMT with other coordinates or amplification
+    files are removed.
+
+    Args:
+        sx (Sites Context): An OpenQuake sites context specifying the
+            coordinates of interest.
+        myimt (str): A string representing an OpenQuake IMT.
+        cache_dir (str): The (existing) directory that holds the saved
+            factors.
+
+    Returns:
+        array: An array of generic amplification factors corresponding
+        to the coordinates specified by sx, or None if there are no
+        amplification files.
+    """
+    gaf_files = _get_gaf_files()
+    if gaf_files is None:
+        return None
+
+    sha = hashlib.sha1(myimt.encode())
+    for gfile in sorted(gaf_files):
+        stat = os.stat(gfile)
+        sha.update(json.dumps([gfile, stat.st_mtime_ns, stat.st_size]).encode())
+    for coords in (sx.lons, sx.lats):
+        coords = np.ascontiguousarray(coords, dtype=np.float64)
+        sha.update(str(coords.shape).encode())
+        sha.update(coords)
+    prefix = f"gaf_{oq_to_file(myimt)}_"
+    gaf_file = os.path.join(cache_dir, prefix + sha.hexdigest() + ".npy")
+
+    if os.path.isfile(gaf_file):
+        try:
+            return np.load(gaf_file, mmap_mode="r")
+        except Exception:
+            logging.warning(f"Generic Amp Factors: could not load {gaf_file}")
+
+    gaf = get_generic_amp_factors(sx, myimt)
+    for old_file in glob.glob(os.path.join(cache_dir, prefix + "*.npy")):
+        os.remove(old_file)
+    # Write to a temporary file and move it into place so that a partial
+    # file is never loaded
+    fd, tmpfile = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        np.save(f, gaf)
+    os.replace(tmpfile, gaf_file)
+    return gaf
+
+
+def _get_gaf_files():
+    """
+    Get the list of the amplification (HDF) files in the GenericAmpFactors
+    directory in the install directory, or None (with a warning) if there
+    are none.
+    """
+    indir, _ = get_config_paths()
+    gaf_dir = os.path.join(indir, "data", "GenericAmpFactors")
+    if not os.path.isdir(gaf_dir):
+        logging.warning("No GenericAmpFactors directory found.")
+        return None
+    gaf_files = glob.glob(os.path.join(gaf_dir, "*.hdf"))
+    if len(gaf_files) == 0:
+        logging.warning("No generic amplification files found.")
+        return None
+    return gaf_files
+
+
+def _get_cache_entry(gfile):
+    """
+    Get the cache entry of an amplification file, replacing it if the
+    file has changed since it was read.
+    """
+    stat = os.stat(gfile)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    entry = _GAF_CACHE.get(gfile)
+    if entry is None or entry["stamp"] != stamp:
+        entry = {"stamp": stamp, "bounds": None, "grids": {}}
+        _GAF_CACHE[gfile] = entry
+    return entry
+
+
+def _overlaps(bounds, extent):
+    """
+    Check if the bounds of a grid (xmin, xmax, ymin, ymax) overlap an
+    extent of coordinates (lonmin, lonmax, latmin, latmax). Grids that
+    cross the 180 meridian are assumed to overlap.
+    """
+    xmin, xmax, ymin, ymax = bounds
+    lonmin, lonmax, latmin, latmax = extent
+    if xmin > xmax:
+        return True
+    return not (lonmax < xmin or lonmin > xmax or latmax < ymin or latmin > ymax)
+
+
+def _read_grid(gc, gfile, myimt):
+    """
+    Read the amplification grid for an IMT from a container, using the
+    substitutions and interpolation described in
+    get_generic_amp_factors().
+
+    Returns:
+        Grid2D: The grid, or None if there is no grid for the IMT.
+    """
+    thisimt = myimt
+    # Get a list of IMTs
+    contents = gc.getGrids()
+    if thisimt == "PGV" and "PGV" not in contents:
+        logging.warning(
+            "Generic Amp Factors: PGV not found in file %s, "
+            "attempting to use SA(1.0)" % (gfile)
+        )
+        thisimt = "SA(1.0)"
+    if thisimt == "PGA" and "PGA" not in contents:
+        logging.warning(
+            "Generic Amp Factors: PGA not found in file %s, "
+            "attempting to use SA(0.01)" % (gfile)
+        )
+        thisimt = "SA(0.01)"
+
+    if thisimt in contents:
+        # If imt in IMT list, get the grid
+        mygrid, _ = gc.getGrid(thisimt)
+    elif not thisimt.startswith("SA("):
+        logging.warning(f"Generic Amp Factors: IMT {myimt} not found in file {gfile}")
+        mygrid = None
+    else:
+        # Get the weighted average grid based on the
+        # periods bracketing the input IMT
+        mygrid, metadata = _get_average_grid(gc, contents, thisimt)
+    return mygrid
+
+
 def _get_average_grid(gc, contents, myimt):
     """
     Given an SA(X) IMT, attempt to find the grids that bracket its
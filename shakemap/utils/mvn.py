@@ -0,0 +1,1270 @@
+# stdlib imports
+import copy
+import math
+import time
+from multiprocessing import shared_memory
+
+# third party imports
+import numpy as np
+import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
+from scipy.linalg import lapack
+from scipy.spatial import cKDTree
+
+# local imports
+from shakelib.correlation.loth_baker_2013 import LothBaker2013
+from shakemap.c.clib import (
+    geodetic_distance_fast,
+    make_lb_sigma_matrix,
+    make_sd_array,
+    make_sigma_matrix,
+)
+
+#
+# The names of the timers accumulated by mvn_tile(); they correspond to the
+# stages of the MVN computation that model reports in its logs. "fused" is
+# the time spent in the kernel that does the distance, correlation, and
+# sigma stages in one pass (see MVNStationData).
+#
+MVN_TIMERS = ("distance", "correlation", "sigma", "fused", "rcmatrix", "amp", "sd")
+
+#
+# Covariance matrices whose (estimated) condition number exceeds
+# MAX_CHOLESKY_COND are inverted with the pseudo-inverse rather than by
+# way of their Cholesky factorization. If the factorization fails, it is
+# retried up to MAX_JITTER_TRIES times with an increasing amount of
+# "jitter" added to the diagonal, starting at JITTER_START times the
+# mean of the diagonal.
+#
+MAX_CHOLESKY_COND = 1.0e10
+MAX_JITTER_TRIES = 5
+JITTER_START = 1.0e-10
+
+#
+# The maximum number of points on a side of the (square) tiles used in the
+# nearest-K (local) MVN
+#
+LOCAL_TILE_SIZE = 32
+
+#
+# The radius of the earth (km) used by geodetic_distance_fast(); and the
+# factor by which the search radius of the spatial index is inflated to
+# make sure that it finds every pair of points within the cutoff distance
+# as measured by the (approximate) distance formula
+#
+EARTH_RADIUS = 6371.0
+SEARCH_RADIUS_FACTOR = 1.1
+
+#
+# The number of rows of the grid that check_precision() recomputes in
+# double precision to estimate the error of a single-precision MVN
+#
+PRECISION_CHECK_ROWS = 8
+
+
+def invert_covariance(matrix, max_cond=MAX_CHOLESKY_COND):
+    """
+    Invert a symmetric, positive definite (covariance) matrix using its
+    Cholesky factorization. If the factorization fails, a small amount of
+    jitter is added to the diagonal and it is tried again. If it still
+    fails, or if the matrix is too poorly conditioned for the
+    factorization to be trusted, the pseudo-inverse is used instead.
+
+    Args:
+        matrix (ndarray): The (n x n) matrix to invert; it is not
+            modified.
+        max_cond (float): The largest condition number for which the
+            Cholesky-based inverse will be used.
+
+    Returns:
+        tuple: The inverse of the matrix, and a dictionary with the
+        elements "method" (either "cholesky" or "pinv"), "jitter" (the
+        amount added to the diagonal), "cond" (the estimated condition
+        number of the matrix; inf if the factorization failed), and
+        "time" (the time spent, in seconds).
+    """
+    time1 = time.time()
+    n = matrix.shape[0]
+    diag = np.diag(matrix)
+    jitter = 0.0
+    factor = None
+    for i in range(MAX_JITTER_TRIES + 1):
+        if i > 0:
+            jitter = JITTER_START * np.mean(diag) * 10 ** (i - 1)
+        jmatrix = matrix + jitter * np.eye(n) if jitter > 0 else matrix
+        try:
+            factor, lower = scipy.linalg.cho_factor(
+                jmatrix, lower=True, check_finite=False
+            )
+        except np.linalg.LinAlgError:
+            continue
+        break
+    cond = np.inf
+    if factor is not None:
+        anorm = np.linalg.norm(jmatrix, 1)
+        rcond, info = lapack.dpocon(factor, anorm, uplo="L")
+        if info == 0 and rcond > 0:
+            cond = 1.0 / rcond
+    if cond > max_cond:
+        result = {"method": "pinv", "jitter": 0.0, "cond": cond}
+        inverse = np.linalg.pinv(matrix)
+    else:
+        result = {"method": "cholesky", "jitter": jitter, "cond": cond}
+        inverse, info = lapack.dpotri(factor, lower=1)
+        #
+        # dpotri only fills in the lower triangle
+        #
+        inverse = np.tril(inverse) + np.tril(inverse, -1).T
+    result["time"] = time.time() - time1
+    return inverse, result
+
+
+class StationCorrelation(object):
+    """
+    Builds the station-to-station correlation matrices used in the
+    station covariance matrices of the output IMTs.
+
+    The observations used for each output IMT are drawn from the same set
+    of stations; only the stations that contribute and the (pseudo-)
+    periods of their IMTs differ from one output IMT to another. So the
+    distances between all of the stations are computed once, and the
+    correlations are computed in blocks, one for each pair of period
+    indices, over all of the stations that provide observations with those
+    periods to any output IMT. The correlation matrix for each output IMT
+    is then assembled from the blocks. A block is released once all of the
+    output IMTs that use it have been assembled (or released). Like the
+    covariance matrices built from it, the correlation function is assumed
+    to be symmetric in its two period indices.
+    """
+
+    def __init__(self, ccf, lons_rad, lats_rad, sta_ix, sta_per_ix):
+        """
+        Args:
+            ccf (CrossCorrelationBase): The cross-correlation function.
+            lons_rad (ndarray): The longitudes (radians) of the stations.
+            lats_rad (ndarray): The latitudes (radians) of the stations.
+            sta_ix (dict): A dictionary, keyed by output IMT, of arrays of
+                the indices (into lons_rad and lats_rad) of the stations
+                providing the observations for the IMT.
+            sta_per_ix (dict): A dictionary, keyed by output IMT, of arrays
+                of the period indices of the observations for the IMT.
+        """
+        self._ccf = ccf
+        self._lons_rad = np.ascontiguousarray(lons_rad, dtype=np.float64)
+        self._lats_rad = np.ascontiguousarray(lats_rad, dtype=np.float64)
+        self._sta_ix = sta_ix
+        self._sta_per_ix = sta_per_ix
+        self._dist = None
+        self._blocks = {}
+        #
+        # For each period index, the stations that provide observations
+        # with that period to any output IMT; and for each pair of period
+        # indices, the output IMTs that need the block for the pair
+        #
+        stations = {}
+        self._users = {}
+        for imtstr, per_ix in sta_per_ix.items():
+            periods = np.unique(per_ix)
+            for pix in periods:
+                stations.setdefault(pix, []).append(sta_ix[imtstr][per_ix == pix])
+            for i, pix1 in enumerate(periods):
+                for pix2 in periods[i:]:
+                    self._users.setdefault((pix1, pix2), set()).add(imtstr)
+        self._stations = {
+            pix: np.unique(np.concatenate(ixs)) for pix, ixs in stations.items()
+        }
+
+    def _getBlock(self, pix1, pix2):
+        """
+        Return the correlation block for the pair of period indices; the
+        rows are the stations of pix1, and the columns those of pix2.
+        """
+        if (pix1, pix2) not in self._blocks:
+            if self._dist is None:
+                nsta = np.size(self._lons_rad)
+                self._dist = np.empty((nsta, nsta), dtype=np.float64)
+                geodetic_distance_fast(
+                    self._lons_rad,
+                    self._lats_rad,
+                    self._lons_rad,
+                    self._lats_rad,
+                    self._dist,
+                )
+            block = np.ascontiguousarray(
+                self._dist[np.ix_(self._stations[pix1], self._stations[pix2])]
+            )
+            t1 = np.full(block.shape, pix2, dtype=np.int_)
+            t2 = np.full(block.shape, pix1, dtype=np.int_)
+            self._ccf.getCorrelation(t1, t2, block)
+            self._blocks[(pix1, pix2)] = block
+        return self._blocks[(pix1, pix2)]
+
+    def getCorrelation(self, imtstr):
+        """
+        Assemble the correlation matrix of the observations for an output
+        IMT. This is equivalent to evaluating the correlation function on
+        the distances between the observations, with the period indices of
+        the observations along the rows and columns of the matrix.
+
+        Args:
+            imtstr (str): The output IMT.
+
+        Returns:
+            ndarray: The (nsta x nsta) correlation matrix.
+        """
+        per_ix = self._sta_per_ix[imtstr]
+        sta_ix = self._sta_ix[imtstr]
+        nsta = np.size(per_ix)
+        matrix = np.empty((nsta, nsta), dtype=np.float64)
+        periods = np.unique(per_ix)
+        rows = {pix: np.where(per_ix == pix)[0] for pix in periods}
+        pos = {
+            pix: np.searchsorted(self._stations[pix], sta_ix[rows[pix]])
+            for pix in periods
+        }
+        for i, pix1 in enumerate(periods):
+            for pix2 in periods[i:]:
+                block = self._getBlock(pix1, pix2)[np.ix_(pos[pix1], pos[pix2])]
+                matrix[np.ix_(rows[pix1], rows[pix2])] = block
+                if pix2 != pix1:
+                    matrix[np.ix_(rows[pix2], rows[pix1])] = block.T
+        self.release(imtstr)
+        return matrix
+
+    def release(self, imtstr):
+        """
+        Indicate that the correlation matrix for an output IMT will not be
+        needed (again), so that the blocks that are no longer needed by
+        any output IMT can be freed.
+
+        Args:
+            imtstr (str): The output IMT.
+        """
+        for key in list(self._users):
+            self._users[key].discard(imtstr)
+            if not self._users[key]:
+                del self._users[key]
+                self._blocks.pop(key, None)
+        if not self._users:
+            self._dist = None
+
+
+def taper_correlation(dist, cutoff):
+    """
+    Evaluate the compactly supported Wendland (1995) function,
+
+        (1 - r)**4 * (4 * r + 1), r = dist / cutoff,
+
+    which is 1 at zero distance and falls smoothly to 0 at the cutoff
+    distance (and beyond). It is itself a valid correlation function in
+    two and three dimensions, so the elementwise product of it and a
+    covariance matrix is a valid covariance matrix that is zero for
+    all pairs of points farther apart than the cutoff distance.
+
+    Args:
+        dist (ndarray): The separation distances (km).
+        cutoff (float): The cutoff distance (km).
+
+    Returns:
+        ndarray: The taper, with the same shape as dist.
+    """
+    r = np.minimum(np.asarray(dist) / cutoff, 1.0)
+    return (1.0 - r) ** 4 * (4.0 * r + 1.0)
+
+
+def _to_xyz(lons_rad, lats_rad):
+    """
+    Convert longitudes and latitudes (radians) to Cartesian coordinates
+    (km) on a spherical earth for the spatial index.
+    """
+    coslat = np.cos(lats_rad)
+    return EARTH_RADIUS * np.column_stack(
+        (coslat * np.cos(lons_rad), coslat * np.sin(lons_rad), np.sin(lats_rad))
+    )
+
+
+def _pair_distance(lons1, lats1, lons2, lats2):
+    """
+    The distances (km) between corresponding pairs of points, computed
+    with the same formula as geodetic_distance_fast().
+    """
+    return EARTH_RADIUS * np.sqrt(
+        ((lons1 - lons2) * np.cos(0.5 * (lats1 + lats2))) ** 2 + (lats1 - lats2) ** 2
+    )
+
+
+def _pair_correlation(ccf, ix1, ix2, dist):
+    """
+    Evaluate the correlation function for a 1-D list of pairs of points.
+    """
+    h = np.ascontiguousarray(dist, dtype=np.float64).reshape((1, -1))
+    if h.size == 0:
+        return h.reshape((-1,))
+    ccf.getCorrelation(
+        np.ascontiguousarray(ix1, dtype=np.int_).reshape((1, -1)),
+        np.ascontiguousarray(ix2, dtype=np.int_).reshape((1, -1)),
+        h,
+    )
+    return h.reshape((-1,))
+
+
+class SparseStationCovariance(object):
+    """
+    A sparse approximation of the covariance matrix of the station
+    observations (Sigma22, or cov_WD_WD), for use in place of its (dense)
+    inverse when there are very many observations.
+
+    The correlation function is tapered with taper_correlation() so that
+    only pairs of observations closer than the cutoff distance are
+    correlated; those pairs are found with a spatial index. The matrix is
+    stored in sparse form, and products with its inverse are computed
+    with a sparse LU factorization, so the memory and time required
+    scale with the local density of the stations rather than with their
+    total number. The same taper and spatial index are used to build the
+    (sparse) covariance between the output points and the stations
+    (Sigma12) in the MVN.
+    """
+
+    def __init__(self, ccf, cutoff, lons_rad, lats_rad, per_ix, phi, sig_extra):
+        """
+        Args:
+            ccf (CrossCorrelationBase): The cross-correlation function.
+            cutoff (float): The distance (km) beyond which observations
+                are uncorrelated.
+            lons_rad (ndarray): The longitudes (radians) of the
+                observations.
+            lats_rad (ndarray): The latitudes (radians) of the
+                observations.
+            per_ix (ndarray): The period indices of the observations.
+            phi (ndarray): The within-event stddevs of the observations.
+            sig_extra (ndarray): The additional stddevs of the
+                observations.
+        """
+        self.ccf = ccf
+        self.cutoff = cutoff
+        self.lons_rad = np.ascontiguousarray(lons_rad, dtype=np.float64)
+        self.lats_rad = np.ascontiguousarray(lats_rad, dtype=np.float64)
+        self.per_ix = np.asarray(per_ix, dtype=np.int_)
+        self.phi = np.asarray(phi, dtype=np.float64).reshape((-1,))
+        nsta = np.size(self.lons_rad)
+        self.tree = cKDTree(_to_xyz(self.lons_rad, self.lats_rad))
+        pairs = self.tree.query_pairs(
+            SEARCH_RADIUS_FACTOR * cutoff, output_type="ndarray"
+        )
+        ix1 = pairs[:, 0]
+        ix2 = pairs[:, 1]
+        dist = _pair_distance(
+            self.lons_rad[ix1],
+            self.lats_rad[ix1],
+            self.lons_rad[ix2],
+            self.lats_rad[ix2],
+        )
+        keep = dist < cutoff
+        ix1 = ix1[keep]
+        ix2 = ix2[keep]
+        dist = dist[keep]
+        corr = _pair_correlation(ccf, self.per_ix[ix2], self.per_ix[ix1], dist.copy())
+        cov = corr * taper_correlation(dist, cutoff) * self.phi[ix1] * self.phi[ix2]
+        diag = _pair_correlation(ccf, self.per_ix, self.per_ix, np.zeros(nsta))
+        diag = diag * self.phi**2 + np.asarray(sig_extra).reshape((-1,)) ** 2
+        rows = np.concatenate((ix1, ix2, np.arange(nsta)))
+        cols = np.concatenate((ix2, ix1, np.arange(nsta)))
+        vals = np.concatenate((cov, cov, diag))
+        self.matrix = scipy.sparse.csc_matrix((vals, (rows, cols)), shape=(nsta, nsta))
+        self._lu = None
+
+    def __getstate__(self):
+        #
+        # The factorization can't be pickled; it will be redone as needed
+        #
+        state = self.__dict__.copy()
+        state["_lu"] = None
+        return state
+
+    @property
+    def nnz(self):
+        """
+        The number of nonzero elements of the covariance matrix.
+        """
+        return self.matrix.nnz
+
+    def solve(self, b):
+        """
+        Multiply an array by the inverse of the covariance matrix.
+
+        Args:
+            b (ndarray): An (nsta x n) or (nsta,) array.
+
+        Returns:
+            ndarray: The product of the inverse and b.
+        """
+        if self._lu is None:
+            self._lu = scipy.sparse.linalg.splu(
+                self.matrix,
+                permc_spec="MMD_AT_PLUS_A",
+                diag_pivot_thresh=0.0,
+                options={"SymmetricMode": True},
+            )
+        return self._lu.solve(np.asarray(b, dtype=np.float64))
+
+    def getSigma12(self, lons_rad, lats_rad, outperiod_ix, sdarr_phi, timers=None):
+        """
+        Build the sparse covariance between a set of output points and the
+        observations.
+
+        Args:
+            lons_rad (ndarray): The longitudes (radians) of the points.
+            lats_rad (ndarray): The latitudes (radians) of the points.
+            outperiod_ix (int): The period index of the output IMT.
+            sdarr_phi (ndarray): The within-event stddevs at the points.
+            timers (dict): If not None, the time spent finding neighbors
+                and computing distances, correlations, and covariances is
+                accumulated into the "distance", "correlation", and "sigma"
+                elements.
+
+        Returns:
+            csr_matrix: The (npts x nsta) covariance matrix.
+        """
+        time1 = time.time()
+        npts = np.size(lons_rad)
+        nsta = np.size(self.lons_rad)
+        pairs = cKDTree(_to_xyz(lons_rad, lats_rad)).sparse_distance_matrix(
+            self.tree, SEARCH_RADIUS_FACTOR * self.cutoff, output_type="ndarray"
+        )
+        rows = pairs["i"].astype(np.int_)
+        cols = pairs["j"].astype(np.int_)
+        dist = _pair_distance(
+            lons_rad[rows], lats_rad[rows], self.lons_rad[cols], self.lats_rad[cols]
+        )
+        keep = dist < self.cutoff
+        rows = rows[keep]
+        cols = cols[keep]
+        dist = dist[keep]
+        time2 = time.time()
+        corr = _pair_correlation(
+            self.ccf,
+            self.per_ix[cols],
+            np.full(np.size(cols), outperiod_ix, dtype=np.int_),
+            dist.copy(),
+        )
+        time3 = time.time()
+        vals = corr * taper_correlation(dist, self.cutoff)
+        vals *= self.phi[cols] * sdarr_phi[rows]
+        sigma12 = scipy.sparse.csr_matrix((vals, (rows, cols)), shape=(npts, nsta))
+        if timers is not None:
+            timers["distance"] += time2 - time1
+            timers["correlation"] += time3 - time2
+            timers["sigma"] += time.time() - time3
+        return sigma12
+
+
+def apply_inverse(cov_WD_WD_inv, b):
+    """
+    Multiply an array by the inverse of the station covariance matrix,
+    whether it is represented by a dense inverse or by a
+    SparseStationCovariance.
+
+    Args:
+        cov_WD_WD_inv (ndarray or SparseStationCovariance): The inverse
+            of the station covariance matrix, or its sparse
+            representation.
+        b (ndarray): The array to multiply.
+
+    Returns:
+        ndarray: The product.
+    """
+    if isinstance(cov_WD_WD_inv, SparseStationCovariance):
+        return cov_WD_WD_inv.solve(b)
+    return np.dot(cov_WD_WD_inv, b)
+
+
+class MVNStationData(object):
+    """
+    Container for the quantities used in the MVN computation of a single
+    output IMT that do not depend on the output locations: the station
+    coordinates, periods, and residuals, along with the products of the
+    bias computation (T_D, cov_WD_WD_inv, mu_H_yD, and cov_HH_yD).
+    """
+
+    def __init__(
+        self,
+        ccf,
+        outperiod_ix,
+        y_ix,
+        sta_lons_rad,
+        sta_lats_rad,
+        sta_per_ix,
+        sta_phi,
+        sta_resids,
+        T_D,
+        cov_WD_WD_inv,
+        mu_H_yD,
+        cov_HH_yD,
+        nearest_k=0,
+        sta_sig_extra=None,
+        precision="double",
+    ):
+        """
+        Args:
+            ccf (CrossCorrelationBase): The cross-correlation function.
+            outperiod_ix (int): The index of the (pseudo-) period of the
+                output IMT.
+            y_ix (int): The column of T_Y0 (and C) that corresponds to the
+                output IMT.
+            sta_lons_rad (ndarray): The station longitudes (radians).
+            sta_lats_rad (ndarray): The station latitudes (radians).
+            sta_per_ix (ndarray): The period indices of the station IMTs.
+            sta_phi (ndarray): The within-event stddevs of the stations.
+            sta_resids (ndarray): The station residuals, shape (nsta, 1).
+            T_D (ndarray): The station tau matrix from the bias.
+            cov_WD_WD_inv (ndarray or SparseStationCovariance): The
+                inverse of the station covariance, or its sparse
+                representation.
+            mu_H_yD (ndarray): The conditional mean of the bias.
+            cov_HH_yD (ndarray): The conditional covariance of the bias.
+            nearest_k (int): If greater than 0 (and less than the number of
+                stations), condition each tile of output points only on the
+                nearest_k nearest stations to each of its points (see
+                mvn_tile()).
+            sta_sig_extra (ndarray): The additional stddevs of the
+                stations; required if nearest_k is greater than 0.
+            precision (str): "double" or "single". In single precision, the
+                products of the (output points x stations) matrices with
+                the inverse station covariance and the other station
+                arrays are done in float32. Only the full (dense) MVN
+                supports single precision; the sparse and nearest-K modes
+                are always done in double precision.
+        """
+        self.ccf = ccf
+        self.outperiod_ix = outperiod_ix
+        self.y_ix = y_ix
+        self.sta_lons_rad = np.ascontiguousarray(sta_lons_rad, dtype=np.float64)
+        self.sta_lats_rad = np.ascontiguousarray(sta_lats_rad, dtype=np.float64)
+        self.sta_per_ix = np.asarray(sta_per_ix, dtype=np.int_)
+        self.sdsta_phi = np.ascontiguousarray(sta_phi, dtype=np.float64).flatten()
+        self.sta_resids = sta_resids
+        self.T_D = T_D
+        self.mu_H_yD = mu_H_yD
+        self.cov_HH_yD = cov_HH_yD
+        self.nsta = np.size(self.sta_lons_rad)
+        self.ncols = T_D.shape[1]
+        #
+        # With a sparse covariance we never form the regression
+        # coefficient matrix for the mean, so we need the products of the
+        # inverse with T_D and the residuals instead
+        #
+        if isinstance(cov_WD_WD_inv, SparseStationCovariance):
+            self.sparse_cov = cov_WD_WD_inv
+            self.cov_WD_WD_inv = None
+            self.cov_inv_T_D = cov_WD_WD_inv.solve(T_D)
+            self.cov_inv_resids = cov_WD_WD_inv.solve(sta_resids)
+        else:
+            self.sparse_cov = None
+            self.cov_WD_WD_inv = cov_WD_WD_inv
+        if 0 < nearest_k < self.nsta:
+            self.nearest_k = nearest_k
+            self.sta_sig_extra = np.asarray(sta_sig_extra, dtype=np.float64).ravel()
+            self.tree = cKDTree(_to_xyz(self.sta_lons_rad, self.sta_lats_rad))
+        else:
+            self.nearest_k = 0
+        #
+        # For the built-in correlation model, the distance, correlation,
+        # and sigma stages of mvn_tile() are done by a single fused kernel
+        # that needs the model coefficients of each station at the output
+        # period; other correlation functions use the separate stages
+        #
+        if type(ccf) is LothBaker2013:
+            self.lb_coeffs = tuple(
+                np.ascontiguousarray(bx[self.sta_per_ix, outperiod_ix])
+                for bx in (ccf.b1, ccf.b2, ccf.b3)
+            )
+        else:
+            self.lb_coeffs = None
+        #
+        # The float32 copies of the station arrays used in single
+        # precision; the float64 versions are kept for check_precision()
+        #
+        if precision == "single" and self.sparse_cov is None and self.nearest_k == 0:
+            self.dtype = np.float32
+            self.cov_WD_WD_inv_f32 = cov_WD_WD_inv.astype(np.float32)
+            self.T_D_f32 = np.asarray(T_D, dtype=np.float32)
+            self.sta_resids_f32 = np.asarray(sta_resids, dtype=np.float32)
+        else:
+            self.dtype = np.float64
+
+    def asDouble(self):
+        """
+        Return a copy of the station data that does the MVN in double
+        precision. The arrays are shared with the original.
+
+        Returns:
+            MVNStationData: The double-precision station data.
+        """
+        stadata = copy.copy(self)
+        stadata.dtype = np.float64
+        return stadata
+
+
+class MVNWorkspace(object):
+    """
+    Holds the (output points x stations) working arrays used by mvn_tile()
+    so that they can be reused from one tile to the next. The arrays are
+    only reallocated when the number of points in a tile changes (which
+    normally only happens at the edges of the grid).
+    """
+
+    def __init__(self, stadata):
+        self._stadata = stadata
+        self._npts = None
+
+    def getBuffers(self, npts):
+        """
+        Return the working arrays for a tile of npts output points.
+
+        Args:
+            npts (int): The number of output points in the tile.
+
+        Returns:
+            tuple: The sigma12 matrix, the regression coefficient matrix
+            (both of the station data's dtype), and the two period index
+            matrices used by the correlation function; each has shape
+            (npts, nsta). The index matrices are
+            None if the station data uses the fused kernel.
+        """
+        if npts != self._npts:
+            nsta = self._stadata.nsta
+            dtype = self._stadata.dtype
+            self.matrix12 = np.empty((npts, nsta), dtype=dtype)
+            self.rcmatrix = np.empty((npts, nsta), dtype=dtype)
+            if self._stadata.lb_coeffs is None:
+                self.t1_12 = np.empty((npts, nsta), dtype=np.int_)
+                self.t1_12[:] = self._stadata.sta_per_ix.reshape((1, -1))
+                self.t2_12 = np.full(
+                    (npts, nsta), self._stadata.outperiod_ix, dtype=np.int_
+                )
+            else:
+                self.t1_12 = self.t2_12 = None
+            self._npts = npts
+        return self.matrix12, self.rcmatrix, self.t1_12, self.t2_12
+
+
+def get_tile_shape(nx, ny, nsta, ncols, max_memory):
+    """
+    Compute the shape of the rectangular tiles into which the output
+    grid will be divided for the MVN computation.
+
+    Args:
+        nx (int): The number of output points in the x direction.
+        ny (int): The number of output points in the y direction.
+        nsta (int): The number of station observations.
+        ncols (int): The number of columns of T_D (i.e., the number of
+            IMT types involved in the bias).
+        max_memory (float): The approximate memory budget (in megabytes)
+            for the per-tile working arrays. A value of 0 (or less)
+            produces tiles that are a single row of the grid.
+
+    Returns:
+        tuple: The number of rows and the number of columns in a tile.
+    """
+    if max_memory <= 0:
+        return 1, nx
+    #
+    # Per output point we need the sigma12 and rcmatrix arrays and the
+    # two index arrays (nsta elements each), C and its temporaries
+    # (ncols elements each), and a handful of vectors.
+    #
+    bytes_per_point = 8 * (4 * nsta + 4 * ncols + 12)
+    npts = max(1, int(max_memory * 1024 * 1024 // bytes_per_point))
+    tile_nx = min(nx, max(1, int(np.sqrt(npts))))
+    tile_ny = min(ny, max(1, npts // tile_nx))
+    if tile_ny == ny:
+        tile_nx = min(nx, max(1, npts // tile_ny))
+    return tile_ny, tile_nx
+
+
+def get_local_tile_shape(nx, ny, nearest_k, ncols, max_memory):
+    """
+    Compute the shape of the tiles for the nearest-K (local) MVN. The
+    tiles are square (so that the points in a tile share most of their
+    nearest stations) and no larger than LOCAL_TILE_SIZE points on a
+    side, or than the memory budget allows.
+
+    Args:
+        nx (int): The number of output points in the x direction.
+        ny (int): The number of output points in the y direction.
+        nearest_k (int): The number of nearest stations used for each
+            point.
+        ncols (int): The number of columns of T_D.
+        max_memory (float): The approximate memory budget (in megabytes)
+            for the per-tile working arrays, or 0 for no budget.
+
+    Returns:
+        tuple: The number of rows and the number of columns in a tile.
+    """
+    side = LOCAL_TILE_SIZE
+    if max_memory > 0:
+        #
+        # Allow for the tile's set of stations being a few times
+        # larger than nearest_k
+        #
+        tile_ny, tile_nx = get_tile_shape(nx, ny, 4 * nearest_k, ncols, max_memory)
+        side = max(1, min(side, tile_ny, tile_nx))
+    return min(ny, side), min(nx, side)
+
+
+def iter_tiles(nx, ny, tile_ny, tile_nx):
+    """
+    Generate the bounds of the tiles covering an ny x nx grid.
+
+    Args:
+        nx (int): The number of points in the x direction.
+        ny (int): The number of points in the y direction.
+        tile_ny (int): The number of rows in a tile.
+        tile_nx (int): The number of columns in a tile.
+
+    Yields:
+        tuple: The (iy0, iy1, ix0, ix1) bounds of each tile, so that the
+        tile of a grid is grid[iy0:iy1, ix0:ix1].
+    """
+    for iy0 in range(0, ny, tile_ny):
+        iy1 = min(iy0 + tile_ny, ny)
+        for ix0 in range(0, nx, tile_nx):
+            yield iy0, iy1, ix0, min(ix0 + tile_nx, nx)
+
+
+def make_output_array(shape, filename=None):
+    """
+    Create a float64 array to hold an MVN output. If filename is given,
+    the array is a memory-mapped .npy file so that the finished tiles
+    are written to disk rather than accumulating in memory.
+
+    Args:
+        shape (tuple): The shape of the array.
+        filename (str): The path to the file that will back the array,
+            or None for an in-memory array.
+
+    Returns:
+        ndarray: A zero-filled array (or memmap) of the requested shape.
+    """
+    if filename is None:
+        return np.zeros(shape, dtype=np.float64)
+    return np.lib.format.open_memmap(filename, mode="w+", dtype=np.float64, shape=shape)
+
+
+def mvn_tile(stadata, lons_rad, lats_rad, pout_mean, sdarr_phi, tsd, work, timers):
+    """
+    Do the MVN computations for a set of output points.
+
+    Args:
+        stadata (MVNStationData): The station data and bias products for
+            the output IMT.
+        lons_rad (ndarray): The longitudes (radians) of the output points.
+        lats_rad (ndarray): The latitudes (radians) of the output points.
+        pout_mean (ndarray): The predicted means at the output points.
+        sdarr_phi (ndarray): The within-event stddevs at the output points.
+        tsd (ndarray): The between-event stddevs at the output points.
+        work (MVNWorkspace): The working arrays.
+        timers (dict): A dictionary keyed by the names in MVN_TIMERS into
+            which the time spent in each stage is accumulated.
+
+    Returns:
+        tuple: Four arrays: the conditional mean, the conditional
+        within-event variance, and the conditional between-event
+        variance at the output points (each 1-D), and the matrix C
+        (npts x ncols) of Engler et al. (2021).
+    """
+    lons_rad = np.ascontiguousarray(lons_rad, dtype=np.float64).ravel()
+    lats_rad = np.ascontiguousarray(lats_rad, dtype=np.float64).ravel()
+    sdarr_phi = np.ascontiguousarray(sdarr_phi, dtype=np.float64).ravel()
+    if stadata.nearest_k > 0:
+        return _mvn_tile_local(
+            stadata, lons_rad, lats_rad, pout_mean, sdarr_phi, tsd, timers
+        )
+    if stadata.sparse_cov is not None:
+        return _mvn_tile_sparse(
+            stadata, lons_rad, lats_rad, pout_mean, sdarr_phi, tsd, timers
+        )
+    npts = np.size(lons_rad)
+    matrix12_phi, rcmatrix_phi, t1_12, t2_12 = work.getBuffers(npts)
+
+    if stadata.lb_coeffs is not None:
+        time4 = time.time()
+        make_lb_sigma_matrix(
+            stadata.sta_lons_rad,
+            stadata.sta_lats_rad,
+            *stadata.lb_coeffs,
+            stadata.sdsta_phi,
+            lons_rad,
+            lats_rad,
+            sdarr_phi,
+            matrix12_phi,
+        )
+        timers["fused"] += time.time() - time4
+    else:
+        #
+        # The correlation functions work in double precision
+        #
+        if stadata.dtype == np.float64:
+            sigma12 = matrix12_phi
+        else:
+            sigma12 = np.empty(matrix12_phi.shape, dtype=np.float64)
+        time4 = time.time()
+        geodetic_distance_fast(
+            stadata.sta_lons_rad,
+            stadata.sta_lats_rad,
+            lons_rad,
+            lats_rad,
+            sigma12,
+        )
+        timers["distance"] += time.time() - time4
+        time4 = time.time()
+        stadata.ccf.getCorrelation(t1_12, t2_12, sigma12)
+        timers["correlation"] += time.time() - time4
+        time4 = time.time()
+        make_sigma_matrix(sigma12, stadata.sdsta_phi, sdarr_phi)
+        if sigma12 is not matrix12_phi:
+            matrix12_phi[...] = sigma12
+        timers["sigma"] += time.time() - time4
+    if stadata.dtype == np.float32:
+        cov_WD_WD_inv = stadata.cov_WD_WD_inv_f32
+        T_D = stadata.T_D_f32
+        sta_resids = stadata.sta_resids_f32
+    else:
+        cov_WD_WD_inv = stadata.cov_WD_WD_inv
+        T_D = stadata.T_D
+        sta_resids = stadata.sta_resids
+    time4 = time.time()
+    #
+    # Sigma12 * Sigma22^-1 is known as the 'regression
+    # coefficient' matrix (rcmatrix)
+    #
+    np.dot(matrix12_phi, cov_WD_WD_inv, out=rcmatrix_phi)
+    timers["rcmatrix"] += time.time() - time4
+    time4 = time.time()
+    #
+    # We only want the diagonal elements of the conditional
+    # covariance matrix, so make_sd_array finds them without forming
+    # the full product.
+    #
+    cov_WY_WY_WD = np.empty((1, npts), dtype=np.float64)
+    make_sd_array(
+        cov_WY_WY_WD, (sdarr_phi**2).reshape((1, -1)), 0, rcmatrix_phi, matrix12_phi
+    )
+    #
+    # Equation B32 of Engler et al. (2021): C = T_Y0 - rcmatrix * T_D,
+    # where T_Y0 is zero except for the column of the output IMT
+    #
+    C = np.dot(rcmatrix_phi, T_D).astype(np.float64, copy=False)
+    np.negative(C, out=C)
+    C[:, stadata.y_ix] += np.ravel(tsd)
+    #
+    # mu_Y_yD = mu_Y + C mu_H_yD + cov_WY_WD cov_WD_WD^-1 zeta
+    #
+    ampgrid = np.ravel(pout_mean) + np.dot(C, stadata.mu_H_yD).reshape((-1,))
+    ampgrid += np.dot(rcmatrix_phi, sta_resids).reshape((-1,))
+    timers["amp"] += time.time() - time4
+    time4 = time.time()
+    #
+    # The between-event part of the diagonal of the conditional
+    # covariance (the second term of equation B27 of Engler et al. (2021))
+    #
+    sdgrid_tau = np.sum(np.dot(C, stadata.cov_HH_yD) * C, axis=1)
+    timers["sd"] += time.time() - time4
+
+    return ampgrid, cov_WY_WY_WD.reshape((-1,)), sdgrid_tau, C
+
+
+def _mvn_tile_sparse(stadata, lons_rad, lats_rad, pout_mean, sdarr_phi, tsd, timers):
+    """
+    The equivalent of mvn_tile() for a sparse station covariance.
+    """
+    sparse_cov = stadata.sparse_cov
+    sigma12 = sparse_cov.getSigma12(
+        lons_rad, lats_rad, stadata.outperiod_ix, sdarr_phi, timers
+    )
+    time4 = time.time()
+    #
+    # C = T_Y0 - Sigma12 Sigma22^-1 T_D (equation B32 of Engler et al.
+    # (2021)) and mu_Y_yD = mu_Y + C mu_H_yD + Sigma12 Sigma22^-1 zeta
+    #
+    C = -(sigma12 @ stadata.cov_inv_T_D)
+    C[:, stadata.y_ix] += np.ravel(tsd)
+    ampgrid = np.ravel(pout_mean) + np.dot(C, stadata.mu_H_yD).reshape((-1,))
+    ampgrid += (sigma12 @ stadata.cov_inv_resids).reshape((-1,))
+    timers["amp"] += time.time() - time4
+    #
+    # The diagonal of Sigma12 Sigma22^-1 Sigma21; only the points with
+    # stations within the cutoff distance are affected
+    #
+    time4 = time.time()
+    cov_WY_WY_WD = sdarr_phi**2
+    nbrs = np.where(np.diff(sigma12.indptr) > 0)[0]
+    if np.size(nbrs) > 0:
+        s12 = sigma12[nbrs]
+        rc_T = sparse_cov.solve(s12.T.toarray())
+        cov_WY_WY_WD[nbrs] -= np.asarray(s12.multiply(rc_T.T).sum(axis=1)).ravel()
+        np.clip(cov_WY_WY_WD, 0, None, out=cov_WY_WY_WD)
+    timers["rcmatrix"] += time.time() - time4
+    time4 = time.time()
+    sdgrid_tau = np.sum(np.dot(C, stadata.cov_HH_yD) * C, axis=1)
+    timers["sd"] += time.time() - time4
+
+    return ampgrid, cov_WY_WY_WD, sdgrid_tau, C
+
+
+def _mvn_tile_local(stadata, lons_rad, lats_rad, pout_mean, sdarr_phi, tsd, timers):
+    """
+    The equivalent of mvn_tile() that conditions the output points only
+    on the stations that are among the nearest_k nearest stations to any
+    of the points (i.e., local kriging). The covariance matrix of those
+    stations is built and inverted for the tile.
+    """
+    npts = np.size(lons_rad)
+    time4 = time.time()
+    _, nbrs = stadata.tree.query(_to_xyz(lons_rad, lats_rad), k=stadata.nearest_k)
+    local = np.unique(nbrs)
+    nloc = np.size(local)
+    loc_lons = np.ascontiguousarray(stadata.sta_lons_rad[local])
+    loc_lats = np.ascontiguousarray(stadata.sta_lats_rad[local])
+    loc_per_ix = np.ascontiguousarray(stadata.sta_per_ix[local])
+    loc_phi = np.ascontiguousarray(stadata.sdsta_phi[local])
+    matrix22 = np.empty((nloc, nloc), dtype=np.float64)
+    geodetic_distance_fast(loc_lons, loc_lats, loc_lons, loc_lats, matrix22)
+    matrix12_phi = np.empty((npts, nloc), dtype=np.float64)
+    geodetic_distance_fast(loc_lons, loc_lats, lons_rad, lats_rad, matrix12_phi)
+    timers["distance"] += time.time() - time4
+    time4 = time.time()
+    t1 = np.empty((nloc, nloc), dtype=np.int_)
+    t1[:] = loc_per_ix.reshape((1, -1))
+    stadata.ccf.getCorrelation(t1, np.ascontiguousarray(t1.T), matrix22)
+    t1_12 = np.empty((npts, nloc), dtype=np.int_)
+    t1_12[:] = loc_per_ix.reshape((1, -1))
+    t2_12 = np.full((npts, nloc), stadata.outperiod_ix, dtype=np.int_)
+    stadata.ccf.getCorrelation(t1_12, t2_12, matrix12_phi)
+    timers["correlation"] += time.time() - time4
+    time4 = time.time()
+    make_sigma_matrix(matrix22, loc_phi, loc_phi)
+    matrix22[np.diag_indices(nloc)] += stadata.sta_sig_extra[local] ** 2
+    make_sigma_matrix(matrix12_phi, loc_phi, sdarr_phi)
+    timers["sigma"] += time.time() - time4
+    time4 = time.time()
+    cov_WD_WD_inv, _ = invert_covariance(matrix22)
+    rcmatrix_phi = np.dot(matrix12_phi, cov_WD_WD_inv)
+    timers["rcmatrix"] += time.time() - time4
+    time4 = time.time()
+    cov_WY_WY_WD = np.empty((1, npts), dtype=np.float64)
+    make_sd_array(
+        cov_WY_WY_WD, (sdarr_phi**2).reshape((1, -1)), 0, rcmatrix_phi, matrix12_phi
+    )
+    C = np.dot(rcmatrix_phi, stadata.T_D[local])
+    np.negative(C, out=C)
+    C[:, stadata.y_ix] += np.ravel(tsd)
+    ampgrid = np.ravel(pout_mean) + np.dot(C, stadata.mu_H_yD).reshape((-1,))
+    ampgrid += np.dot(rcmatrix_phi, stadata.sta_resids[local]).reshape((-1,))
+    timers["amp"] += time.time() - time4
+    time4 = time.time()
+    sdgrid_tau = np.sum(np.dot(C, stadata.cov_HH_yD) * C, axis=1)
+    timers["sd"] += time.time() - time4
+
+    return ampgrid, cov_WY_WY_WD.reshape((-1,)), sdgrid_tau, C
+
+
+class SharedArray(object):
+    """
+    A copy of an array in shared memory. When pickled (e.g., to be passed
+    to a worker process), only the name of the shared memory block is
+    sent; unpickling attaches to the block so that the worker sees the
+    parent's data without copying it.
+
+    The process that creates a SharedArray owns the block and must call
+    release() when the workers are finished with it. Workers call close().
+    """
+
+    def __init__(self, array):
+        """
+        Args:
+            array (ndarray): The array to copy into shared memory.
+        """
+        array = np.asarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        self.name = self._shm.name
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+        self.array[...] = array
+
+    def __getstate__(self):
+        return {"shape": self.shape, "dtype": self.dtype, "name": self.name}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = shared_memory.SharedMemory(name=self.name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def close(self):
+        """
+        Detach from the shared memory block. Any views of the array must
+        have been deleted before this is called.
+        """
+        self.array = None
+        self._shm.close()
+
+    def release(self):
+        """
+        Detach from and destroy the shared memory block.
+        """
+        self.close()
+        self._shm.unlink()
+
+
+class MVNJob(object):
+    """
+    Everything needed to run the MVN for one output IMT over any part of
+    the output grid: the station data, the gridded inputs (the output
+    coordinates and the prior means and stddevs), and the output arrays
+    into which the results for each tile are written.
+
+    A job may be run in the process that created it, or it may be shared
+    (see share()) and pickled to worker processes, each of which runs
+    some of its blocks. The outputs of a shared job must be memory-mapped
+    files (see make_output_array()) so that the workers can write their
+    parts of the results in place.
+    """
+
+    #
+    # The gridded inputs, and the station data arrays that are large
+    # enough to be worth putting in shared memory
+    #
+    _GRID_INPUTS = ("lons_rad", "lats_rad", "pout_mean", "psd", "tsd")
+    _STATION_INPUTS = (
+        "sta_lons_rad",
+        "sta_lats_rad",
+        "T_D",
+        "cov_WD_WD_inv",
+        "cov_WD_WD_inv_f32",
+    )
+
+    def __init__(
+        self, imtstr, stadata, lons_rad, lats_rad, pout_mean, psd, tsd, outputs
+    ):
+        """
+        Args:
+            imtstr (str): The output IMT.
+            stadata (MVNStationData): The station data and bias products for
+                the output IMT.
+            lons_rad (ndarray): The longitudes (radians) of the output grid.
+            lats_rad (ndarray): The latitudes (radians) of the output grid.
+            pout_mean (ndarray): The predicted means on the output grid.
+            psd (ndarray): The within-event stddevs on the output grid.
+            tsd (ndarray): The between-event stddevs on the output grid.
+            outputs (dict): The arrays that will hold the results: "mean",
+                "std", and "tau" (each the shape of the grid) and,
+                optionally, "C" (the shape of the grid plus a dimension of
+                stadata.ncols).
+        """
+        self.imtstr = imtstr
+        self.stadata = stadata
+        self.lons_rad = lons_rad
+        self.lats_rad = lats_rad
+        self.pout_mean = pout_mean
+        self.psd = psd
+        self.tsd = tsd
+        self.outputs = outputs
+        #
+        # The shape of the tiles, the bounds (if any) to which the
+        # conditional mean is clipped, and the time at which the work on
+        # the job started (for logging); these may be changed by the
+        # creator of the job
+        #
+        self.tile_shape = (1, lons_rad.shape[1])
+        self.clip = None
+        self.start_time = time.time()
+        self._shared = {}
+
+    def share(self):
+        """
+        Copy the large inputs into shared memory so that the job can be
+        sent to worker processes cheaply.
+
+        Returns:
+            list: The SharedArrays that were created. The caller must
+            release() them once the workers are finished.
+        """
+        for name in self._GRID_INPUTS:
+            self._shared[name] = SharedArray(getattr(self, name))
+        for name in self._STATION_INPUTS:
+            if getattr(self.stadata, name, None) is None:
+                continue
+            self._shared["stadata." + name] = SharedArray(getattr(self.stadata, name))
+        return list(self._shared.values())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        stadata = copy.copy(self.stadata)
+        for key in self._shared:
+            if key.startswith("stadata."):
+                setattr(stadata, key[8:], None)
+            else:
+                state[key] = None
+        state["stadata"] = stadata
+        state["outputs"] = {key: val.filename for key, val in self.outputs.items()}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for key, sarray in self._shared.items():
+            if key.startswith("stadata."):
+                setattr(self.stadata, key[8:], sarray.array)
+            else:
+                setattr(self, key, sarray.array)
+        self.outputs = {
+            key: np.load(fname, mmap_mode="r+") for key, fname in self.outputs.items()
+        }
+
+    def close(self):
+        """
+        Flush the outputs and detach from the shared inputs of a job that
+        has been unpickled in a worker process.
+        """
+        for output in self.outputs.values():
+            output.flush()
+        self.outputs = {}
+        for key in self._shared:
+            if key.startswith("stadata."):
+                setattr(self.stadata, key[8:], None)
+            else:
+                setattr(self, key, None)
+        for sarray in self._shared.values():
+            sarray.close()
+
+
+def get_blocks(nx, ny, tile_ny, tile_nx, nblocks):
+    """
+    Divide the tiles covering an ny x nx grid into a number of blocks of
+    consecutive tiles; for the default tiles (one row of the grid each)
+    the blocks are bands of rows.
+
+    Args:
+        nx (int): The number of points in the x direction.
+        ny (int): The number of points in the y direction.
+        tile_ny (int): The number of rows in a tile.
+        tile_nx (int): The number of columns in a tile.
+        nblocks (int): The desired number of blocks.
+
+    Returns:
+        list: A list of (at most nblocks) blocks, each of which is a list
+        of tile bounds as produced by iter_tiles().
+    """
+    tiles = list(iter_tiles(nx, ny, tile_ny, tile_nx))
+    per_block = math.ceil(len(tiles) / max(1, nblocks))
+    return [tiles[i : i + per_block] for i in range(0, len(tiles), per_block)]
+
+
+def mvn_block(job, tiles):
+    """
+    Do the MVN for a block of tiles of a job, writing the results into the
+    job's output arrays.
+
+    Args:
+        job (MVNJob): The job.
+        tiles (list): The (iy0, iy1, ix0, ix1) bounds of the tiles.
+
+    Returns:
+        dict: The time spent in each stage of the computation, keyed by
+        the names in MVN_TIMERS.
+    """
+    stadata = job.stadata
+    work = MVNWorkspace(stadata)
+    timers = dict.fromkeys(MVN_TIMERS, 0.0)
+    ampgrid = job.outputs["mean"]
+    sdgrid = job.outputs["std"]
+    taugrid = job.outputs["tau"]
+    C_complete = job.outputs.get("C")
+    for iy0, iy1, ix0, ix1 in tiles:
+        tile_shape = (iy1 - iy0, ix1 - ix0)
+        amp, cov_WY_WY_WD, sdgrid_tau, C = mvn_tile(
+            stadata,
+            job.lons_rad[iy0:iy1, ix0:ix1],
+            job.lats_rad[iy0:iy1, ix0:ix1],
+            job.pout_mean[iy0:iy1, ix0:ix1],
+            job.psd[iy0:iy1, ix0:ix1],
+            job.tsd[iy0:iy1, ix0:ix1],
+            work,
+            timers,
+        )
+        if job.clip is not None:
+            np.clip(amp, job.clip[0], job.clip[1], out=amp)
+        if C_complete is not None:
+            C_complete[iy0:iy1, ix0:ix1, :] = C.reshape(tile_shape + (stadata.ncols,))
+        ampgrid[iy0:iy1, ix0:ix1] = amp.reshape(tile_shape)
+        #
+        # The outputs are the conditional total stddev and the
+        # conditional between-event stddev (tau)
+        #
+        sdgrid[iy0:iy1, ix0:ix1] = np.sqrt(cov_WY_WY_WD + sdgrid_tau).reshape(
+            tile_shape
+        )
+        taugrid[iy0:iy1, ix0:ix1] = np.sqrt(sdgrid_tau).reshape(tile_shape)
+    return timers
+
+
+def check_precision(job, nrows=PRECISION_CHECK_ROWS):
+    """
+    Estimate the error of a job that was run in single precision by
+    redoing a sample of the rows of the grid in double precision and
+    comparing the results with the job's outputs.
+
+    Args:
+        job (MVNJob): The (completed) job.
+        nrows (int): The number of rows to check; they are spread evenly
+            over the grid.
+
+    Returns:
+        tuple: The maximum absolute differences of the conditional mean
+        and of the conditional total stddev (in the units of the output
+        IMT, i.e., ln units except for MMI).
+    """
+    ny, nx = job.lons_rad.shape
+    rows = np.unique(np.linspace(0, ny - 1, min(ny, max(1, nrows))).astype(int))
+    stadata = job.stadata.asDouble()
+    work = MVNWorkspace(stadata)
+    timers = dict.fromkeys(MVN_TIMERS, 0.0)
+    mean_err = 0.0
+    std_err = 0.0
+    for iy in rows:
+        amp, cov_WY_WY_WD, sdgrid_tau, _ = mvn_tile(
+            stadata,
+            job.lons_rad[iy],
+            job.lats_rad[iy],
+            job.pout_mean[iy],
+            job.psd[iy],
+            job.tsd[iy],
+            work,
+            timers,
+        )
+        if job.clip is not None:
+            np.clip(amp, job.clip[0], job.clip[1], out=amp)
+        std = np.sqrt(cov_WY_WY_WD + sdgrid_tau)
+        mean_err = max(mean_err, np.max(np.abs(job.outputs["mean"][iy] - amp)))
+        std_err = max(std_err, np.max(np.abs(job.outputs["std"][iy] - std)))
+    return mean_err, std_err
+
+
+def run_mvn_block(job, tiles):
+    """
+    Run mvn_block() in a worker process on a job that has been shared by
+    the parent, then detach from the job's shared data.
+
+    Args:
+        job (MVNJob): The (unpickled) job.
+        tiles (list): The (iy0, iy1, ix0, ix1) bounds of the tiles.
+
+    Returns:
+        tuple: The IMT of the job and the timers returned by mvn_block().
+    """
+    try:
+        timers = mvn_block(job, tiles)
+    finally:
+        job.close()
+    return job.imtstr, timers
@@ -284,7 +284,35 @@ def test_abrahamsonbhasin2020pga():
     np.testing.assert_almost_equal(phi_ref, stddevs[2])
 
 
+def test_abrahamsonbhasin2020_shared():
+    # One instance converts the SA of several GMPEs at the same points
+    ab2020 = AbrahamsonBhasin2020(6.5)
+    sdtypes = [const.StdDev.TOTAL]
+    rrup = np.array([2.0, 10.0, 20.0, 30.0, 40.0])
+    vs30 = np.array([200.0, 180.0, 420.0, 630.0, 740.0])
+    psa1 = np.array([1.0, 0.8, 0.6, 0.4, 0.2])
+    psa2 = np.array([0.9, 0.7, 0.5, 0.3, 0.1])
+    sd = [np.full(5, 0.7)]
+    offset = ab2020.getOffset(rrup, vs30)
+    assert ab2020.getOffset(rrup, vs30) is offset
+    pgv1, _ = ab2020.getPGVandSTDDEVS(psa1, sd, sdtypes, rrup, vs30)
+    pgv2, _ = ab2020.getPGVandSTDDEVS(psa2, sd, sdtypes, rrup, vs30)
+    for psa, pgv in ((psa1, pgv1), (psa2, pgv2)):
+        ref, _ = AbrahamsonBhasin2020(6.5).getPGVandSTDDEVS(
+            psa, sd, sdtypes, rrup, vs30
+        )
+        np.testing.assert_allclose(pgv, ref)
+    np.testing.assert_allclose(pgv1 - pgv2, ab2020.getF1() * (psa1 - psa2))
+    # Different points get new terms
+    rrup2 = rrup + 10.0
+    assert ab2020.getOffset(rrup2, vs30) is not offset
+    pgv3, _ = ab2020.getPGVandSTDDEVS(psa1, sd, sdtypes, rrup2, vs30)
+    ref, _ = AbrahamsonBhasin2020(6.5).getPGVandSTDDEVS(psa1, sd, sdtypes, rrup2, vs30)
+    np.testing.assert_allclose(pgv3, ref)
+
+
 if __name__ == "__main__":
     test_abrahamsonbhasin2020()
     test_abrahamsonbhasin2020sa1()
     test_abrahamsonbhasin2020pga()
+    test_abrahamsonbhasin2020_shared()
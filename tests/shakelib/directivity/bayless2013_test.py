@@ -17,6 +17,7 @@ from openquake.hazardlib.geo import point
 from openquake.hazardlib.geo.utils import OrthographicProjection
 
 # local imports
+from shakelib.directivity import bayless2013
 from shakelib.directivity.bayless2013 import Bayless2013
 
 homedir = os.path.dirname(os.path.abspath(__file__))  # where is this script?
@@ -1969,6 +1970,72 @@ def test_so6():
     np.testing.assert_allclose(fd, fd_test, rtol=1e-4)
 
 
+def test_multi_segment_blocks():
+    # The quads are evaluated together for blocks of sites; the result
+    # must not depend on the block size
+    magnitude = 7.2
+    dip = np.array([90.0, 90.0, 70.0])
+    rake = 135.0
+    width = np.array([15.0, 15.0, 10.0])
+    rupx = np.array([0.0, 0.0, 10.0, 20.0])
+    rupy = np.array([0.0, 20.0, 60.0, 80.0])
+    zp = np.array([0.0, 0.0, 0.0])
+    epix = np.array([0.0])
+    epiy = np.array([30.0])
+
+    # Convert to lat/lon
+    proj = OrthographicProjection(-122, -120, 39, 37)
+    tlon, tlat = proj(rupx, rupy, reverse=True)
+    epilon, epilat = proj(epix, epiy, reverse=True)
+
+    event = {
+        "lat": epilat[0],
+        "lon": epilon[0],
+        "depth": 8.0,
+        "mag": magnitude,
+        "id": "",
+        "netid": "",
+        "network": "",
+        "locstring": "test",
+        "mech": "SS",
+        "rake": rake,
+    }
+    event["time"] = HistoricTime.utcfromtimestamp(int(time.time()))
+    origin = Origin(event)
+
+    rup = QuadRupture.fromTrace(
+        np.array(tlon[0:3]),
+        np.array(tlat[0:3]),
+        np.array(tlon[1:4]),
+        np.array(tlat[1:4]),
+        zp,
+        width,
+        dip,
+        origin,
+        reference="",
+    )
+
+    x = np.linspace(-60, 80, 15)
+    y = np.linspace(-40, 120, 17)
+    site_x, site_y = np.meshgrid(x, y)
+    slon, slat = proj(site_x, site_y, reverse=True)
+    deps = np.zeros_like(slon)
+
+    test1 = Bayless2013(origin, rup, slat, slon, deps, T=5.0)
+    fd = test1.getFd()
+    assert fd.shape == slat.shape
+    assert np.all(np.isfinite(fd))
+    assert np.any(fd != 0)
+
+    block_size = bayless2013.BLOCK_SIZE
+    try:
+        for bayless2013.BLOCK_SIZE in [1, 7, 100]:
+            test2 = Bayless2013(origin, rup, slat, slon, deps, T=5.0)
+            np.testing.assert_allclose(test2.getFd(), fd, rtol=1e-12, atol=1e-15)
+    finally:
+        bayless2013.BLOCK_SIZE = block_size
+
+
 if __name__ == "__main__":
     test_ss3()
     test_rv4()
@@ -1977,3 +2044,4 @@ if __name__ == "__main__":
     test_ss3_move_hypo1()
     test_ss3_m4p5()
     test_rv4()
+    test_multi_segment_blocks()
@@ -7442,9 +7442,112 @@ def test_so6():
     np.testing.assert_allclose(fd, fd_test, atol=1e-4)
 
 
+def test_geometry_taper_cutoff():
+    magnitude = 7.2
+    dip = np.array([90])
+    rake = 180.0
+    width = np.array([15])
+    rupx = np.array([0, 0])
+    rupy = np.array([0, 80])
+    zp = np.array([0])
+    epix = np.array([0])
+    epiy = np.array([0.2 * rupy[1]])
+
+    # Convert to lat/lon
+    proj = OrthographicProjection(-122, -120, 39, 37)
+    tlon, tlat = proj(rupx, rupy, reverse=True)
+    epilon, epilat = proj(epix, epiy, reverse=True)
+
+    # Origin
+    origin = Origin(
+        {
+            "lat": epilat[0],
+            "lon": epilon[0],
+            "depth": 10,
+            "mag": magnitude,
+            "id": "ss3",
+            "netid": "",
+            "network": "",
+            "locstring": "",
+            "time": HistoricTime.utcfromtimestamp(int(time.time())),
+            "rake": rake,
+        }
+    )
+
+    # Rupture
+    rup = QuadRupture.fromTrace(
+        np.array([tlon[0]]),
+        np.array([tlat[0]]),
+        np.array([tlon[1]]),
+        np.array([tlat[1]]),
+        zp,
+        width,
+        dip,
+        origin,
+        reference="ss3",
+    )
+
+    # Sites
+    x = np.linspace(-120, 120, 41)
+    y = np.linspace(-120, 200, 51)
+    site_x, site_y = np.meshgrid(x, y)
+    slon, slat = proj(site_x, site_y, reverse=True)
+    deps = np.zeros_like(slon)
+
+    periods = Rowshandel2013.getPeriods()
+    test1 = Rowshandel2013(origin, rup, slat, slon, deps, dx=1, T=periods)
+
+    # The geometry can be shared by other sites
+    geometry = test1.getGeometry()
+    test2 = Rowshandel2013(
+        origin,
+        rup,
+        slat[::2, ::2],
+        slon[::2, ::2],
+        deps[::2, ::2],
+        dx=1,
+        T=periods,
+        geometry=geometry,
+    )
+    assert test2.getGeometry() is geometry
+    np.testing.assert_allclose(test2.getXiPrime(), test1.getXiPrime()[::2, ::2])
+    for fd1, fd2 in zip(test1.getFd(), test2.getFd()):
+        np.testing.assert_allclose(fd2, fd1[::2, ::2])
+
+    # With the cutoff, xi' and LD are only computed where DT is nonzero
+    # for some period, but Fd is the same
+    test3 = Rowshandel2013(
+        origin,
+        rup,
+        slat,
+        slon,
+        deps,
+        dx=1,
+        T=periods,
+        geometry=geometry,
+        taper_cutoff=True,
+    )
+    in_taper = np.any(np.array(test1.getDT()) > 0, axis=0)
+    assert np.any(~in_taper)
+    np.testing.assert_allclose(
+        test3.getXiPrime()[in_taper], test1.getXiPrime()[in_taper]
+    )
+    np.testing.assert_allclose(test3.getLD()[in_taper], test1.getLD()[in_taper])
+    assert np.all(np.isnan(test3.getXiPrime()[~in_taper]))
+    for fd1, fd3 in zip(test1.getFd(), test3.getFd()):
+        np.testing.assert_allclose(fd3, fd1, atol=1e-12)
+
+    # The geometry must be for the same rupture and mesh spacing
+    with pytest.raises(ValueError):
+        Rowshandel2013(
+            origin, rup, slat, slon, deps, dx=2, T=periods, geometry=geometry
+        )
+
+
 if __name__ == "__main__":
     test_exceptions()
     test_fromSites()
     test_ss3()
     test_rv4()
     test_so6()
+    test_geometry_taper_cutoff()
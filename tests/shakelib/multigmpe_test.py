@@ -28,14 +28,24 @@ from openquake.hazardlib.gsim.pezeshk_2011 import PezeshkEtAl2011NEHRPBC
 from openquake.hazardlib.gsim.zhao_2006 import ZhaoEtAl2006Asc
 
 # local imports
+import shakelib.multigmpe as multigmpe
 import shakelib.sites as sites
 from shakelib.conversions.imc.boore_kishida_2017 import BooreKishida2017
 from shakelib.multigmpe import (
     MultiGMPE,
+    clear_multigmpe_cache,
     filter_gmpe_list,
+    get_multigmpe_cache_stats,
+    set_site_factor_cache,
     set_sites_depth_parameters,
     stuff_context,
 )
+from shakelib.multiutils import (
+    combine_stddevs,
+    get_segments,
+    merge_contexts,
+    split_results,
+)
 
 homedir = os.path.dirname(os.path.abspath(__file__))  # where is this script?
 shakedir = os.path.abspath(os.path.join(homedir, "..", ".."))
@@ -3604,6 +3614,382 @@ def test_multigmpe_exceptions():
         )
 
 
+def test_merge_contexts():
+    ASK14 = AbrahamsonEtAl2014()
+    CY14 = ChiouYoungs2014()
+    mgmpe = MultiGMPE.__from_list__([ASK14, CY14], [0.6, 0.4], imc=const.IMC.RotD50)
+    iimt = imt.SA(1.0)
+    stddev_types = [const.StdDev.TOTAL, const.StdDev.INTER_EVENT]
+
+    rctx = RuptureContext()
+    rctx.rake = 0.0
+    rctx.dip = 90.0
+    rctx.ztor = 0.0
+    rctx.mag = 7.0
+    rctx.width = 10.0
+    rctx.hypo_depth = 8.0
+
+    def make_contexts(shape, vs30, grid=False):
+        dctx = DistancesContext()
+        dctx.rjb = np.logspace(0, np.log10(300), np.prod(shape)).reshape(shape)
+        dctx.rrup = dctx.rjb + 1.0
+        dctx.rjb_var = None
+        dctx.rrup_var = None
+        dctx.rhypo = dctx.rrup
+        dctx.rx = dctx.rjb
+        dctx.ry0 = dctx.rjb
+        sctx = SitesContext()
+        if grid:
+            # A full grid has the coordinates of its columns and rows
+            sctx.lons = np.linspace(-120.0, -119.0, shape[1])
+            sctx.lats = np.linspace(35.0, 34.0, shape[0])
+        else:
+            sctx.lons = np.linspace(-120.0, -119.0, np.prod(shape)).reshape(shape)
+            sctx.lats = np.linspace(35.0, 34.0, np.prod(shape)).reshape(shape)
+        sctx.sids = np.arange(np.prod(shape)).reshape(shape)
+        sctx.vs30 = np.full(shape, vs30)
+        sctx.vs30measured = np.full(shape, False, dtype="bool")
+        set_sites_depth_parameters(sctx, ASK14)
+        return sctx, dctx
+
+    contexts = [
+        make_contexts((7, 9), 300.0, grid=True),
+        make_contexts((25,), 760.0),
+        make_contexts((25,), 180.0),
+    ]
+    sctx_all, dctx_all = merge_contexts(contexts)
+    assert np.size(sctx_all.vs30) == 63 + 25 + 25
+    assert np.shape(sctx_all.lons) == np.shape(sctx_all.vs30)
+    assert dctx_all.rjb_var is None
+    # The GMPEs are combined over the sites of each context
+    mean, stddevs = mgmpe.get_mean_and_stddevs(
+        sctx_all,
+        rctx,
+        dctx_all,
+        iimt,
+        stddev_types,
+        segments=get_segments(contexts),
+    )
+    results = split_results(contexts, mean, stddevs)
+    for (sctx, dctx), (bmean, bstddevs) in zip(contexts, results):
+        lmean, lsd = mgmpe.get_mean_and_stddevs(
+            copy.deepcopy(sctx), rctx, copy.deepcopy(dctx), iimt, stddev_types
+        )
+        assert bmean.shape == sctx.vs30.shape
+        np.testing.assert_allclose(bmean, lmean)
+        for bsd, sd in zip(bstddevs, lsd):
+            np.testing.assert_allclose(bsd, sd)
+
+    # Contexts with different elements cannot be merged
+    sctx, dctx = make_contexts((25,), 760.0)
+    dctx.rvolc = np.zeros_like(dctx.rjb)
+    assert merge_contexts([contexts[1], (sctx, dctx)]) is None
+
+
+def test_get_mean_and_stddevs_multi():
+    ASK14 = AbrahamsonEtAl2014()
+    CY14 = ChiouYoungs2014()
+    mgmpe = MultiGMPE.__from_list__([ASK14, CY14], [0.6, 0.4], imc=const.IMC.RotD50)
+    # A different MultiGMPE for PGV
+    pgv_gmpe = MultiGMPE.__from_list__([ASK14], [1.0], imc=const.IMC.RotD50)
+    imts = [imt.PGA(), imt.SA(1.0), imt.PGV()]
+    stddev_types = [const.StdDev.TOTAL, const.StdDev.INTER_EVENT]
+
+    rctx = RuptureContext()
+    rctx.rake = 0.0
+    rctx.dip = 90.0
+    rctx.ztor = 0.0
+    rctx.mag = 6.5
+    rctx.width = 10.0
+    rctx.hypo_depth = 8.0
+
+    shape = (6, 8)
+    dctx = DistancesContext()
+    dctx.rjb = np.logspace(0, np.log10(300), np.prod(shape)).reshape(shape)
+    dctx.rrup = dctx.rjb + 1.0
+    dctx.rhypo = dctx.rrup
+    dctx.rx = dctx.rjb
+    dctx.ry0 = dctx.rjb
+    sctx = SitesContext()
+    sctx.lons = np.linspace(-120.0, -119.0, shape[1])
+    sctx.lats = np.linspace(35.0, 34.0, shape[0])
+    sctx.sids = np.arange(np.prod(shape)).reshape(shape)
+    sctx.vs30 = np.linspace(180.0, 1000.0, np.prod(shape)).reshape(shape)
+    sctx.vs30measured = np.full(shape, False, dtype="bool")
+
+    results = mgmpe.__get_mean_and_stddevs_multi__(
+        sctx, rctx, dctx, imts, stddev_types, gmpes={"PGV": pgv_gmpe}
+    )
+    assert set(results) == {"PGA", "SA(1.0)", "PGV"}
+    # The contexts are left as they were given
+    assert sctx.vs30.shape == shape
+    assert dctx.rjb.shape == shape
+    for iimt in imts:
+        gmpe = pgv_gmpe if iimt.string == "PGV" else mgmpe
+        lmean, lsd = gmpe.get_mean_and_stddevs(
+            copy.deepcopy(sctx), rctx, copy.deepcopy(dctx), iimt, stddev_types
+        )
+        mmean, msd = results[iimt.string]
+        assert mmean.shape == shape
+        np.testing.assert_allclose(mmean, lmean)
+        for sd1, sd2 in zip(msd, lsd):
+            np.testing.assert_allclose(sd1, sd2)
+
+
+def test_multigmpe_cache():
+    conf = {
+        "gmpe_modules": {
+            "ASK14": ["AbrahamsonEtAl2014", "openquake.hazardlib.gsim.abrahamson_2014"],
+            "CY14": ["ChiouYoungs2014", "openquake.hazardlib.gsim.chiou_youngs_2014"],
+        },
+        "gmpe_sets": {
+            "active_crustal": {
+                "gmpes": ["ASK14", "CY14"],
+                "weights": [0.5, 0.5],
+                "weights_large_dist": [],
+                "dist_cutoff": np.nan,
+                "site_gmpes": ["ASK14"],
+                "weights_site_gmpes": [],
+            }
+        },
+        "gmpe_limits": {},
+        "modeling": {
+            "gmpe": "active_crustal",
+        },
+        "interp": {"component": "RotD50"},
+    }
+    clear_multigmpe_cache()
+    mg1 = MultiGMPE.__from_config__(conf, filter_imt=imt.SA(1.0))
+    mg2 = MultiGMPE.__from_config__(copy.deepcopy(conf), filter_imt=imt.SA(1.0))
+    mg3 = MultiGMPE.__from_config__(conf, filter_imt=imt.PGA())
+    assert mg1 is mg2
+    assert mg3 is not mg1
+    stats = get_multigmpe_cache_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == 1 / 3
+    assert stats["construction_time"] > 0
+
+    # A change to the config makes a new MultiGMPE
+    conf["gmpe_sets"]["active_crustal"]["weights"] = [0.4, 0.6]
+    mg4 = MultiGMPE.__from_config__(conf, filter_imt=imt.SA(1.0))
+    assert mg4 is not mg1
+    np.testing.assert_allclose(mg4.WEIGHTS, [0.4, 0.6])
+
+    clear_multigmpe_cache()
+    assert get_multigmpe_cache_stats()["misses"] == 0
+    assert MultiGMPE.__from_config__(conf, filter_imt=imt.SA(1.0)) is not mg4
+
+
+def _combine_stddevs_3d(lnmu_list, lnsd_list, wts):
+    # The original combination of the stddevs with the full
+    # nwts x nwts x nsites weighted covariance tensor
+    nwts = len(wts)
+    nsd = len(lnsd_list) // nwts
+    npwts = np.array(wts).reshape((1, -1))
+    if len(lnmu_list[0]) < 10:
+        cc = np.full((nwts, nwts), 0.95)
+        np.fill_diagonal(cc, 1.0)
+    else:
+        cc = np.reshape(np.corrcoef(lnmu_list), (nwts, nwts))
+        cc[np.isnan(cc)] = 1.0
+    cc = ((npwts * npwts.T) * cc).reshape((nwts, nwts, 1))
+    lnsd_new = []
+    for i in range(nsd):
+        sdstack = np.hstack(
+            [lnsd_list[j * nsd + i].reshape((1, 1, -1)) for j in range(nwts)]
+        )
+        wcov = (sdstack * np.transpose(sdstack, axes=(1, 0, 2))) * cc
+        lnsd_new.append(np.sqrt(wcov.sum((0, 1))))
+    return lnsd_new
+
+
+def test_combine_stddevs():
+    rng = np.random.default_rng(1)
+    for nwts in [1, 2, 8]:
+        for nsites in [5, 1000, 20000]:
+            base = rng.normal(size=nsites)
+            lnmu_list = [base + 0.3 * rng.normal(size=nsites) for _ in range(nwts)]
+            lnsd_list = [rng.uniform(0.3, 0.8, nsites) for _ in range(nwts * 4)]
+            wts = rng.uniform(size=nwts)
+            wts /= np.sum(wts)
+            ref = _combine_stddevs_3d(lnmu_list, lnsd_list, wts)
+            # One block and several blocks
+            for block_size in [65536, 333]:
+                lnsd = combine_stddevs(lnmu_list, lnsd_list, wts, block_size)
+                assert len(lnsd) == 4
+                for sd1, sd2 in zip(lnsd, ref):
+                    np.testing.assert_allclose(sd1, sd2, rtol=1e-12)
+    # Identical GMPEs have undefined correlations, which are taken to be 1
+    lnmu_list = [np.zeros(100), np.zeros(100)]
+    lnsd_list = [np.full(100, 0.5)] * 4
+    lnsd = combine_stddevs(lnmu_list, lnsd_list, [0.5, 0.5])
+    np.testing.assert_allclose(lnsd, 0.5)
+
+
+def test_multigmpe_large_distance_weights():
+    ASK14 = AbrahamsonEtAl2014()
+    CY14 = ChiouYoungs2014()
+    mg_near = MultiGMPE.__from_list__([ASK14, CY14], [0.6, 0.4], imc=const.IMC.RotD50)
+    mg_far = MultiGMPE.__from_list__([ASK14, CY14], [0.1, 0.9], imc=const.IMC.RotD50)
+    mg_cut = MultiGMPE.__from_list__([ASK14, CY14], [0.6, 0.4], imc=const.IMC.RotD50)
+    mg_cut.CUTOFF_DISTANCE = 100.0
+    mg_cut.WEIGHTS_LARGE_DISTANCE = [0.1, 0.9]
+    iimt = imt.SA(1.0)
+    stddev_types = [const.StdDev.TOTAL, const.StdDev.INTER_EVENT]
+
+    rctx = RuptureContext()
+    rctx.rake = 0.0
+    rctx.dip = 90.0
+    rctx.ztor = 0.0
+    rctx.mag = 7.0
+    rctx.width = 10.0
+    rctx.hypo_depth = 8.0
+
+    size = 50
+    dctx = DistancesContext()
+    dctx.rjb = np.logspace(0, np.log10(400), size)
+    dctx.rrup = dctx.rjb + 1.0
+    dctx.rhypo = dctx.rrup
+    dctx.rx = dctx.rjb
+    dctx.ry0 = dctx.rjb
+    sctx = SitesContext()
+    sctx.sids = np.arange(size)
+    sctx.vs30 = np.full(size, 400.0)
+    sctx.vs30measured = np.full(size, False, dtype="bool")
+
+    far = dctx.rjb > 100.0
+    results = [
+        mg.get_mean_and_stddevs(
+            copy.deepcopy(sctx), rctx, copy.deepcopy(dctx), iimt, stddev_types
+        )
+        for mg in (mg_near, mg_far, mg_cut)
+    ]
+    (mean_near, sd_near), (mean_far, sd_far), (mean_cut, sd_cut) = results
+    np.testing.assert_allclose(mean_cut[~far], mean_near[~far])
+    np.testing.assert_allclose(mean_cut[far], mean_far[far])
+    for i in range(len(stddev_types)):
+        np.testing.assert_allclose(sd_cut[i][~far], sd_near[i][~far])
+        np.testing.assert_allclose(sd_cut[i][far], sd_far[i][far])
+
+
+def test_multigmpe_does_not_modify_contexts():
+    ASK14 = AbrahamsonEtAl2014()
+    CY14 = ChiouYoungs2014()
+    mgmpe = MultiGMPE.__from_list__([ASK14, CY14], [0.6, 0.4], imc=const.IMC.RotD50)
+    # A limit that clips vs30
+    mgmpe.GMPE_LIMITS = {"AbrahamsonEtAl2014": {"vs30": [300.0, 1000.0]}}
+    stddev_types = [const.StdDev.TOTAL, const.StdDev.INTER_EVENT]
+
+    rctx = RuptureContext()
+    rctx.rake = 0.0
+    rctx.dip = 90.0
+    rctx.ztor = 0.0
+    rctx.mag = 7.0
+    rctx.width = 10.0
+    rctx.hypo_depth = 8.0
+
+    shape = (5, 8)
+    dctx = DistancesContext()
+    dctx.rjb = np.logspace(0, np.log10(300), np.prod(shape)).reshape(shape)
+    dctx.rrup = dctx.rjb + 1.0
+    # The variances trigger the point-source sigma inflation
+    dctx.rjb_var = np.full(shape, 4.0)
+    dctx.rrup_var = np.full(shape, 4.0)
+    dctx.rhypo = dctx.rrup.copy()
+    dctx.rx = dctx.rjb.copy()
+    dctx.ry0 = dctx.rjb.copy()
+    sctx = SitesContext()
+    sctx.lons = np.linspace(-120.0, -119.0, shape[1])
+    sctx.lats = np.linspace(35.0, 34.0, shape[0])
+    sctx.sids = np.arange(np.prod(shape)).reshape(shape)
+    sctx.vs30 = np.linspace(180.0, 1500.0, np.prod(shape)).reshape(shape)
+    sctx.vs30measured = np.full(shape, False, dtype="bool")
+
+    sctx_orig = copy.deepcopy(sctx)
+    dctx_orig = copy.deepcopy(dctx)
+    mean1, sd1 = mgmpe.get_mean_and_stddevs(sctx, rctx, dctx, imt.SA(1.0), stddev_types)
+    results = mgmpe.__get_mean_and_stddevs_multi__(
+        sctx, rctx, dctx, [imt.PGA(), imt.SA(1.0)], stddev_types
+    )
+    for ctx, ctx_orig in ((sctx, sctx_orig), (dctx, dctx_orig)):
+        assert set(vars(ctx)) == set(vars(ctx_orig))
+        for name, value in vars(ctx_orig).items():
+            if name == "_slots_":
+                continue
+            assert getattr(ctx, name).shape == value.shape
+            assert getattr(ctx, name).flags.writeable
+            np.testing.assert_array_equal(getattr(ctx, name), value)
+    # Evaluating again on the same contexts gives the same results
+    mean2, sd2 = mgmpe.get_mean_and_stddevs(sctx, rctx, dctx, imt.SA(1.0), stddev_types)
+    np.testing.assert_array_equal(mean1, mean2)
+    np.testing.assert_array_equal(results["SA(1.0)"][0], mean1)
+    for sda, sdb in zip(sd1, sd2):
+        np.testing.assert_array_equal(sda, sdb)
+
+
+def test_site_factor_cache():
+    ASK14 = AbrahamsonEtAl2014()
+    C03 = Campbell2003MwNSHMP2008()
+    mgmpe = MultiGMPE.__from_list__(
+        [C03, ASK14],
+        [0.5, 0.5],
+        imc=const.IMC.RotD50,
+        default_gmpes_for_site=[ASK14],
+    )
+    imts = [imt.PGA(), imt.SA(1.0)]
+    stddev_types = [const.StdDev.TOTAL]
+
+    rctx = RuptureContext()
+    rctx.rake = 0.0
+    rctx.dip = 90.0
+    rctx.ztor = 0.0
+    rctx.mag = 6.0
+    rctx.width = 10.0
+    rctx.hypo_depth = 8.0
+
+    size = 30
+    dctx = DistancesContext()
+    dctx.rjb = np.logspace(0, np.log10(300), size)
+    dctx.rrup = dctx.rjb + 1.0
+    dctx.rhypo = dctx.rrup
+    dctx.rx = dctx.rjb
+    dctx.ry0 = dctx.rjb
+    sctx = SitesContext()
+    sctx.vs30 = np.linspace(180.0, 1000.0, size)
+    sctx.vs30measured = np.full(size, False, dtype="bool")
+
+    def evaluate():
+        return [
+            mgmpe.get_mean_and_stddevs(sctx, rctx, dctx, iimt, stddev_types)[0]
+            for iimt in imts
+        ]
+
+    set_site_factor_cache(False)
+    ref = evaluate()
+    try:
+        set_site_factor_cache(True)
+        first = evaluate()
+        assert len(multigmpe._SITE_FACTOR_CACHE) == len(imts)
+        second = evaluate()
+        assert len(multigmpe._SITE_FACTOR_CACHE) == len(imts)
+        for r, m1, m2 in zip(ref, first, second):
+            np.testing.assert_allclose(m1, r)
+            np.testing.assert_allclose(m2, r)
+        # New vs30 values or a change to the rupture are not cache hits
+        sctx.vs30 = np.linspace(200.0, 800.0, size)
+        evaluate()
+        assert len(multigmpe._SITE_FACTOR_CACHE) == 2 * len(imts)
+        rctx.mag = 7.0
+        new = evaluate()
+        assert len(multigmpe._SITE_FACTOR_CACHE) == 3 * len(imts)
+        set_site_factor_cache(False)
+        for m1, r in zip(new, evaluate()):
+            np.testing.assert_allclose(m1, r)
+    finally:
+        set_site_factor_cache(False)
+
+
 if __name__ == "__main__":
     test_basic()
     test_from_config_set_of_sets()
@@ -3617,3 +4003,10 @@ if __name__ == "__main__":
     test_multigmpe_get_mean_stddevs()
     test_multigmpe_exceptions()
     test_from_config_set_of_sets_3_sec()
+    test_merge_contexts()
+    test_get_mean_and_stddevs_multi()
+    test_multigmpe_cache()
+    test_combine_stddevs()
+    test_multigmpe_large_distance_weights()
+    test_multigmpe_does_not_modify_contexts()
+    test_site_factor_cache()
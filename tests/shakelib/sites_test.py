@@ -3,13 +3,14 @@
 # stdlib imports
 import sys
 import os.path
+import tempfile
 
 # third party imports
 import numpy as np
 import pytest
 
 # local imports
-from shakelib.sites import Sites
+from shakelib.sites import LazySitesContext, Sites, TiledVs30, Vs30Cache
 import shakelib.sites as sites
 
 
@@ -917,6 +918,184 @@ def test_sites(vs30file=None):
         )
 
 
+def test_vs30_cache():
+    vs30file = os.path.join(homedir, "sites_data/Vs30_test.grd")
+    cx = -118.2
+    cy = 34.1
+    dx = 0.0083
+    dy = 0.0083
+    xspan = 0.0083 * 5
+    yspan = 0.0083 * 5
+    ref = Sites.fromCenter(
+        cx, cy, xspan, yspan, dx, dy, vs30File=vs30file, padding=True, resample=True
+    )
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = Vs30Cache(cache_dir)
+        for _ in range(2):
+            mysite = Sites.fromCenter(
+                cx,
+                cy,
+                xspan,
+                yspan,
+                dx,
+                dy,
+                vs30File=vs30file,
+                padding=True,
+                resample=True,
+                vs30_cache=cache,
+            )
+            assert len([f for f in os.listdir(cache_dir) if f.endswith(".npy")]) == 1
+            np.testing.assert_array_equal(
+                mysite.getVs30Grid().getData(), ref.getVs30Grid().getData()
+            )
+            assert mysite.getVs30Grid().getGeoDict() == ref.getVs30Grid().getGeoDict()
+        # The second grid came from the (memory-mapped) cache
+        assert isinstance(mysite.getVs30Grid().getData(), np.memmap)
+        sctx = mysite.getSitesContext()
+        np.testing.assert_array_equal(sctx.vs30, ref.getSitesContext().vs30)
+
+        # A different region is a different entry
+        Sites.fromCenter(
+            cx + dx,
+            cy,
+            xspan,
+            yspan,
+            dx,
+            dy,
+            vs30File=vs30file,
+            padding=True,
+            resample=True,
+            vs30_cache=cache,
+        )
+        assert len([f for f in os.listdir(cache_dir) if f.endswith(".npy")]) == 2
+
+        # A cache too small for two grids keeps only the most recent
+        nbytes = ref.getVs30Grid().getData().nbytes
+        small_cache = Vs30Cache(cache_dir, max_size=1.5 * nbytes / (1024 * 1024))
+        small_cache.put("newest", ref.getVs30Grid())
+        assert sorted(f for f in os.listdir(cache_dir) if f.endswith(".npy")) == [
+            "newest.npy"
+        ]
+
+
+def test_tiled_vs30():
+    vs30file = os.path.join(homedir, "sites_data/Vs30_test.grd")
+    cx = -118.2
+    cy = 34.1
+    dx = 0.0083
+    dy = 0.0083
+    xspan = 0.0083 * 5
+    yspan = 0.0083 * 5
+    with tempfile.TemporaryDirectory() as tile_dir:
+        tilefile = os.path.join(tile_dir, "vs30.npy")
+        TiledVs30.write(vs30file, tilefile, tile_size=4)
+        assert TiledVs30.isTiled(tilefile)
+        assert not TiledVs30.isTiled(vs30file)
+
+        for resample in (False, True):
+            ref = Sites.fromCenter(
+                cx,
+                cy,
+                xspan,
+                yspan,
+                dx,
+                dy,
+                vs30File=vs30file,
+                padding=True,
+                resample=resample,
+            )
+            mysite = Sites.fromCenter(
+                cx,
+                cy,
+                xspan,
+                yspan,
+                dx,
+                dy,
+                vs30File=tilefile,
+                padding=True,
+                resample=resample,
+            )
+            np.testing.assert_allclose(
+                mysite.getVs30Grid().getData(),
+                ref.getVs30Grid().getData(),
+                rtol=1e-6,
+            )
+
+        # Points inside the Sites grid get the same Vs30 as before; points
+        # outside of it (but inside the Vs30 file) are looked up in the
+        # tiles instead of getting the default
+        tiles = TiledVs30(tilefile)
+        fgd = tiles.getGeoDict()
+        lats = np.array([cy, fgd.ymin, fgd.ymax + 1.0])
+        lons = np.array([cx, fgd.xmin, fgd.xmin])
+        sctx = mysite.getSitesContext({"lats": lats, "lons": lons})
+        assert sctx.vs30[0] == ref.getSitesContext({"lats": lats, "lons": lons}).vs30[0]
+        full = Sites._load(vs30file).getData()
+        assert sctx.vs30[1] == full[-1, 0]
+        assert sctx.vs30[2] == 686.0
+
+
+def test_lazy_depth_parameters():
+    vs30 = np.linspace(200, 700, 6)
+    sctx = LazySitesContext()
+    sctx.vs30 = vs30
+    # Nothing is computed until it is accessed
+    Sites._addDepthParameters(sctx)
+    assert set(vars(sctx)) - {"_slots_"} == {"vs30"}
+    np.testing.assert_allclose(
+        sctx.z2pt5_cb07,
+        Sites._z2pt5_from_z1pt0_cb07(Sites._z1pt0_from_vs30_cy08(vs30)),
+    )
+    assert set(vars(sctx)) - {"_slots_"} == {"vs30", "z1pt0_cy08", "z2pt5_cb07"}
+    for name in Sites.DEPTH_PARAMETERS:
+        np.testing.assert_allclose(
+            getattr(sctx, name), Sites._computeDepthParameter(name, vs30)
+        )
+
+    # A new vs30 discards the values computed from the old one
+    sctx.vs30 = vs30 * 2
+    Sites._addDepthParameters(sctx)
+    assert set(vars(sctx)) - {"_slots_"} == {"vs30"}
+    np.testing.assert_allclose(
+        sctx.z1pt0_cy14_cal, Sites._z1pt0_from_vs30_cy14_cal(vs30 * 2)
+    )
+    with pytest.raises(AttributeError):
+        sctx.z1pt0
+
+
+def test_depth_lookup():
+    vs30 = np.linspace(150, 1500, 1351)
+    min_sites = Sites.DEPTH_LOOKUP_MIN_SITES
+    try:
+        Sites.DEPTH_LOOKUP_MIN_SITES = 1000
+        index, vmin, vmax = Sites._getVs30LookupIndex(vs30.reshape((-1, 7)))
+        assert index.shape == (193, 7)
+        assert (vmin, vmax) == (150, 1500)
+        for name in Sites.DEPTH_PARAMETERS:
+            np.testing.assert_allclose(
+                Sites._computeDepthParameter(name, vs30),
+                Sites._evaluateDepthRelation(name, vs30),
+                rtol=1e-12,
+            )
+        # Arrays that are too small, not whole numbers, not float64, or
+        # out of range are evaluated directly
+        assert Sites._getVs30LookupIndex(vs30[:999]) is None
+        assert Sites._getVs30LookupIndex(vs30 + 0.5) is None
+        assert Sites._getVs30LookupIndex(vs30.astype(np.float32)) is None
+        assert Sites._getVs30LookupIndex(vs30 * 10) is None
+        vs30_nan = vs30.copy()
+        vs30_nan[500] = np.nan
+        assert Sites._getVs30LookupIndex(vs30_nan) is None
+        Sites.DEPTH_LOOKUP_MIN_SITES = 0
+        assert Sites._getVs30LookupIndex(vs30) is None
+    finally:
+        Sites.DEPTH_LOOKUP_MIN_SITES = min_sites
+
+
 if __name__ == "__main__":
     test_depthpars()
     test_sites()
+    test_vs30_cache()
+    test_tiled_vs30()
+    test_lazy_depth_parameters()
+    test_depth_lookup()
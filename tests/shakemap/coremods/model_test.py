@@ -9,6 +9,7 @@ import numpy as np
 
 # local imports
 from esi_utils_io.smcontainers import ShakeMapOutputContainer
+from shakelib.utils.imt_string import oq_to_file
 from shakemap.coremods.assemble import AssembleModule
 from shakemap.coremods.model import ModelModule
 from shakemap.coremods.plotregr import PlotRegr
@@ -127,6 +128,9 @@ def test_directivity():
     np.testing.assert_allclose(np.max(sa3), 1.1567265149442174, atol=1e-5)
     # np.testing.assert_allclose(np.min(sa3), 0.9278920)
     np.testing.assert_allclose(np.min(sa3), 0.88508818541678, atol=1e-5)
+    # The saved directivity is the one applied to the output grid
+    fd, _ = oc.getArray(["directivity"], oq_to_file("SA(3.0)"))
+    assert fd.shape == sa3.shape
     oc.close()
 
 
@@ -2,10 +2,16 @@
 
 import os
 import shutil
+import tempfile
 
 import numpy as np
 
-from shakemap.utils.generic_amp import get_generic_amp_factors
+import shakemap.utils.generic_amp as generic_amp
+from shakemap.utils.generic_amp import (
+    clear_generic_amp_cache,
+    get_generic_amp_factors,
+    get_generic_amp_factors_cached,
+)
 from shakemap.utils.config import get_config_paths
 from mapio.geodict import GeoDict
 from mapio.grid2d import Grid2D
@@ -516,6 +522,101 @@ def test_generic_amp():
         # os.remove(north_south_file)
 
 
+def test_generic_amp_cache():
+    lons = np.linspace(-121.0, -116.0, 50)
+    lats = np.linspace(33.0, 35.8, 50)
+    sx = Dummy()
+    sx.lons = lons
+    sx.lats = lats
+
+    clear_generic_amp_cache()
+    gaf = get_generic_amp_factors(sx, "SA(2.0)")
+    assert len(generic_amp._GAF_CACHE) > 0
+    for entry in generic_amp._GAF_CACHE.values():
+        assert "SA(2.0)" in entry["grids"]
+        assert entry["bounds"] is not None
+    # The (interpolated) grids are reused
+    grids = {
+        gfile: entry["grids"]["SA(2.0)"]
+        for gfile, entry in generic_amp._GAF_CACHE.items()
+    }
+    gaf2 = get_generic_amp_factors(sx, "SA(2.0)")
+    np.testing.assert_array_equal(gaf, gaf2)
+    for gfile, entry in generic_amp._GAF_CACHE.items():
+        assert entry["grids"]["SA(2.0)"] is grids[gfile]
+
+    # Sites that do not overlap any of the grids skip the files without
+    # reading them
+    sx_far = Dummy()
+    sx_far.lons = lons + 20.0
+    sx_far.lats = lats
+    gaf = get_generic_amp_factors(sx_far, "SA(0.3)")
+    assert np.all(gaf == 0)
+    for entry in generic_amp._GAF_CACHE.values():
+        assert "SA(0.3)" not in entry["grids"]
+
+    # The cache gives the same results as reading the files
+    gaf = get_generic_amp_factors(sx, "SA(0.3)")
+    clear_generic_amp_cache()
+    np.testing.assert_array_equal(gaf, get_generic_amp_factors(sx, "SA(0.3)"))
+
+
+def test_generic_amp_factors_cached():
+    lons, lats = np.meshgrid(
+        np.linspace(-121.0, -116.0, 20), np.linspace(33.0, 35.8, 10)
+    )
+    sx = Dummy()
+    sx.lons = lons
+    sx.lats = lats
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        gaf = get_generic_amp_factors_cached(sx, "SA(2.0)", cache_dir)
+        np.testing.assert_array_equal(gaf, get_generic_amp_factors(sx, "SA(2.0)"))
+        files = os.listdir(cache_dir)
+        assert len(files) == 1 and files[0].startswith("gaf_psa2p0_")
+        # The second call loads the saved factors
+        gaf2 = get_generic_amp_factors_cached(sx, "SA(2.0)", cache_dir)
+        assert isinstance(gaf2, np.memmap)
+        np.testing.assert_array_equal(gaf, gaf2)
+        # Other IMTs get their own files
+        get_generic_amp_factors_cached(sx, "PGA", cache_dir)
+        assert len(os.listdir(cache_dir)) == 2
+        # New coordinates replace the file for the IMT
+        sx.lons = lons + 0.1
+        gaf3 = get_generic_amp_factors_cached(sx, "SA(2.0)", cache_dir)
+        np.testing.assert_array_equal(gaf3, get_generic_amp_factors(sx, "SA(2.0)"))
+        assert len(os.listdir(cache_dir)) == 2
+        assert files[0] not in os.listdir(cache_dir)
+
+
+def test_generic_amp_factors_cached_after_read():
+    lons, lats = np.meshgrid(
+        np.linspace(-121.0, -116.0, 20), np.linspace(33.0, 35.8, 10)
+    )
+    sx = Dummy()
+    sx.lons = lons
+    sx.lats = lats
+
+    # Reading the amplification files does not change them, so the factors
+    # saved by one run are loaded by the next (which starts with an empty
+    # grid cache)
+    gaf_files = generic_amp._get_gaf_files()
+    mtimes = [os.stat(gfile).st_mtime_ns for gfile in gaf_files]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        clear_generic_amp_cache()
+        gaf = get_generic_amp_factors_cached(sx, "SA(1.0)", cache_dir)
+        assert not isinstance(gaf, np.memmap)
+        assert [os.stat(gfile).st_mtime_ns for gfile in gaf_files] == mtimes
+        clear_generic_amp_cache()
+        get_generic_amp_factors(sx, "PGA")
+        gaf2 = get_generic_amp_factors_cached(sx, "SA(1.0)", cache_dir)
+        assert isinstance(gaf2, np.memmap)
+        np.testing.assert_array_equal(gaf, gaf2)
+
+
 if __name__ == "__main__":
     os.environ["CALLED_FROM_PYTEST"] = "True"
     test_generic_amp()
+    test_generic_amp_cache()
+    test_generic_amp_factors_cached()
+    test_generic_amp_factors_cached_after_read()
@@ -0,0 +1,623 @@
+#!/usr/bin/env python
+
+# stdlib imports
+import concurrent.futures as cf
+import os.path
+import tempfile
+
+# third party imports
+import numpy as np
+
+# local imports
+from shakelib.correlation.dummy import DummyCorrelation
+from shakelib.correlation.loth_baker_2013 import LothBaker2013
+from shakemap.c.clib import geodetic_distance_fast
+from shakemap.utils.mvn import (
+    MVN_TIMERS,
+    MVNJob,
+    MVNStationData,
+    MVNWorkspace,
+    SparseStationCovariance,
+    StationCorrelation,
+    check_precision,
+    get_blocks,
+    get_local_tile_shape,
+    get_tile_shape,
+    invert_covariance,
+    iter_tiles,
+    make_output_array,
+    mvn_block,
+    mvn_tile,
+    run_mvn_block,
+    taper_correlation,
+)
+
+
+def _distance(lons1, lats1, lons2, lats2):
+    # Same approximation as geodetic_distance_fast
+    return 6371.0 * np.sqrt(
+        (
+            (lons1.reshape((1, -1)) - lons2.reshape((-1, 1)))
+            * np.cos(0.5 * (lats1.reshape((1, -1)) + lats2.reshape((-1, 1))))
+        )
+        ** 2
+        + (lats1.reshape((1, -1)) - lats2.reshape((-1, 1))) ** 2
+    )
+
+
+def _make_problem(
+    nsta=40, nx=23, ny=17, ccf_class=DummyCorrelation, precision="double"
+):
+    rng = np.random.default_rng(1234)
+    periods = np.array([0.01, 0.3, 1.0, 3.0])
+    ccf = ccf_class(periods)
+    sta_lons = np.radians(rng.uniform(-122.0, -121.0, nsta))
+    sta_lats = np.radians(rng.uniform(37.0, 38.0, nsta))
+    sta_per_ix = rng.integers(0, 2, nsta)
+    sta_phi = rng.uniform(0.5, 0.7, nsta).reshape((-1, 1))
+    sta_resids = rng.normal(0.0, 0.5, nsta).reshape((-1, 1))
+    sta_tau = rng.uniform(0.3, 0.4, nsta)
+    # Output IMT is period index 2, which is not in the data
+    outperiod_ix = 2
+    imt_types = np.array([0, 1, 2])
+    y_ix = 2
+    T_D = np.zeros((nsta, 3))
+    for i in range(2):
+        T_D[sta_per_ix == i, i] = sta_tau[sta_per_ix == i]
+    dist = _distance(sta_lons, sta_lats, sta_lons, sta_lats)
+    t1 = np.tile(sta_per_ix.reshape((1, -1)), (nsta, 1))
+    t2 = np.tile(sta_per_ix.reshape((-1, 1)), (1, nsta))
+    matrix22 = ccf.getCorrelation(t1, t2, dist.copy())
+    matrix22 *= sta_phi.reshape((1, -1)) * sta_phi.reshape((-1, 1))
+    matrix22[np.diag_indices(nsta)] += 0.1
+    cov_WD_WD_inv = np.linalg.inv(matrix22)
+    t1 = np.tile(imt_types.reshape((1, -1)), (3, 1))
+    corr_HH_D = ccf.getCorrelation(t1, t1.T.copy(), np.zeros((3, 3)))
+    cov_HH_yD = np.linalg.inv(
+        np.linalg.multi_dot([T_D.T, cov_WD_WD_inv, T_D]) + np.linalg.inv(corr_HH_D)
+    )
+    mu_H_yD = np.linalg.multi_dot([cov_HH_yD, T_D.T, cov_WD_WD_inv, sta_resids])
+    stadata = MVNStationData(
+        ccf,
+        outperiod_ix,
+        y_ix,
+        sta_lons,
+        sta_lats,
+        sta_per_ix,
+        sta_phi,
+        sta_resids,
+        T_D,
+        cov_WD_WD_inv,
+        mu_H_yD,
+        cov_HH_yD,
+        precision=precision,
+    )
+    lons, lats = np.meshgrid(
+        np.radians(np.linspace(-122.2, -120.8, nx)),
+        np.radians(np.linspace(38.2, 36.8, ny)),
+    )
+    pout_mean = rng.normal(0.0, 1.0, (ny, nx))
+    psd = rng.uniform(0.5, 0.7, (ny, nx))
+    tsd = rng.uniform(0.3, 0.4, (ny, nx))
+    return stadata, lons, lats, pout_mean, psd, tsd
+
+
+def _dense_solution(stadata, lons, lats, pout_mean, psd, tsd):
+    dist = _distance(stadata.sta_lons_rad, stadata.sta_lats_rad, lons, lats)
+    t1 = np.tile(stadata.sta_per_ix.reshape((1, -1)), (dist.shape[0], 1))
+    t2 = np.full(dist.shape, stadata.outperiod_ix, dtype=np.int_)
+    sigma12 = stadata.ccf.getCorrelation(t1, t2, dist)
+    sigma12 *= stadata.sdsta_phi.reshape((1, -1)) * psd.reshape((-1, 1))
+    rc = sigma12 @ stadata.cov_WD_WD_inv
+    T_Y0 = np.zeros((np.size(lons), stadata.ncols))
+    T_Y0[:, stadata.y_ix] = tsd.ravel()
+    C = T_Y0 - rc @ stadata.T_D
+    mean = pout_mean.ravel() + (C @ stadata.mu_H_yD).ravel()
+    mean += (rc @ stadata.sta_resids).ravel()
+    var_phi = np.clip(psd.ravel() ** 2 - np.sum(rc * sigma12, axis=1), 0, None)
+    var_tau = np.diag(C @ stadata.cov_HH_yD @ C.T)
+    return mean, var_phi, var_tau, C
+
+
+def test_tile_shape():
+    # No budget means one row at a time
+    assert get_tile_shape(500, 400, 1000, 3, 0) == (1, 500)
+    # A budget produces roughly square tiles within the budget
+    tny, tnx = get_tile_shape(500, 400, 1000, 3, 10)
+    npts = tny * tnx
+    assert 8 * (4 * 1000 + 4 * 3 + 12) * npts <= 10 * 1024 * 1024
+    assert abs(tny - tnx) <= 1
+    # A budget larger than the grid gives a single tile
+    assert get_tile_shape(50, 40, 10, 3, 1000) == (40, 50)
+    # A tiny budget still makes progress
+    assert get_tile_shape(50, 40, 100000, 3, 0.001) == (1, 1)
+    # The tiles cover the grid exactly once
+    count = np.zeros((17, 23), dtype=int)
+    for iy0, iy1, ix0, ix1 in iter_tiles(23, 17, 5, 7):
+        count[iy0:iy1, ix0:ix1] += 1
+    assert np.all(count == 1)
+
+
+def test_mvn_tile():
+    stadata, lons, lats, pout_mean, psd, tsd = _make_problem()
+    ny, nx = lons.shape
+    mean0, var_phi0, var_tau0, C0 = _dense_solution(
+        stadata, lons, lats, pout_mean, psd, tsd
+    )
+    C0 = C0.reshape((ny, nx, -1))
+    for tile_ny, tile_nx in ((1, nx), (5, 7), (ny, nx)):
+        work = MVNWorkspace(stadata)
+        timers = dict.fromkeys(MVN_TIMERS, 0.0)
+        mean = np.zeros((ny, nx))
+        var_phi = np.zeros((ny, nx))
+        var_tau = np.zeros((ny, nx))
+        C = np.zeros((ny, nx, stadata.ncols))
+        for iy0, iy1, ix0, ix1 in iter_tiles(nx, ny, tile_ny, tile_nx):
+            shape = (iy1 - iy0, ix1 - ix0)
+            tm, tp, tt, tc = mvn_tile(
+                stadata,
+                lons[iy0:iy1, ix0:ix1],
+                lats[iy0:iy1, ix0:ix1],
+                pout_mean[iy0:iy1, ix0:ix1],
+                psd[iy0:iy1, ix0:ix1],
+                tsd[iy0:iy1, ix0:ix1],
+                work,
+                timers,
+            )
+            mean[iy0:iy1, ix0:ix1] = tm.reshape(shape)
+            var_phi[iy0:iy1, ix0:ix1] = tp.reshape(shape)
+            var_tau[iy0:iy1, ix0:ix1] = tt.reshape(shape)
+            C[iy0:iy1, ix0:ix1, :] = tc.reshape(shape + (-1,))
+        np.testing.assert_allclose(mean.ravel(), mean0, rtol=1e-10, atol=1e-12)
+        np.testing.assert_allclose(var_phi.ravel(), var_phi0, rtol=1e-8, atol=1e-12)
+        np.testing.assert_allclose(var_tau.ravel(), var_tau0, rtol=1e-8, atol=1e-12)
+        np.testing.assert_allclose(C, C0, rtol=1e-10, atol=1e-12)
+        assert set(timers.keys()) == set(MVN_TIMERS)
+
+
+def test_mvn_fused():
+    stadata, lons, lats, pout_mean, psd, tsd = _make_problem(ccf_class=LothBaker2013)
+    assert stadata.lb_coeffs is not None
+    expected = _dense_solution(stadata, lons, lats, pout_mean, psd, tsd)
+    # A station at an output point exercises the nugget term
+    stadata.sta_lons_rad[0] = lons[3, 4]
+    stadata.sta_lats_rad[0] = lats[3, 4]
+    results = []
+    for fused in (True, False):
+        if not fused:
+            stadata.lb_coeffs = None
+        work = MVNWorkspace(stadata)
+        timers = dict.fromkeys(MVN_TIMERS, 0.0)
+        results.append(mvn_tile(stadata, lons, lats, pout_mean, psd, tsd, work, timers))
+        if fused:
+            assert work.t1_12 is None
+            assert timers["fused"] > 0 and timers["distance"] == 0
+        else:
+            assert timers["fused"] == 0 and timers["distance"] > 0
+    for fused_result, result in zip(*results):
+        np.testing.assert_allclose(fused_result, result, rtol=1e-12, atol=1e-14)
+    # Without the moved station, the fused kernel matches the reference
+    stadata, lons, lats, pout_mean, psd, tsd = _make_problem(ccf_class=LothBaker2013)
+    work = MVNWorkspace(stadata)
+    timers = dict.fromkeys(MVN_TIMERS, 0.0)
+    result = mvn_tile(stadata, lons, lats, pout_mean, psd, tsd, work, timers)
+    for res, exp in zip(result, expected):
+        np.testing.assert_allclose(res, exp, rtol=1e-8, atol=1e-12)
+
+    # A subclass of a built-in model may override getCorrelation()
+    class CustomCorrelation(LothBaker2013):
+        pass
+
+    stadata, *_ = _make_problem(ccf_class=CustomCorrelation)
+    assert stadata.lb_coeffs is None
+
+
+def test_make_output_array():
+    arr = make_output_array((3, 4))
+    assert not isinstance(arr, np.memmap)
+    np.testing.assert_array_equal(arr, np.zeros((3, 4)))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = os.path.join(tmpdir, "PGA_mean.npy")
+        arr = make_output_array((3, 4), fname)
+        assert isinstance(arr, np.memmap)
+        arr[1:2, 1:3] = 5.0
+        arr.flush()
+        np.testing.assert_array_equal(np.load(fname), arr)
+        del arr
+
+
+def _make_job(stadata, lons, lats, pout_mean, psd, tsd, tmpdir=None):
+    outputs = {}
+    for name in ("mean", "std", "tau", "C"):
+        shape = lons.shape if name != "C" else lons.shape + (stadata.ncols,)
+        fname = None if tmpdir is None else os.path.join(tmpdir, f"{name}.npy")
+        outputs[name] = make_output_array(shape, fname)
+    return MVNJob("PGA", stadata, lons, lats, pout_mean, psd, tsd, outputs)
+
+
+def _check_job(job, expected):
+    mean0, var_phi0, var_tau0, C0 = expected
+    np.testing.assert_allclose(
+        job.outputs["mean"].ravel(), mean0, rtol=1e-10, atol=1e-12
+    )
+    np.testing.assert_allclose(
+        job.outputs["std"].ravel(),
+        np.sqrt(var_phi0 + var_tau0),
+        rtol=1e-8,
+        atol=1e-12,
+    )
+    np.testing.assert_allclose(
+        job.outputs["tau"].ravel(), np.sqrt(var_tau0), rtol=1e-8, atol=1e-12
+    )
+    np.testing.assert_allclose(
+        job.outputs["C"].reshape(C0.shape), C0, rtol=1e-10, atol=1e-12
+    )
+
+
+def test_get_blocks():
+    for tile_ny, tile_nx, nblocks in ((1, 23, 4), (5, 7, 3), (17, 23, 8), (1, 5, 100)):
+        blocks = get_blocks(23, 17, tile_ny, tile_nx, nblocks)
+        assert 1 <= len(blocks) <= nblocks
+        tiles = [tile for block in blocks for tile in block]
+        assert tiles == list(iter_tiles(23, 17, tile_ny, tile_nx))
+    # The default tiles give bands of rows
+    blocks = get_blocks(23, 17, 1, 23, 4)
+    assert [(block[0][0], block[-1][1]) for block in blocks] == [
+        (0, 5),
+        (5, 10),
+        (10, 15),
+        (15, 17),
+    ]
+
+
+def test_mvn_block():
+    problem = _make_problem()
+    expected = _dense_solution(*problem)
+    job = _make_job(*problem)
+    job.tile_shape = (5, 7)
+    ny, nx = problem[1].shape
+    timers = mvn_block(job, iter_tiles(nx, ny, *job.tile_shape))
+    assert set(timers.keys()) == set(MVN_TIMERS)
+    _check_job(job, expected)
+    # Clipping the mean
+    job.clip = (-0.5, 0.5)
+    mvn_block(job, iter_tiles(nx, ny, *job.tile_shape))
+    np.testing.assert_allclose(
+        job.outputs["mean"].ravel(), np.clip(expected[0], -0.5, 0.5), atol=1e-12
+    )
+
+
+def test_mvn_parallel():
+    problem = _make_problem()
+    expected = _dense_solution(*problem)
+    ny, nx = problem[1].shape
+    with tempfile.TemporaryDirectory() as tmpdir:
+        job = _make_job(*problem, tmpdir=tmpdir)
+        shared = job.share()
+        try:
+            with cf.ProcessPoolExecutor(max_workers=2) as ex:
+                futures = [
+                    ex.submit(run_mvn_block, job, tiles)
+                    for tiles in get_blocks(nx, ny, *job.tile_shape, 5)
+                ]
+                for future in cf.as_completed(futures):
+                    imtstr, timers = future.result()
+                    assert imtstr == "PGA"
+                    assert set(timers.keys()) == set(MVN_TIMERS)
+        finally:
+            for sarray in shared:
+                sarray.release()
+        # The workers wrote directly into the parent's outputs
+        _check_job(job, expected)
+        del job
+
+
+def test_mvn_single_precision():
+    for ccf_class in (DummyCorrelation, LothBaker2013):
+        problem = _make_problem(ccf_class=ccf_class, precision="single")
+        stadata = problem[0]
+        assert stadata.dtype == np.float32
+        assert stadata.asDouble().dtype == np.float64
+        mean0, var_phi0, var_tau0, _ = _dense_solution(*problem)
+        ny, nx = problem[1].shape
+        with tempfile.TemporaryDirectory() as tmpdir:
+            job = _make_job(*problem, tmpdir=tmpdir)
+            shared = job.share()
+            try:
+                with cf.ProcessPoolExecutor(max_workers=2) as ex:
+                    for tiles in get_blocks(nx, ny, *job.tile_shape, 3):
+                        ex.submit(run_mvn_block, job, tiles).result()
+            finally:
+                for sarray in shared:
+                    sarray.release()
+            mean = np.array(job.outputs["mean"])
+            std = np.array(job.outputs["std"])
+            mean_err, std_err = check_precision(job, nrows=ny)
+            del job
+        #
+        # The results are close to the double-precision ones, and the
+        # check over all of the rows finds the actual error
+        #
+        actual_mean_err = np.max(np.abs(mean.ravel() - mean0))
+        actual_std_err = np.max(np.abs(std.ravel() - np.sqrt(var_phi0 + var_tau0)))
+        assert 0 < actual_mean_err < 1e-4
+        assert actual_std_err < 1e-4
+        np.testing.assert_allclose(mean_err, actual_mean_err, rtol=1e-6, atol=1e-12)
+        np.testing.assert_allclose(std_err, actual_std_err, rtol=1e-6, atol=1e-12)
+    # The approximate modes are always done in double precision
+    stadata = problem[0]
+    local = MVNStationData(
+        stadata.ccf,
+        stadata.outperiod_ix,
+        stadata.y_ix,
+        stadata.sta_lons_rad,
+        stadata.sta_lats_rad,
+        stadata.sta_per_ix,
+        stadata.sdsta_phi,
+        stadata.sta_resids,
+        stadata.T_D,
+        stadata.cov_WD_WD_inv,
+        stadata.mu_H_yD,
+        stadata.cov_HH_yD,
+        nearest_k=10,
+        sta_sig_extra=np.full(stadata.nsta, 0.3),
+        precision="single",
+    )
+    assert local.dtype == np.float64
+
+
+def test_invert_covariance():
+    rng = np.random.default_rng(42)
+    #
+    # A well-conditioned covariance matrix
+    #
+    a = rng.normal(size=(50, 50))
+    matrix = a @ a.T + 50 * np.eye(50)
+    mcopy = matrix.copy()
+    inverse, info = invert_covariance(matrix)
+    np.testing.assert_array_equal(matrix, mcopy)
+    assert info["method"] == "cholesky"
+    assert info["jitter"] == 0
+    assert 1 < info["cond"] < 1e3
+    np.testing.assert_allclose(inverse, np.linalg.inv(matrix), rtol=1e-10)
+    np.testing.assert_array_equal(inverse, inverse.T)
+    #
+    # A singular matrix (duplicated stations) falls back to the
+    # pseudo-inverse
+    #
+    b = rng.normal(size=(50, 5))
+    matrix = b @ b.T
+    inverse, info = invert_covariance(matrix)
+    assert info["method"] == "pinv"
+    np.testing.assert_allclose(inverse, np.linalg.pinv(matrix), atol=1e-8)
+    #
+    # A matrix that is just barely not positive definite gets some
+    # jitter; the condition number limit can be relaxed to accept it
+    #
+    matrix = a @ a.T
+    w, v = np.linalg.eigh(matrix)
+    w[0] = -1e-9 * np.mean(np.diag(matrix))
+    matrix = (v * w) @ v.T
+    matrix = 0.5 * (matrix + matrix.T)
+    inverse, info = invert_covariance(matrix, max_cond=1e20)
+    assert info["method"] == "cholesky"
+    assert info["jitter"] > 0
+    assert info["time"] >= 0
+
+
+def test_station_correlation():
+    rng = np.random.default_rng(99)
+    periods = np.array([0.01, 0.1, 0.3, 1.0, 3.0])
+    nsta = 60
+    lons = np.radians(rng.uniform(-122.0, -121.0, nsta))
+    lats = np.radians(rng.uniform(37.0, 38.0, nsta))
+    # Two stations at the same location
+    lons[1] = lons[0]
+    lats[1] = lats[0]
+    #
+    # Three output IMTs drawing different (overlapping) sets of
+    # observations; stations may provide two observations to an IMT
+    #
+    sta_ix = {}
+    sta_per_ix = {}
+    for imtstr, pers in (("A", (0, 1)), ("B", (1, 2)), ("C", (2, 4)), ("D", ())):
+        ixs = []
+        pixs = []
+        for pix in pers:
+            use = np.where(rng.uniform(size=nsta) < 0.7)[0]
+            ixs.append(use)
+            pixs.append(np.full(np.size(use), pix))
+        if ixs:
+            order = rng.permutation(np.size(np.concatenate(ixs)))
+            sta_ix[imtstr] = np.concatenate(ixs)[order]
+            sta_per_ix[imtstr] = np.concatenate(pixs)[order]
+        else:
+            sta_ix[imtstr] = np.array([], dtype=int)
+            sta_per_ix[imtstr] = np.array([], dtype=int)
+    for ccf in (DummyCorrelation(periods), LothBaker2013(periods)):
+        sta_corr = StationCorrelation(ccf, lons, lats, sta_ix, sta_per_ix)
+        for imtstr in ("A", "B", "C", "D"):
+            ix = sta_ix[imtstr]
+            per_ix = sta_per_ix[imtstr]
+            n = np.size(ix)
+            matrix = sta_corr.getCorrelation(imtstr)
+            expected = np.empty((n, n))
+            geodetic_distance_fast(
+                lons[ix].copy(),
+                lats[ix].copy(),
+                lons[ix].copy(),
+                lats[ix].copy(),
+                expected,
+            )
+            t1 = np.tile(per_ix.reshape((1, -1)), (n, 1)).astype(np.int_)
+            t2 = np.tile(per_ix.reshape((-1, 1)), (1, n)).astype(np.int_)
+            ccf.getCorrelation(t1, t2, expected)
+            np.testing.assert_allclose(matrix, expected, rtol=1e-14, atol=1e-15)
+        # All of the blocks have been released
+        assert sta_corr._blocks == {}
+        assert sta_corr._dist is None
+    #
+    # Releasing an IMT without assembling it frees its blocks too
+    #
+    sta_corr = StationCorrelation(ccf, lons, lats, sta_ix, sta_per_ix)
+    sta_corr.getCorrelation("A")
+    assert (0, 1) not in sta_corr._blocks
+    assert (1, 1) in sta_corr._blocks
+    sta_corr.release("B")
+    assert (1, 1) not in sta_corr._blocks
+
+
+def test_sparse_covariance():
+    rng = np.random.default_rng(7)
+    periods = np.array([0.01, 0.3, 1.0, 3.0])
+    nsta = 150
+    cutoff = 30.0
+    lons = np.radians(rng.uniform(-122.0, -120.5, nsta))
+    lats = np.radians(rng.uniform(37.0, 38.5, nsta))
+    per_ix = rng.integers(0, 2, nsta)
+    phi = rng.uniform(0.5, 0.7, nsta)
+    sig_extra = rng.uniform(0.0, 0.3, nsta)
+    for ccf in (DummyCorrelation(periods), LothBaker2013(periods)):
+        sparse_cov = SparseStationCovariance(
+            ccf, cutoff, lons, lats, per_ix, phi, sig_extra
+        )
+        #
+        # The sparse matrix is the tapered dense matrix
+        #
+        dist = np.empty((nsta, nsta))
+        geodetic_distance_fast(lons, lats, lons, lats, dist)
+        taper = taper_correlation(dist, cutoff)
+        t1 = np.tile(per_ix.reshape((1, -1)), (nsta, 1)).astype(np.int_)
+        t2 = np.tile(per_ix.reshape((-1, 1)), (1, nsta)).astype(np.int_)
+        matrix22 = dist.copy()
+        ccf.getCorrelation(t1, t2, matrix22)
+        matrix22 *= taper * phi.reshape((1, -1)) * phi.reshape((-1, 1))
+        matrix22[np.diag_indices(nsta)] += sig_extra**2
+        dense = sparse_cov.matrix.toarray()
+        np.testing.assert_allclose(dense, matrix22, rtol=1e-12, atol=1e-14)
+        assert sparse_cov.nnz < 0.5 * nsta**2
+        assert np.all(dense[dist >= cutoff] == 0)
+        b = rng.normal(size=(nsta, 3))
+        np.testing.assert_allclose(
+            sparse_cov.solve(b), np.linalg.solve(matrix22, b), rtol=1e-8
+        )
+    #
+    # The MVN with the sparse covariance matches the dense MVN with the
+    # tapered covariance
+    #
+    ccf = DummyCorrelation(periods)
+    sparse_cov = SparseStationCovariance(
+        ccf, cutoff, lons, lats, per_ix, phi, sig_extra
+    )
+    cov_WD_WD_inv = np.linalg.inv(sparse_cov.matrix.toarray())
+    T_D = np.zeros((nsta, 3))
+    for i in range(2):
+        T_D[per_ix == i, i] = 0.35
+    resids = rng.normal(0.0, 0.5, nsta).reshape((-1, 1))
+    cov_HH_yD = np.linalg.inv(T_D.T @ cov_WD_WD_inv @ T_D + np.eye(3))
+    mu_H_yD = cov_HH_yD @ T_D.T @ cov_WD_WD_inv @ resids
+    args = (ccf, 2, 2, lons, lats, per_ix, phi, resids, T_D)
+    sta_dense = MVNStationData(*args, cov_WD_WD_inv, mu_H_yD, cov_HH_yD)
+    sta_sparse = MVNStationData(*args, sparse_cov, mu_H_yD, cov_HH_yD)
+    assert sta_sparse.cov_WD_WD_inv is None
+    # A grid that extends beyond the stations' cutoff distance
+    glons, glats = np.meshgrid(
+        np.radians(np.linspace(-123.0, -120.0, 31)),
+        np.radians(np.linspace(39.0, 36.5, 21)),
+    )
+    pout_mean = rng.normal(0.0, 1.0, glons.shape)
+    psd = rng.uniform(0.5, 0.7, glons.shape)
+    tsd = rng.uniform(0.3, 0.4, glons.shape)
+    dtimers = dict.fromkeys(MVN_TIMERS, 0.0)
+    stimers = dict.fromkeys(MVN_TIMERS, 0.0)
+
+    #
+    # To compare with the dense computation, we need to taper the
+    # dense correlation function
+    #
+    class TaperedCorrelation(DummyCorrelation):
+        def getCorrelation(self, ix1, ix2, h):
+            taper = taper_correlation(h, cutoff)
+            super().getCorrelation(ix1, ix2, h)
+            h *= taper
+            return h
+
+    sta_dense.ccf = TaperedCorrelation(periods)
+    dense = mvn_tile(
+        sta_dense, glons, glats, pout_mean, psd, tsd, MVNWorkspace(sta_dense), dtimers
+    )
+    sparse = mvn_tile(
+        sta_sparse, glons, glats, pout_mean, psd, tsd, MVNWorkspace(sta_sparse), stimers
+    )
+    for darr, sarr in zip(dense, sparse):
+        np.testing.assert_allclose(sarr, darr, rtol=1e-8, atol=1e-10)
+    assert stimers["rcmatrix"] > 0
+    # Points far from all of the stations get the prior phi
+    far = np.where(sparse[1] == psd.ravel() ** 2)[0]
+    assert np.size(far) > 0
+
+
+def test_mvn_nearest_k():
+    stadata, lons, lats, pout_mean, psd, tsd = _make_problem(nsta=60)
+    ny, nx = lons.shape
+    sig_extra = np.full(stadata.nsta, np.sqrt(0.1))
+    args = [
+        stadata.ccf,
+        stadata.outperiod_ix,
+        stadata.y_ix,
+        stadata.sta_lons_rad,
+        stadata.sta_lats_rad,
+        stadata.sta_per_ix,
+        stadata.sdsta_phi.reshape((-1, 1)),
+        stadata.sta_resids,
+        stadata.T_D,
+        stadata.cov_WD_WD_inv,
+        stadata.mu_H_yD,
+        stadata.cov_HH_yD,
+    ]
+    # nearest_k as large as the number of stations is the full solution
+    full = MVNStationData(*args, nearest_k=60, sta_sig_extra=sig_extra)
+    assert full.nearest_k == 0
+    #
+    # With nearest_k one less than the number of stations, each tile's
+    # set includes all of the stations, so the local solution is the
+    # full solution
+    #
+    expected = _dense_solution(stadata, lons, lats, pout_mean, psd, tsd)
+    local = MVNStationData(*args, nearest_k=59, sta_sig_extra=sig_extra)
+    assert local.nearest_k == 59
+    tile_shape = get_local_tile_shape(nx, ny, 59, local.ncols, 0)
+    assert tile_shape == (min(ny, 32), min(nx, 32))
+    job = _make_job(local, lons, lats, pout_mean, psd, tsd)
+    job.tile_shape = tile_shape
+    mvn_block(job, iter_tiles(nx, ny, *tile_shape))
+    _check_job(job, expected)
+    #
+    # With a few neighbors, the results are close to the full solution
+    #
+    local = MVNStationData(*args, nearest_k=20, sta_sig_extra=sig_extra)
+    job = _make_job(local, lons, lats, pout_mean, psd, tsd)
+    job.tile_shape = (4, 4)
+    timers = mvn_block(job, iter_tiles(nx, ny, *job.tile_shape))
+    assert timers["rcmatrix"] > 0
+    np.testing.assert_allclose(job.outputs["mean"].ravel(), expected[0], atol=0.1)
+    np.testing.assert_allclose(
+        job.outputs["std"].ravel(), np.sqrt(expected[1] + expected[2]), atol=0.05
+    )
+    # The memory budget limits the tile size
+    assert get_local_tile_shape(1000, 1000, 1000, 3, 1) == (2, 2)
+
+
+if __name__ == "__main__":
+    test_tile_shape()
+    test_mvn_tile()
+    test_mvn_fused()
+    test_make_output_array()
+    test_get_blocks()
+    test_mvn_block()
+    test_mvn_parallel()
+    test_mvn_single_precision()
+    test_invert_covariance()
+    test_station_correlation()
+    test_sparse_covariance()
+    test_mvn_nearest_k()
@@ -0,0 +1,79 @@
+#! /usr/bin/env python
+
+import argparse
+import time
+
+import numpy as np
+
+from shakelib.sites import Sites
+
+#
+# This program times the computation of the depth parameters (z1pt0 and
+# z2pt5) of the sites from Vs30, with and without the lookup tables used
+# for Vs30 grids of whole numbers (see Sites.DEPTH_LOOKUP_MIN_SITES). The
+# Vs30 values come from one or more Vs30 grid files (GMT or GDAL format)
+# or, if none are given, from a synthetic grid of whole-number values;
+# e.g.:
+#
+#   depth_bench.py --files global_vs30.grd CA_vs30.grd
+#
+# The output is a table of the time taken to compute each depth parameter
+# by evaluating its relation for every site and with the lookup table
+# (if the grid qualifies for one), and the largest relative difference
+# between the results.
+#
+
+
+def run(name, vs30, repeat):
+    print(
+        f"{name}: {vs30.size} sites, {vs30.dtype}, "
+        f"{np.unique(vs30).size} distinct values, "
+        f"lookup table: {Sites._getVs30LookupIndex(vs30) is not None}"
+    )
+    print(f"{'parameter':<20}{'direct (s)':>12}{'lookup (s)':>12}{'max diff':>12}")
+    for param in Sites.DEPTH_PARAMETERS:
+        direct = min(
+            _time(Sites._evaluateDepthRelation, param, vs30) for _ in range(repeat)
+        )
+        lookup = min(
+            _time(Sites._computeDepthParameter, param, vs30) for _ in range(repeat)
+        )
+        ref = Sites._evaluateDepthRelation(param, vs30)
+        diff = np.nanmax(np.abs(Sites._computeDepthParameter(param, vs30) / ref - 1))
+        print(f"{param:<20}{direct:12.4f}{lookup:12.4f}{diff:12.3g}", flush=True)
+
+
+def _time(func, param, vs30):
+    time1 = time.time()
+    func(param, vs30)
+    return time.time() - time1
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the computation of the depth parameters from Vs30."
+    )
+    parser.add_argument(
+        "--files", nargs="*", default=[], help="The Vs30 grid files to test."
+    )
+    parser.add_argument(
+        "--nsites",
+        type=int,
+        default=1000000,
+        help="The number of sites of the synthetic grid.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="The number of times to repeat each."
+    )
+    args = parser.parse_args()
+    if args.files:
+        for vs30file in args.files:
+            run(vs30file, Sites._load(vs30file).getData(), args.repeat)
+    else:
+        rng = np.random.default_rng(1)
+        vs30 = np.rint(rng.uniform(150.0, 1500.0, args.nsites))
+        run("synthetic", vs30, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
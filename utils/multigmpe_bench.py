@@ -0,0 +1,235 @@
+#! /usr/bin/env python
+
+import argparse
+import os
+import time
+
+import numpy as np
+from configobj import ConfigObj
+from openquake.hazardlib import const, imt
+from openquake.hazardlib.contexts import RuptureContext
+from openquake.hazardlib.gsim.base import DistancesContext, SitesContext
+
+from shakelib.conversions.imt.abrahamson_bhasin_2020 import AbrahamsonBhasin2020
+from shakelib.multigmpe import MultiGMPE
+from shakelib.multiutils import combine_stddevs
+from shakemap.utils.config import get_configspec, get_custom_validator, get_data_path
+
+#
+# This program benchmarks parts of the MultiGMPE. Run it with -h to see
+# the options.
+#
+# The "stddev" benchmark compares the combination of the stddevs of the
+# GMPEs of a MultiGMPE (shakelib.multiutils.combine_stddevs) with the
+# original implementation, which built the full nwts x nwts x nsites
+# weighted covariance tensor, for a range of numbers of GMPEs (nwts) and
+# sites (nsites); e.g.:
+#
+#   multigmpe_bench.py stddev --nwts 2 4 8 --nsites 10000 1000000
+#
+# The output is a table of the time taken by each implementation and
+# the largest difference between their results.
+#
+# The "pgv" benchmark times the generation of a PGV map (on a grid of
+# sites around a point source) with the GMPE sets of the default
+# gmpe_sets.conf; the GMPEs that do not provide PGV compute it from SA
+# at a reference period (Abrahamson and Bhasin, 2020). For comparison,
+# the time for the map of SA at the reference period is also shown; e.g.:
+#
+#   multigmpe_bench.py pgv --sets active_crustal_japan --nx 500 --ny 500
+#
+
+
+def combine_stddevs_3d(lnmu_list, lnsd_list, wts):
+    """
+    The original combination of the stddevs.
+    """
+    nwts = len(wts)
+    nsd = len(lnsd_list) // nwts
+    npwts = np.array(wts).reshape((1, -1))
+    cc = np.reshape(np.corrcoef(lnmu_list), (nwts, nwts))
+    cc[np.isnan(cc)] = 1.0
+    cc = ((npwts * npwts.T) * cc).reshape((nwts, nwts, 1))
+    lnsd_new = []
+    for i in range(nsd):
+        sdstack = np.hstack(
+            [lnsd_list[j * nsd + i].reshape((1, 1, -1)) for j in range(nwts)]
+        )
+        wcov = (sdstack * np.transpose(sdstack, axes=(1, 0, 2))) * cc
+        lnsd_new.append(np.sqrt(wcov.sum((0, 1))))
+    return lnsd_new
+
+
+def run_stddev(nwts_list, nsites_list, nsd, seed):
+    rng = np.random.default_rng(seed)
+    print(
+        f"{'nwts':>6}{'nsites':>10}{'3-D (s)':>10}{'blocked (s)':>13}{'max diff':>12}"
+    )
+    for nsites in nsites_list:
+        base = rng.normal(size=nsites)
+        for nwts in nwts_list:
+            lnmu_list = [base + 0.3 * rng.normal(size=nsites) for _ in range(nwts)]
+            lnsd_list = [rng.uniform(0.3, 0.8, nsites) for _ in range(nwts * nsd)]
+            wts = rng.uniform(size=nwts)
+            wts /= np.sum(wts)
+            time1 = time.time()
+            ref = combine_stddevs_3d(lnmu_list, lnsd_list, wts)
+            time2 = time.time()
+            lnsd = combine_stddevs(lnmu_list, lnsd_list, wts)
+            time3 = time.time()
+            diff = max(np.max(np.abs(sd1 - sd2)) for sd1, sd2 in zip(lnsd, ref))
+            print(
+                f"{nwts:6d}{nsites:10d}{time2 - time1:10.3f}{time3 - time2:13.3f}"
+                f"{diff:12.3g}",
+                flush=True,
+            )
+
+
+def get_config(gmpe_set):
+    """
+    Make a config from the default model.conf, modules.conf, and
+    gmpe_sets.conf with the given GMPE set.
+    """
+    data_path = get_data_path()
+    spec_file = get_configspec()
+    config = ConfigObj(os.path.join(data_path, "model.conf"), configspec=spec_file)
+    for name in ["modules.conf", "gmpe_sets.conf"]:
+        config.merge(ConfigObj(os.path.join(data_path, name), configspec=spec_file))
+    config.validate(get_custom_validator())
+    config["modeling"]["gmpe"] = gmpe_set
+    return config
+
+
+def make_contexts(nx, ny, mag, seed):
+    """
+    Make the contexts for a grid of sites around a point source.
+    """
+    rng = np.random.default_rng(seed)
+    rctx = RuptureContext()
+    rctx.mag = mag
+    rctx.rake = 0.0
+    rctx.dip = 90.0
+    rctx.ztor = 0.0
+    rctx.width = 15.0
+    rctx.hypo_depth = 10.0
+    rctx.hypo_lat = 0.0
+    rctx.hypo_lon = 0.0
+    x, y = np.meshgrid(np.linspace(-300.0, 300.0, nx), np.linspace(-300.0, 300.0, ny))
+    dctx = DistancesContext()
+    dctx.rjb = np.hypot(x, y)
+    dctx.rrup = np.hypot(dctx.rjb, rctx.hypo_depth)
+    dctx.rhypo = dctx.rrup
+    dctx.repi = dctx.rjb
+    dctx.rx = x
+    dctx.ry0 = np.zeros_like(x)
+    sctx = SitesContext()
+    sctx.lons = np.linspace(-3.0, 3.0, nx)
+    sctx.lats = np.linspace(3.0, -3.0, ny)
+    sctx.vs30 = rng.uniform(180.0, 1000.0, x.shape)
+    sctx.vs30measured = np.full(x.shape, False)
+    sctx.backarc = np.full(x.shape, False)
+    return sctx, rctx, dctx
+
+
+def run_pgv(gmpe_sets, nx, ny, mag, seed):
+    sctx, rctx, dctx = make_contexts(nx, ny, mag, seed)
+    stddev_types = [const.StdDev.TOTAL]
+    print(f"{nx} x {ny} grid, M{mag}")
+    print(f"{'gmpe set':<40}{'from SA':>8}{'PGV (s)':>10}{'SA(Tref) (s)':>14}")
+    for gmpe_set in gmpe_sets:
+        config = get_config(gmpe_set)
+        try:
+            pgv_gmpe = MultiGMPE.__from_config__(config, filter_imt=imt.PGV())
+            # The reference period of the conversion
+            tref = imt.SA(AbrahamsonBhasin2020(mag).getTref())
+            sa_gmpe = MultiGMPE.__from_config__(config, filter_imt=tref)
+            time1 = time.time()
+            pgv_gmpe.get_mean_and_stddevs(sctx, rctx, dctx, imt.PGV(), stddev_types)
+            time2 = time.time()
+            sa_gmpe.get_mean_and_stddevs(sctx, rctx, dctx, tref, stddev_types)
+            time3 = time.time()
+        except Exception as exc:
+            print(f"{gmpe_set:<40}failed: {exc}", flush=True)
+            continue
+        nconv = count_converted(pgv_gmpe)
+        print(
+            f"{gmpe_set:<40}{nconv:8d}{time2 - time1:10.3f}{time3 - time2:14.3f}",
+            flush=True,
+        )
+
+
+def count_converted(mgmpe):
+    """
+    Count the GMPEs of a MultiGMPE that compute PGV from SA.
+    """
+    count = 0
+    for gmpe in mgmpe.GMPES:
+        if isinstance(gmpe, MultiGMPE):
+            count += count_converted(gmpe)
+        elif "PGV" not in [
+            gmpe_imt.__name__ for gmpe_imt in gmpe.DEFINED_FOR_INTENSITY_MEASURE_TYPES
+        ]:
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parts of the MultiGMPE.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    sd_parser = subparsers.add_parser(
+        "stddev", help="Benchmark the combination of the MultiGMPE stddevs."
+    )
+    sd_parser.add_argument(
+        "--nwts",
+        type=int,
+        nargs="*",
+        default=[2, 4, 8],
+        help="The numbers of weighted GMPEs to test.",
+    )
+    sd_parser.add_argument(
+        "--nsites",
+        type=int,
+        nargs="*",
+        default=[10000, 100000, 1000000],
+        help="The numbers of sites to test.",
+    )
+    sd_parser.add_argument(
+        "--nsd",
+        type=int,
+        default=6,
+        help="The number of stddev arrays per GMPE (twice the number of "
+        "stddev types).",
+    )
+    sd_parser.add_argument("--seed", type=int, default=1, help="The random seed.")
+
+    pgv_parser = subparsers.add_parser(
+        "pgv", help="Time the generation of PGV maps for GMPE sets."
+    )
+    pgv_parser.add_argument(
+        "--sets",
+        nargs="*",
+        default=[
+            "active_crustal_nshmp2014",
+            "active_crustal_japan",
+            "active_crustal_new_zealand",
+            "active_crustal_share",
+        ],
+        help="The GMPE sets (from gmpe_sets.conf) to test.",
+    )
+    pgv_parser.add_argument("--nx", type=int, default=400, help="The grid width.")
+    pgv_parser.add_argument("--ny", type=int, default=400, help="The grid height.")
+    pgv_parser.add_argument(
+        "--mag", type=float, default=7.0, help="The earthquake magnitude."
+    )
+    pgv_parser.add_argument("--seed", type=int, default=1, help="The random seed.")
+
+    args = parser.parse_args()
+    if args.benchmark == "stddev":
+        run_stddev(args.nwts, args.nsites, args.nsd, args.seed)
+    else:
+        run_pgv(args.sets, args.nx, args.ny, args.mag, args.seed)
+
+
+if __name__ == "__main__":
+    main()
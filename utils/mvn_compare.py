@@ -0,0 +1,180 @@
+#! /usr/bin/env python
+
+import argparse
+import time
+
+import numpy as np
+
+from shakelib.correlation.loth_baker_2013 import LothBaker2013
+from shakemap.utils.mvn import (
+    MVNJob,
+    MVNStationData,
+    SparseStationCovariance,
+    get_local_tile_shape,
+    get_tile_shape,
+    invert_covariance,
+    iter_tiles,
+    make_output_array,
+    mvn_block,
+)
+from shakemap.c.clib import geodetic_distance_fast, make_sigma_matrix
+
+#
+# This program compares the accuracy and speed of the approximate MVN
+# modes (nearest-K conditioning and the sparse covariance with a cutoff
+# distance) with the full solution on a synthetic data set: a grid
+# with a number of randomly (and somewhat clustered) placed observations
+# of a single IMT. Run it with -h to see the options; e.g.:
+#
+#   mvn_compare.py --nsta 5000 --nearest-k 100 300 --cutoff 100 200
+#
+# The output is a table of the time taken by each mode, and the largest
+# and mean absolute differences (in ln units for ground motions) between
+# its conditional mean and stddev and those of the full solution.
+#
+
+
+def make_data(nsta, nx, ny, seed):
+    """
+    Make a set of synthetic observations and an output grid.
+    """
+    rng = np.random.default_rng(seed)
+    # Half of the stations are clustered around a few "cities"
+    ncity = nsta // 2
+    centers = rng.uniform(0.2, 0.8, (5, 2))
+    city = centers[rng.integers(0, 5, ncity)] + rng.normal(0, 0.05, (ncity, 2))
+    rural = rng.uniform(0, 1, (nsta - ncity, 2))
+    xy = np.clip(np.vstack((city, rural)), 0, 1)
+    lons = np.radians(-122.0 + 3.0 * xy[:, 0])
+    lats = np.radians(36.0 + 3.0 * xy[:, 1])
+    glons, glats = np.meshgrid(
+        np.radians(np.linspace(-122.0, -119.0, nx)),
+        np.radians(np.linspace(39.0, 36.0, ny)),
+    )
+    resids = rng.normal(0, 0.6, (nsta, 1))
+    return lons, lats, resids, glons, glats
+
+
+def run(nsta, nx, ny, nearest_ks, cutoffs, seed):
+    ccf = LothBaker2013(np.array([0.01, 1.0]))
+    lons, lats, resids, glons, glats = make_data(nsta, nx, ny, seed)
+    per_ix = np.zeros(nsta, dtype=np.int_)
+    phi = np.full((nsta, 1), 0.6)
+    sig_extra = np.full(nsta, 0.3)
+    tau = 0.35
+    T_D = np.full((nsta, 1), tau)
+    pout_mean = np.zeros(glons.shape)
+    psd = np.full(glons.shape, 0.6)
+    tsd = np.full(glons.shape, tau)
+
+    def solve(cov_WD_WD_inv, nearest_k=0):
+        time1 = time.time()
+        if isinstance(cov_WD_WD_inv, SparseStationCovariance):
+            cov_inv_T_D = cov_WD_WD_inv.solve(T_D)
+            cov_inv_resids = cov_WD_WD_inv.solve(resids)
+        else:
+            cov_inv_T_D = cov_WD_WD_inv @ T_D
+            cov_inv_resids = cov_WD_WD_inv @ resids
+        cov_HH_yD, _ = invert_covariance(T_D.T @ cov_inv_T_D + np.eye(1))
+        mu_H_yD = cov_HH_yD @ T_D.T @ cov_inv_resids
+        stadata = MVNStationData(
+            ccf,
+            0,
+            0,
+            lons,
+            lats,
+            per_ix,
+            phi,
+            resids,
+            T_D,
+            cov_WD_WD_inv,
+            mu_H_yD,
+            cov_HH_yD,
+            nearest_k=nearest_k,
+            sta_sig_extra=sig_extra,
+        )
+        outputs = {
+            name: make_output_array(glons.shape) for name in ("mean", "std", "tau")
+        }
+        job = MVNJob("SA(0.01)", stadata, glons, glats, pout_mean, psd, tsd, outputs)
+        if stadata.nearest_k > 0:
+            job.tile_shape = get_local_tile_shape(nx, ny, nearest_k, 1, 0)
+        else:
+            job.tile_shape = get_tile_shape(nx, ny, nsta, 1, 0)
+        mvn_block(job, iter_tiles(nx, ny, *job.tile_shape))
+        return outputs, time.time() - time1
+
+    #
+    # The full solution
+    #
+    time1 = time.time()
+    matrix22 = np.empty((nsta, nsta))
+    geodetic_distance_fast(lons, lats, lons, lats, matrix22)
+    ix = np.zeros((nsta, nsta), dtype=np.int_)
+    ccf.getCorrelation(ix, ix.copy(), matrix22)
+    make_sigma_matrix(matrix22, phi.ravel(), phi.ravel())
+    matrix22[np.diag_indices(nsta)] += sig_extra**2
+    cov_WD_WD_inv, _ = invert_covariance(matrix22)
+    del matrix22
+    inv_time = time.time() - time1
+    full, full_time = solve(cov_WD_WD_inv)
+    full_time += inv_time
+
+    print(f"{nsta} observations, {nx} x {ny} grid")
+    print(
+        f"{'mode':<20}{'time (s)':>10}{'max dmean':>12}{'mean dmean':>12}"
+        f"{'max dstd':>12}{'mean dstd':>12}"
+    )
+    print(f"{'full':<20}{full_time:10.2f}", flush=True)
+
+    def report(name, outputs, dt):
+        dmean = np.abs(outputs["mean"] - full["mean"])
+        dstd = np.abs(outputs["std"] - full["std"])
+        print(
+            f"{name:<20}{dt:10.2f}{np.max(dmean):12.4g}{np.mean(dmean):12.4g}"
+            f"{np.max(dstd):12.4g}{np.mean(dstd):12.4g}",
+            flush=True,
+        )
+
+    for nearest_k in nearest_ks:
+        outputs, dt = solve(cov_WD_WD_inv, nearest_k)
+        report(f"nearest_k={nearest_k}", outputs, dt)
+    for cutoff in cutoffs:
+        time1 = time.time()
+        sparse_cov = SparseStationCovariance(
+            ccf, cutoff, lons, lats, per_ix, phi, sig_extra
+        )
+        outputs, _ = solve(sparse_cov)
+        report(f"cutoff={cutoff:g}", outputs, time.time() - time1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the approximate MVN modes with the full solution."
+    )
+    parser.add_argument(
+        "--nsta", type=int, default=3000, help="The number of observations."
+    )
+    parser.add_argument("--nx", type=int, default=200, help="The grid width.")
+    parser.add_argument("--ny", type=int, default=200, help="The grid height.")
+    parser.add_argument(
+        "--nearest-k",
+        type=int,
+        nargs="*",
+        default=[50, 100, 300],
+        help="Values of nearest_k to test.",
+    )
+    parser.add_argument(
+        "--cutoff",
+        type=float,
+        nargs="*",
+        default=[50.0, 100.0, 200.0],
+        help="Values of cutoff_distance (km) to test.",
+    )
+    parser.add_argument("--seed", type=int, default=1, help="The random seed.")
+    args = parser.parse_args()
+    run(args.nsta, args.nx, args.ny, args.nearest_k, args.cutoff, args.seed)
+
+
+if __name__ == "__main__":
+    main()
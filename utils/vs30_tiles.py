@@ -0,0 +1,41 @@
+#! /usr/bin/env python
+
+import argparse
+
+from shakelib.sites import TiledVs30
+
+#
+# This program converts a GMT or GDAL format Vs30 file to the tiled,
+# memory-mapped format read by shakelib.sites.TiledVs30. The output is
+# a .npy file of tiles and a .json file (with the same base name) that
+# holds the grid's geographic information; e.g.:
+#
+#   vs30_tiles.py global_vs30.grd global_vs30.npy --tile-size 512
+#
+# The .npy file may then be used as the vs30file in model.conf. Only the
+# tiles that a run touches are read from it, which greatly reduces the
+# startup time and memory use of model for continental or global Vs30
+# grids.
+#
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a Vs30 file to the tiled, memory-mapped format."
+    )
+    parser.add_argument("vs30file", help="The GMT or GDAL format Vs30 file.")
+    parser.add_argument("outfile", help="The tiled (.npy) file to write.")
+    parser.add_argument(
+        "--tile-size",
+        type=int,
+        default=256,
+        help="The width and height of the tiles (in grid cells).",
+    )
+    args = parser.parse_args()
+    if not args.outfile.endswith(".npy"):
+        parser.error("The output file name must end with '.npy'.")
+    TiledVs30.write(args.vs30file, args.outfile, tile_size=args.tile_size)
+
+
+if __name__ == "__main__":
+    main()